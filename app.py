@@ -8,12 +8,31 @@ from datetime import datetime
 from PIL import Image, ImageDraw
 from pathlib import Path
 
+import config
+
 # Import utility modules
-from utils.photometry import parse_ldt, calculate_beam_spread, estimate_beam_angle_from_ldt
-from utils.blueprint_processor import BlueprintProcessor, convert_pdf_to_image
+from utils.photometry import default_beam_angle
+from utils.photometry_cache import load_photometry
+from utils.photometry_library import build_library_index, library_index_exists, PhotometryLibrary
+from utils.blueprint_processor import BlueprintProcessor
+from utils.pdf_pages import PdfPages
+from utils.dxf_drawing import DxfDrawing
+from utils.room_detection import detect_rooms
 from utils.lamp_calculator import LampPlacementCalculator
+from utils.project_placement import PATTERNS, place_project
+from utils.area_cache import AreaResultCache, area_key, ensure_area_id, photometry_id
+from utils.geometry import area_polygon, area_shape, points_in_polygon, polygon_area
 from utils.report_generator import ReportGenerator
 
+# Schemi di posizionamento delle lampade
+PATTERN_LABELS = {
+    'auto': "Automatico (meno apparecchi)",
+    'grid': "Griglia",
+    'staggered': "File sfalsate",
+    'hex': "Esagonale",
+    'line': "Fila singola (corridoi)",
+}
+
 # Try to import drawable canvas
 try:
     from streamlit_drawable_canvas import st_canvas
@@ -33,14 +52,18 @@ TRANSLATIONS = {
         "step2": "STEP 2: Seleziona Fotometrie",
         "step3": "STEP 3: Disegna Aree",
         "step4": "STEP 4: Calcoli e Export",
-        "upload_blueprint": "Carica planimetria (JPG, PNG, PDF, DWG)",
+        "upload_blueprint": "Carica planimetria (JPG, PNG, PDF, DXF, DWG)",
         "file_uploaded": "Planimetria caricata ✓",
-        "upload_photometry": "Carica fotometria LDT",
+        "upload_photometry": "Carica fotometria LDT/IES",
         "photometry_uploaded": "Fotometria caricata ✓",
         "project_name": "Nome Progetto",
         "drawing_mode": "Modalità Disegno",
         "mode_rectangle": "Rettangolo",
         "mode_polygon": "Poligono",
+        "shape_kind": "Forma disegnata",
+        "kind_area": "Area",
+        "kind_hole": "Foro (pilastro, cavedio)",
+        "kind_keepout": "Zona esclusa",
         "clear_drawing": "Cancella Ultimo",
         "add_area": "Aggiungi Area",
         "area_added": "Area aggiunta ✓",
@@ -71,14 +94,18 @@ TRANSLATIONS = {
         "step2": "STEP 2: Select Photometries",
         "step3": "STEP 3: Draw Areas",
         "step4": "STEP 4: Calculate & Export",
-        "upload_blueprint": "Upload floorplan (JPG, PNG, PDF, DWG)",
+        "upload_blueprint": "Upload floorplan (JPG, PNG, PDF, DXF, DWG)",
         "file_uploaded": "Floorplan uploaded ✓",
-        "upload_photometry": "Upload LDT photometry",
+        "upload_photometry": "Upload LDT/IES photometry",
         "photometry_uploaded": "Photometry uploaded ✓",
         "project_name": "Project Name",
         "drawing_mode": "Drawing Mode",
         "mode_rectangle": "Rectangle",
         "mode_polygon": "Polygon",
+        "shape_kind": "Drawn shape",
+        "kind_area": "Area",
+        "kind_hole": "Hole (column, shaft)",
+        "kind_keepout": "Keep-out zone",
         "clear_drawing": "Clear Last",
         "add_area": "Add Area",
         "area_added": "Area added ✓",
@@ -138,24 +165,91 @@ if 'current_drawing_mode' not in st.session_state:
 # STEP 1: CARICA PLANIMETRIA
 # ============================================================================
 st.header(f"📐 {T['step1']}")
-blueprint_file = st.file_uploader(T['upload_blueprint'], type=['jpg', 'jpeg', 'png', 'pdf', 'dwg'])
+blueprint_file = st.file_uploader(T['upload_blueprint'], type=['jpg', 'jpeg', 'png', 'pdf', 'dxf', 'dwg'])
+# Scala di grigi / palette: un byte per pixel, originale su file e non nella sessione
+STORAGE_LABELS = {'rgb': "Colori (RGB in memoria)", 'gray': "Scala di grigi (su file)", 'palette': "Palette di colori (su file)"}
+blueprint_storage = st.selectbox("Memoria planimetria", list(STORAGE_LABELS), format_func=STORAGE_LABELS.get,
+                                 index=list(STORAGE_LABELS).index(config.BLUEPRINT_STORAGE), key='blueprint_storage')
 
-if blueprint_file:
-    file_ext = blueprint_file.name.split('.')[-1].lower()
+# La planimetria (e la sua piramide) si costruisce solo quando cambia il file caricato
+blueprint_source = (blueprint_file.name, blueprint_file.size) if blueprint_file else None
+file_ext = blueprint_file.name.split('.')[-1].lower() if blueprint_file else None
+
+if file_ext == 'pdf':
+    # Elenco pagine dalla sola struttura del PDF; si rasterizza solo la pagina scelta
+    if st.session_state.get('pdf_source') != blueprint_source:
+        try:
+            st.session_state.pdf_pages = PdfPages(blueprint_file)
+        except Exception as e:
+            st.session_state.pdf_pages = None
+            st.error(f"Errore lettura PDF: {str(e)}")
+        st.session_state.pdf_source = blueprint_source
+    pdf_pages = st.session_state.pdf_pages
+    if pdf_pages is not None and pdf_pages.page_count:
+        col1, col2 = st.columns(2)
+        with col1:
+            pdf_page = st.selectbox("Pagina", range(1, pdf_pages.page_count + 1),
+                                    format_func=pdf_pages.page_label, key='pdf_page')
+        with col2:
+            pdf_dpi = st.select_slider("Risoluzione (DPI)", options=config.PDF_DPI_OPTIONS,
+                                       value=config.PDF_DPI, key='pdf_dpi')
+        pixel_size = pdf_pages.pixel_size(pdf_page, pdf_dpi)
+        if pixel_size:
+            st.caption(f"{pixel_size[0]} × {pixel_size[1]} px")
+        if pdf_pages.page_count > 1 and st.button(f"Rasterizza tutte le {pdf_pages.page_count} pagine a {pdf_dpi} DPI"):
+            with st.spinner("Rasterizzazione in corso..."):
+                try:
+                    pdf_pages.render_pages(range(1, pdf_pages.page_count + 1), pdf_dpi)
+                except Exception as e:
+                    st.error(f"Errore conversione PDF: {str(e)}")
+        blueprint_source = blueprint_source + (pdf_page, pdf_dpi)
+
+if blueprint_file and st.session_state.get('blueprint_source') != blueprint_source + (blueprint_storage,):
+    st.session_state.blueprint_source = blueprint_source + (blueprint_storage,)
+    
+    st.session_state.dxf_view = None
     
     if file_ext == 'pdf':
-        image = convert_pdf_to_image(blueprint_file)
-        if image:
-            st.session_state.blueprint = BlueprintProcessor(image=image)
-            st.success(T['file_uploaded'])
+        if st.session_state.pdf_pages is not None and len(blueprint_source) > 2:
+            try:
+                with st.spinner("Rasterizzazione in corso..."):
+                    image = st.session_state.pdf_pages.render(*blueprint_source[2:])
+            except Exception as e:
+                image = None
+                st.error(f"Errore conversione PDF: {str(e)}")
+            if image:
+                st.session_state.blueprint = BlueprintProcessor(image=image, storage=blueprint_storage)
+                st.success(T['file_uploaded'])
     elif file_ext in ['jpg', 'jpeg', 'png']:
         image = Image.open(blueprint_file)
-        st.session_state.blueprint = BlueprintProcessor(image=image)
+        st.session_state.blueprint = BlueprintProcessor(image=image, storage=blueprint_storage)
         st.success(T['file_uploaded'])
+    elif file_ext == 'dxf':
+        try:
+            with st.spinner("Lettura DXF in corso..."):
+                drawing = DxfDrawing(blueprint_file)
+                image, pixels_per_unit, viewport = drawing.render()
+        except Exception as e:
+            drawing = None
+            st.error(f"Errore lettura DXF: {str(e)}")
+        if drawing is not None:
+            # Il disegno vettoriale resta in memoria per lo zoom nitido
+            st.session_state.dxf_view = (drawing, pixels_per_unit, viewport)
+            st.session_state.blueprint = BlueprintProcessor(image=image, storage=blueprint_storage)
+            st.session_state.blueprint.resize_for_display(max_width=800, max_height=600)
+            raster_ppm = drawing.pixels_per_meter(pixels_per_unit)
+            if raster_ppm:
+                # Scala dalle unità del disegno ($INSUNITS), riferita ai pixel del display
+                st.session_state.pixels_per_meter = raster_ppm * st.session_state.blueprint.scale_factor
+                st.success(f"{T['file_uploaded']} — {len(drawing.segments)} segmenti, "
+                           f"scala {st.session_state.pixels_per_meter:.2f} px/m")
+            else:
+                st.success(f"{T['file_uploaded']} — unità non dichiarate: imposta la scala manualmente")
     elif file_ext == 'dwg':
-        st.info("DWG support: si consiglia di esportare come JPG/PNG")
+        st.info("DWG support: si consiglia di esportare come DXF o JPG/PNG")
 
 if st.session_state.blueprint:
+    # Dal livello della piramide più vicino; nessun lavoro se la dimensione non cambia
     st.session_state.blueprint.resize_for_display(max_width=800, max_height=600)
 
 # ============================================================================
@@ -165,20 +259,53 @@ st.header(f"💡 {T['step2']}")
 col1, col2 = st.columns(2)
 
 with col1:
-    ldt_file = st.file_uploader(T['upload_photometry'], type=['ldt'], key='ldt_upload')
+    ldt_file = st.file_uploader(T['upload_photometry'], type=['ldt', 'ies'], key='ldt_upload')
     if ldt_file:
         try:
-            photometry = parse_ldt(ldt_file)
+            photometry = load_photometry(ldt_file)
             photom_name = photometry.get('name', 'Unknown').strip()[:30]
             st.session_state.photometries[ldt_file.name] = photometry
             st.success(f"{T['photometry_uploaded']}: {photom_name}")
         except Exception as e:
-            st.error(f"Errore parsing LDT: {str(e)}")
+            st.error(f"Errore parsing fotometria: {str(e)}")
 
 with col2:
     if st.session_state.photometries:
         st.info(f"📦 {len(st.session_state.photometries)} fotometria/e caricata/e")
 
+with st.expander("📚 Libreria fotometrie"):
+    library_dir = st.text_input("Cartella libreria (LDT/IES)", "", key='library_dir')
+    if library_dir and st.button("Aggiorna indice libreria"):
+        with st.spinner("Indicizzazione in corso..."):
+            report = build_library_index(library_dir)
+        st.success(f"{report['total']} fotometrie indicizzate ({report['parsed']} nuove/modificate)")
+        for path, error in report['errors'][:10]:
+            st.warning(f"{os.path.basename(path)}: {error}")
+    if library_index_exists():
+        library = PhotometryLibrary()
+        col_q, col_f1, col_f2 = st.columns([2, 1, 1])
+        with col_q:
+            query = st.text_input("Cerca (nome, produttore, file)", "", key='library_query')
+        with col_f1:
+            min_flux = st.number_input("Flusso min (lm)", 0, 200000, 0, 100, key='library_min_flux')
+        with col_f2:
+            max_beam = st.number_input("Fascio max (°)", 1, 180, 180, 1, key='library_max_beam')
+        # A 180° nessun filtro: le fotometrie senza angolo di fascio calcolabile restano visibili
+        found = library.search(text=query or None, min_flux=min_flux or None,
+                               max_beam=max_beam if max_beam < 180 else None)
+        st.caption(f"{len(found)} risultati su {len(library)}")
+        options = {int(i): library.row(i) for i in found[:200]}
+        choice = st.selectbox(
+            "Fotometria",
+            list(options.keys()),
+            format_func=lambda i: f"{options[i]['name']} – {options[i]['flux']:.0f} lm, {options[i]['beam_angle']:.0f}°",
+            key='library_choice',
+        ) if options else None
+        if choice is not None and st.button("Aggiungi al progetto"):
+            record = options[choice]
+            st.session_state.photometries[os.path.basename(record['path'])] = library.load(choice)
+            st.success(f"{T['photometry_uploaded']}: {record['name']}")
+
 # ============================================================================
 # STEP 3: DISEGNA AREE SULLA PLANIMETRIA
 # ============================================================================
@@ -201,6 +328,9 @@ else:
             label_visibility="collapsed"
         )
         st.session_state.current_drawing_mode = 'rectangle' if drawing_mode == T['mode_rectangle'] else 'polygon'
+        # Fori e zone escluse si disegnano dentro un'area esistente e le vengono associati
+        shape_kind = st.radio(T['shape_kind'], [T['kind_area'], T['kind_hole'], T['kind_keepout']])
+        st.session_state.current_shape_kind = {T['kind_hole']: 'holes', T['kind_keepout']: 'keepouts'}.get(shape_kind, 'area')
         
         if st.button("🗑️ " + T['clear_drawing'], use_container_width=True):
             st.session_state.drawing_points = []
@@ -209,7 +339,12 @@ else:
         st.divider()
         st.subheader("📊 Aree Disegnate")
         for idx, area in enumerate(st.session_state.areas):
-            st.write(f"✓ {area['name']} - {len(area['points'])} punti")
+            col_name, col_del = st.columns([4, 1])
+            col_name.write(f"✓ {area['name']} - {len(area['points'])} punti")
+            if col_del.button("🗑️", key=f"delete_area_{ensure_area_id(area)}"):
+                # I risultati memorizzati dell'area vengono rimossi al prossimo calcolo (retain)
+                st.session_state.areas.pop(idx)
+                st.rerun()
         # Scala immagine / Riferimento
         st.markdown("**Scala immagine / Riferimento**")
         if 'pixels_per_meter' not in st.session_state:
@@ -230,7 +365,8 @@ else:
 
         # Canvas drawing support (optional)
         if HAS_CANVAS:
-            pil_img = display_img.convert('RGB') if hasattr(display_img, 'convert') else display_img
+            # draw_areas/get_pil_image restituiscono già RGB: niente copia a ogni rerun
+            pil_img = display_img if getattr(display_img, 'mode', 'RGB') == 'RGB' else display_img.convert('RGB')
             bg_width, bg_height = pil_img.size
             canvas_result = st_canvas(
                 fill_color="rgba(255, 165, 0, 0.3)",
@@ -318,21 +454,21 @@ else:
                                     area_type = 'polygon'
                             except Exception:
                                 pts = None
+                        # Foro / zona esclusa: associato all'area che ne contiene il baricentro
+                        kind = st.session_state.get('current_shape_kind', 'area')
+                        if pts and kind != 'area':
+                            ring = area_polygon({'points': pts})
+                            centroid = [(sum(p[0] for p in ring) / len(ring), sum(p[1] for p in ring) / len(ring))]
+                            for target in st.session_state.areas:
+                                if len(target['points']) >= 2 and points_in_polygon(centroid, area_polygon(target))[0]:
+                                    target.setdefault(kind, []).append(ring)
+                                    break
+                            pts = None
                         # If we have points, store them (they are in display coords)
                         if pts:
                             a_name = f"Area_{len(st.session_state.areas)+1}"
-                            # compute approximate area in pixels (shoelace) and convert to m2 if scale present
-                            def polygon_area_px(points):
-                                x = [p[0] for p in points]
-                                y = [p[1] for p in points]
-                                n = len(points)
-                                area = 0.0
-                                for i in range(n):
-                                    j = (i + 1) % n
-                                    area += x[i] * y[j] - x[j] * y[i]
-                                return abs(area) / 2.0
-
-                            area_px = polygon_area_px(pts) if len(pts) >= 3 else abs((pts[1][0]-pts[0][0])*(pts[1][1]-pts[0][1]))
+                            # area in pixel (shoelace) convertita in m2 se la scala è presente
+                            area_px = polygon_area(area_polygon({'points': pts}))
                             ppm = st.session_state.get('pixels_per_meter', None)
                             surface_m2 = None
                             if ppm and ppm > 0:
@@ -354,6 +490,62 @@ else:
         # Mostra immagine (fallback)
         st.image(display_img, use_column_width=True)
         
+        # Zoom: la regione è letta dal livello della piramide adatto all'ingrandimento
+        with st.expander("🔍 Zoom planimetria"):
+            zoom = st.slider("Ingrandimento", 1, 16, 2, key="zoom_factor")
+            zoom_cx = st.slider("Centro X (%)", 0, 100, 50, key="zoom_cx")
+            zoom_cy = st.slider("Centro Y (%)", 0, 100, 50, key="zoom_cy")
+            full_h, full_w = st.session_state.blueprint.original_image.shape[:2]
+            zoom_x0 = (full_w - full_w / zoom) * zoom_cx / 100
+            zoom_y0 = (full_h - full_h / zoom) * zoom_cy / 100
+            dxf_view = st.session_state.get('dxf_view')
+            if dxf_view:
+                # Planimetria DXF: si ridisegnano dai vettori solo i segmenti della finestra
+                drawing, pixels_per_unit, (vx0, _, _, vy1) = dxf_view
+                region, _, _ = drawing.render(
+                    (vx0 + zoom_x0 / pixels_per_unit, vy1 - (zoom_y0 + full_h / zoom) / pixels_per_unit,
+                     vx0 + (zoom_x0 + full_w / zoom) / pixels_per_unit, vy1 - zoom_y0 / pixels_per_unit),
+                    max_width=800, max_height=600,
+                )
+            else:
+                region, _ = st.session_state.blueprint.get_region(
+                    zoom_x0, zoom_y0, zoom_x0 + full_w / zoom, zoom_y0 + full_h / zoom
+                )
+            st.image(region, use_column_width=True)
+        
+        # Locali rilevati sulla planimetria: aggiunti come aree candidate, da controllare o eliminare
+        with st.expander("🧭 Rilevamento automatico locali"):
+            col_dw, col_ma = st.columns(2)
+            with col_dw:
+                door_width = st.number_input("Larghezza max porte (m)", 0.3, 3.0, config.ROOM_DOOR_WIDTH_M, 0.1)
+            with col_ma:
+                min_room = st.number_input("Superficie minima locale (m²)", 0.5, 100.0, config.ROOM_MIN_AREA_M2, 0.5)
+            col_det, col_rm = st.columns(2)
+            if col_det.button("Rileva locali", use_container_width=True):
+                bp = st.session_state.blueprint
+                ppm = st.session_state.get('pixels_per_meter', None)
+                with st.spinner("Rilevamento in corso..."):
+                    rooms = detect_rooms(bp, pixels_per_meter=ppm / bp.scale_factor if ppm else None,
+                                         door_width_m=door_width, min_area_m2=min_room)
+                # Un nuovo rilevamento sostituisce i candidati precedenti
+                st.session_state.areas = [a for a in st.session_state.areas if not a.get('detected')]
+                for room in rooms:
+                    pts = [(x * bp.scale_factor, y * bp.scale_factor) for x, y in room['points']]
+                    st.session_state.areas.append({
+                        'name': f"Locale_{len(st.session_state.areas)+1}",
+                        'points': pts,
+                        'type': 'polygon',
+                        'height_mounting': 3.0,
+                        'height_calc_plane': 0.85,
+                        'photometry': '<Manual>',
+                        'surface_m2': polygon_area(pts) / ppm**2 if ppm else None,
+                        'detected': True,
+                    })
+                st.success(f"{len(rooms)} locali rilevati")
+            if col_rm.button("Rimuovi locali rilevati", use_container_width=True):
+                st.session_state.areas = [a for a in st.session_state.areas if not a.get('detected')]
+                st.rerun()
+        
         # Inserimento area manuale
         st.markdown("### Inserisci Area Manualmente")
         col_an, col_ah1, col_ah2 = st.columns(3)
@@ -399,13 +591,58 @@ if st.session_state.areas and st.session_state.photometries:
     total_lamps = 0
     total_area = 0
     
+    # Risultati per area conservati tra i rerun: si ricalcolano solo le aree con input modificati
+    ppm = st.session_state.get('pixels_per_meter', None)
+    px_per_m = ppm if ppm and ppm > 0 else 1.0
+    photometries = st.session_state.photometries
+    placements = st.session_state.setdefault('area_placements', AreaResultCache())
+    area_results = st.session_state.setdefault('area_results', AreaResultCache())
+    illuminance_results = st.session_state.setdefault('illuminance_results', AreaResultCache())
+    area_ids = [ensure_area_id(area) for area in st.session_state.areas]
+    for cache in (placements, area_results, illuminance_results):
+        cache.retain(area_ids)
+    
+    # Opzioni di posizionamento dai widget di ogni area (stessi default dei widget)
+    placement_options = {}
+    placement_keys = {}
+    for area, area_id in zip(st.session_state.areas, area_ids):
+        photom = photometries.get(area['photometry'], {})
+        beam_angle = st.session_state.get(f"beam_angle_{area_id}")
+        placement_options[area_id] = {
+            'beam_angle': default_beam_angle(photom) if beam_angle is None else beam_angle,
+            'plane_widths': photom.get('intensities') is not None and st.session_state.get(f"beam_xy_{area_id}") is not False,
+            'pattern': st.session_state.get(f"pattern_{area_id}") or 'grid',
+        }
+        placement_keys[area_id] = area_key(area, ppm, photometry_id(photometries, area['photometry']),
+                                           **placement_options[area_id])
+    
+    # Griglie delle sole aree modificate in un'unica chiamata
+    dirty = placements.stale(placement_keys)
+    if dirty:
+        areas_by_id = dict(zip(area_ids, st.session_state.areas))
+        changed = place_project(
+            [areas_by_id[i] for i in dirty], photometries, ppm,
+            beam_angles=[placement_options[i]['beam_angle'] for i in dirty],
+            plane_widths=[placement_options[i]['plane_widths'] for i in dirty],
+            patterns=[placement_options[i]['pattern'] for i in dirty],
+        )
+        for k, area_id in enumerate(dirty):
+            placements.put(area_id, placement_keys[area_id], {
+                'positions': changed.positions(k),
+                'count': int(changed.counts[k]),
+                'beam_width': float(changed.beam_width[k]),
+                'beam_width_y': float(changed.beam_width_y[k]),
+                'pattern': changed.patterns[k],
+            })
+    
     for area_idx, area in enumerate(st.session_state.areas):
+        area_id = area_ids[area_idx]
         st.subheader(f"🎯 {area['name']}")
         
         col1, col2, col3 = st.columns(3)
         
         # Carica fotometria
-        photom = st.session_state.photometries.get(area['photometry'], {})
+        photom = photometries.get(area['photometry'], {})
         
         # Calcoli
         with col1:
@@ -414,85 +651,187 @@ if st.session_state.areas and st.session_state.photometries:
         with col2:
             st.metric("Altezza Piano Calcolo", f"{area['height_calc_plane']:.2f} m")
         
+        has_matrix = photom.get('intensities') is not None
+        target_lux = min_uniformity = None
         with col3:
+            default_angle = default_beam_angle(photom)
             beam_angle = st.number_input(
                 T['beam_angle'],
-                1, 90, 15,
-                key=f"beam_angle_{area_idx}"
+                1, 90, default_angle,
+                key=f"beam_angle_{area_id}"
             )
+            use_plane_widths = has_matrix and st.checkbox(
+                "Fascio X/Y da fotometria",
+                value=True,
+                key=f"beam_xy_{area_id}"
+            )
+            st.selectbox(
+                "Schema di posizionamento",
+                ('auto',) + PATTERNS,
+                index=1,
+                format_func=PATTERN_LABELS.get,
+                key=f"pattern_{area_id}"
+            )
+            use_lumen_method = has_matrix and st.checkbox(
+                "Metodo del flusso",
+                value=False,
+                key=f"lumen_method_{area_id}"
+            )
+            use_indirect = has_matrix and st.checkbox(
+                "Interriflessioni (radiosità)",
+                value=config.ILLUMINANCE_INDIRECT,
+                key=f"indirect_{area_id}"
+            )
+            use_optimizer = has_matrix and st.checkbox(
+                "Ottimizza layout (Em, U0)",
+                value=False,
+                key=f"optimize_{area_id}"
+            )
+            if use_lumen_method or use_optimizer:
+                task = st.selectbox(
+                    "Compito visivo (UNI EN 12464-1)",
+                    ["—"] + list(config.EN12464_TASKS),
+                    key=f"task_{area_id}"
+                )
+                task_lux, task_u0 = config.EN12464_TASKS.get(task, (config.DEFAULT_TARGET_LUX, 0.4))
+                target_lux = st.number_input(
+                    "Illuminamento richiesto (lux)",
+                    50, 2000, task_lux, 50,
+                    key=f"target_lux_{area_id}_{task}"
+                )
+                min_uniformity = st.number_input(
+                    "Uniformità minima U0",
+                    0.1, 0.9, task_u0, 0.05,
+                    key=f"min_u0_{area_id}_{task}"
+                )
         
-        # Calcola fascio
-        height_diff = area['height_mounting'] - area['height_calc_plane']
-        beam_width = calculate_beam_spread(area['height_mounting'], area['height_calc_plane'], beam_angle)
-        beam_area = math.pi * (beam_width/2)**2
-        # Area superficie
-        surface_area = None
-        # If area has precomputed surface in m2 (from canvas), use it
-        if area.get('surface_m2'):
-            surface_area = area['surface_m2']
-        else:
-            # try to compute from polygon points if possible using pixels_per_meter
-            pts = area.get('points', [])
-            if pts and len(pts) >= 2:
-                # compute pixel area (shoelace for polygons or rectangle)
-                def polygon_area_px(points):
-                    x = [p[0] for p in points]
-                    y = [p[1] for p in points]
-                    n = len(points)
-                    area_px = 0.0
-                    for i in range(n):
-                        j = (i + 1) % n
-                        area_px += x[i] * y[j] - x[j] * y[i]
-                    return abs(area_px) / 2.0
-
-                if len(pts) >= 3:
-                    area_px = polygon_area_px(pts)
-                else:
-                    # rectangle defined by two points
-                    area_px = abs((pts[1][0]-pts[0][0])*(pts[1][1]-pts[0][1]))
-
-                ppm = st.session_state.get('pixels_per_meter', None)
-                if ppm and ppm > 0:
-                    surface_area = area_px / (ppm**2)
-                else:
-                    # fallback: assume 1 px = 1 m (not ideal)
-                    surface_area = area_px
-        if surface_area is None:
-            surface_area = 0
-        
-        # Calcola numero lampade
-        calc = LampPlacementCalculator(photom)
-        spacing_config = calc.calculate_spacing(10, 10, beam_width)  # 10x10m area default
-        
-        n_lamps = spacing_config['total_lamps']
-        spacing_x = spacing_config['spacing_x']
-        spacing_y = spacing_config['spacing_y']
+        # Risultato dell'area: ricalcolato solo se cambiano gli input o le opzioni di calcolo
+        placed = placements.get(area_id)
+        result_key = area_key(area, ppm, photometry_id(photometries, area['photometry']),
+                              placement=placement_keys[area_id], lumen=use_lumen_method, indirect=use_indirect,
+                              optimizer=use_optimizer, target_lux=target_lux, min_uniformity=min_uniformity)
+        computed = area_results.get(area_id, result_key)
+        if computed is None:
+            # Larghezze dal posizionamento (separate sui piani C0-C180 e C90-C270 se richiesto)
+            beam_width = placed['beam_width']
+            beam_width_y = placed['beam_width_y'] if use_plane_widths else None
+            # Superficie: da canvas se disponibile, altrimenti dal poligono (px² senza scala)
+            surface_area = area.get('surface_m2') or polygon_area(area_polygon(area, ppm))
+            
+            # Calcola numero lampade sulle dimensioni reali dell'area
+            polygon_m = area_polygon(area, ppm)
+            # Forma di calcolo: fori e zone escluse non ricevono lampade né entrano nelle statistiche
+            shape_m = area_shape(area, ppm)
+            if area.get('holes') or area.get('keepouts'):
+                surface_area = shape_m.area
+            if polygon_m:
+                xs_m = [p[0] for p in polygon_m]
+                ys_m = [p[1] for p in polygon_m]
+                area_w, area_h = max(xs_m) - min(xs_m), max(ys_m) - min(ys_m)
+            else:
+                area_w = area_h = 0.0
+            calc = LampPlacementCalculator(photom)
+            # Solo per i passi: il numero di lampade è quello posizionato (poligono, fori, zone escluse)
+            spacing_config = calc.calculate_spacing(area_w or 1.0, area_h or 1.0, beam_width, beam_width_y)
+            pattern = placed['pattern']
+            lumen = None
+            if use_lumen_method and len(polygon_m) >= 3:
+                # Metodo del flusso: N = E · A / (Φ · UF · MF) con UF dall'indice del locale
+                # Stima a parte: il numero di lampade resta quello posizionato e calcolato
+                lumen = calc.calculate_lamps_lumen(shape_m, area['height_mounting'], area['height_calc_plane'], target_lux)
+            
+            # Posizioni lampade e illuminamento diretto sul piano di calcolo
+            lamp_positions_m = placed['positions'] if len(polygon_m) >= 3 else []
+            layout = None
+            if use_optimizer and len(polygon_m) >= 3:
+                layout = calc.optimize_layout(shape_m, area['height_mounting'], area['height_calc_plane'],
+                                              target_lux, min_uniformity, indirect=use_indirect)
+                if layout['positions']:
+                    lamp_positions_m = layout['positions']
+            n_lamps = len(lamp_positions_m)
+            
+            illuminance = None
+            if has_matrix and lamp_positions_m:
+                # Se cambiano solo alcune lampade la griglia viene aggiornata in modo incrementale
+                illuminance_key = (photom.get('sha256'), shape_m.key, area['height_mounting'],
+                                   area['height_calc_plane'], use_indirect)
+                result = illuminance_results.get(area_id, illuminance_key)
+                if result is None or not result.sync_lamps(lamp_positions_m):
+                    result = calc.calculate_illuminance(
+                        shape_m, lamp_positions_m, area['height_mounting'], area['height_calc_plane'],
+                        indirect=use_indirect
+                    )
+                    illuminance_results.put(area_id, illuminance_key, result)
+                illuminance = result.summary()
+            
+            computed = {
+                'beam_width': beam_width, 'beam_width_y': beam_width_y, 'surface_area': surface_area,
+                'spacing_x': spacing_config['spacing_x'], 'spacing_y': spacing_config['spacing_y'],
+                'n_lamps': n_lamps, 'pattern': pattern, 'lumen': lumen, 'layout': layout,
+                'lamp_positions_m': lamp_positions_m, 'illuminance': illuminance,
+            }
+            area_results.put(area_id, result_key, computed)
         
-        total_lamps += n_lamps
+        beam_width, beam_width_y = computed['beam_width'], computed['beam_width_y']
+        surface_area, n_lamps, pattern = computed['surface_area'], computed['n_lamps'], computed['pattern']
+        spacing_x, spacing_y = computed['spacing_x'], computed['spacing_y']
+        lumen, layout, illuminance = computed['lumen'], computed['layout'], computed['illuminance']
+        lamp_positions_m = computed['lamp_positions_m']
         total_area += surface_area
+        total_lamps += n_lamps
         
         col_col1, col_col2, col_col3 = st.columns(3)
         with col_col1:
-            st.metric(T['beam_width'], f"{beam_width:.2f} m")
+            if beam_width_y is not None:
+                st.metric(T['beam_width'], f"{beam_width:.2f} × {beam_width_y:.2f} m")
+            else:
+                st.metric(T['beam_width'], f"{beam_width:.2f} m")
         with col_col2:
             st.metric(T['lamps_needed'], n_lamps)
+            if lumen:
+                st.metric("N metodo del flusso", lumen['lamps'])
         with col_col3:
-            st.metric("Uniformità", "95%")
+            if illuminance:
+                st.metric("Uniformità U0", f"{illuminance['U0']:.2f}")
+            else:
+                st.metric("Uniformità U0", "—")
         
-        st.write(f"📏 Spaziamento: X={spacing_x:.2f}m, Y={spacing_y:.2f}m")
+        st.write(f"📏 Spaziamento: X={spacing_x:.2f}m, Y={spacing_y:.2f}m, schema: {PATTERN_LABELS[pattern]}")
+        if layout:
+            status = "✅ conforme" if layout['compliant'] else "⚠️ requisiti non raggiunti"
+            st.write(
+                f"🧮 Layout ottimizzato: {layout['lamps']} apparecchi ({PATTERN_LABELS[layout['pattern']]} "
+                f"{layout['nx']}×{layout['ny']}, "
+                f"rotazione {layout['rotation']:.0f}°), {status} "
+                f"({layout['evaluated']} layout valutati in {layout['elapsed']:.1f} s)"
+            )
+        if lumen:
+            st.write(
+                f"📐 Metodo del flusso: K={lumen['room_index']:.2f}, UF={lumen['uf']:.2f}, "
+                f"{lumen['lamps']} apparecchi da {lumen['flux']:.0f} lm per {target_lux} lux"
+            )
+        if illuminance:
+            st.write(
+                f"💡 Em={illuminance['Em']:.0f} lux, Emin={illuminance['Emin']:.0f} lux, "
+                f"Emax={illuminance['Emax']:.0f} lux ({len(lamp_positions_m)} lampade, "
+                f"{'diretta + indiretta' if use_indirect else 'luce diretta'})"
+            )
         
         areas_data.append({
             'name': area['name'],
             'surface': surface_area,
             'lamps': n_lamps,
+            'lamps_lumen': lumen['lamps'] if lumen else None,
             'beam_width': beam_width,
             'spacing_x': spacing_x,
             'spacing_y': spacing_y,
             'height': area['height_mounting'],
-            'uniformity': 95.0,
+            'uniformity': illuminance['U0'] * 100.0 if illuminance else 0.0,
+            'illuminance': illuminance['Em'] if illuminance else None,
             'photometry_name': area['photometry'],
             'points': area['points'],
-            'lamp_positions': [(50+i*spacing_x, 50+j*spacing_y) for i in range(spacing_config['lamps_x']) for j in range(spacing_config['lamps_y'])],
+            # Stesse coordinate (pixel display) dei punti area per l'export DWG
+            'lamp_positions': [(x * px_per_m, y * px_per_m) for x, y in lamp_positions_m],
         })
         
         st.divider()
@@ -14,6 +14,27 @@ Modifica i parametri qui per personalizzare il tuo ambiente.
 MAX_IMAGE_WIDTH = 900  # pixel
 MAX_IMAGE_HEIGHT = 700  # pixel
 
+# Piramide della planimetria: livelli dimezzati fino a questo lato massimo (pixel)
+BLUEPRINT_PYRAMID_MIN_SIZE = 256
+
+# Lato delle tessere in cui sono letti i livelli della piramide (pixel)
+BLUEPRINT_TILE_SIZE = 512
+
+# Conservazione dell'originale: 'rgb' (in RAM), 'gray' o 'palette' (uint8, su file se grande)
+BLUEPRINT_STORAGE = 'rgb'
+
+# Colori della palette con BLUEPRINT_STORAGE = 'palette'
+BLUEPRINT_PALETTE_COLORS = 16
+
+# Originali 'gray'/'palette' con più pixel di così sono scritti su file (numpy.memmap)
+BLUEPRINT_MEMMAP_MIN_PIXELS = 4_000_000
+
+# Cartella per gli originali su file (None = cartella temporanea di sistema)
+BLUEPRINT_MEMMAP_DIR = None
+
+# Righe per fascia nel calcolo del primo livello della piramide
+BLUEPRINT_CHUNK_ROWS = 1024
+
 # Colori per visualizzazione aree
 AREA_COLORS = [
     (255, 0, 0),      # Rosso
@@ -49,6 +70,118 @@ DEFAULT_BEAM_ANGLE = 25  # fascio medio
 MIN_BEAM_ANGLE = 1
 MAX_BEAM_ANGLE = 90
 
+# Metodo del flusso: illuminamento medio richiesto di default (lux)
+DEFAULT_TARGET_LUX = 300
+
+# Metodo del flusso: fattore di manutenzione
+LUMEN_MAINTENANCE_FACTOR = 0.8
+
+# Metodo del flusso: fattori di riflessione (soffitto, pareti, piano di lavoro)
+LUMEN_REFLECTANCES = (0.7, 0.5, 0.2)
+
+# Metodo del flusso: indici del locale K della tabella dei fattori di utilizzazione
+LUMEN_ROOM_INDICES = (0.6, 0.8, 1.0, 1.25, 1.5, 2.0, 2.5, 3.0, 4.0, 5.0)
+
+# Metodo del flusso: rapporto interdistanza / altezza utile della griglia di riferimento
+LUMEN_SPACING_RATIO = 1.25
+
+# Requisiti UNI EN 12464-1 per compito visivo: (Em mantenuto in lux, U0 minimo)
+EN12464_TASKS = {
+    "Uffici - scrittura, lettura, elaborazione dati": (500, 0.60),
+    "Sale riunioni": (500, 0.60),
+    "Aule scolastiche": (500, 0.60),
+    "Laboratori": (500, 0.60),
+    "Reception": (300, 0.60),
+    "Mense": (200, 0.40),
+    "Toilette e spogliatoi": (200, 0.40),
+    "Scale": (150, 0.40),
+    "Aree di carico": (150, 0.40),
+    "Corridoi": (100, 0.40),
+    "Magazzini": (100, 0.40),
+}
+
+# Ottimizzatore layout: tempo massimo di ricerca (s)
+LAYOUT_TIME_BUDGET_S = 3.0
+
+# Ottimizzatore layout: si parte da questa frazione della stima del metodo del flusso
+LAYOUT_MIN_FRACTION = 0.7
+
+# Ottimizzatore layout: rotazioni aggiuntive della griglia (gradi); 0° e il lato più lungo sono sempre provati
+LAYOUT_ROTATIONS = ()
+
+# Ottimizzatore layout: schemi provati ('grid', 'staggered' file alternate sfalsate, 'line' fila singola)
+LAYOUT_PATTERNS = ('grid', 'staggered', 'line')
+
+# Ottimizzatore layout: spostamenti della griglia provati (frazioni del passo)
+LAYOUT_OFFSETS = (0.0, 0.25)
+
+# Ottimizzatore layout: rapporto massimo tra i passi lungo i due assi
+LAYOUT_MAX_SPACING_RATIO = 1.5
+
+# Ottimizzatore layout: la griglia di calcolo rada ha passo moltiplicato per questo fattore
+LAYOUT_COARSE_FACTOR = 2.0
+
+# Ottimizzatore layout: tolleranza della verifica rada prima del ricalcolo completo
+LAYOUT_COARSE_MARGIN = 0.05
+
+# Ottimizzatore layout: candidati per livello ricalcolati a piena risoluzione
+LAYOUT_REFINE_TOP = 3
+
+# Ottimizzatore layout: valutazioni memorizzate
+LAYOUT_MEMO_SIZE = 2048
+
+# Budget di memoria (MB) per i blocchi del calcolo di illuminamento
+ILLUMINANCE_MEMORY_MB = 64
+
+# Punti per blocco di calcolo (None = calcolato dal budget di memoria)
+ILLUMINANCE_TILE_POINTS = None
+
+# Processi per il calcolo di illuminamento (None = tutti i core)
+ILLUMINANCE_WORKERS = None
+
+# Sotto questo numero di coppie lampada × punto il calcolo resta seriale
+# (l'avvio dei processi costerebbe più del guadagno)
+ILLUMINANCE_PARALLEL_MIN_PAIRS = 5_000_000
+
+# Errore massimo (lux) per punto ammesso escludendo le lampade lontane (0 = calcolo completo)
+ILLUMINANCE_CULL_TOLERANCE_LUX = 0.1
+
+# Memoria (MB) per i contributi delle singole lampade negli aggiornamenti incrementali
+ILLUMINANCE_CONTRIB_CACHE_MB = 32
+
+# Oltre questo numero di lampade cambiate si ricalcola l'intera griglia
+ILLUMINANCE_MAX_INCREMENTAL = 20
+
+# Aggiunge la componente indiretta (radiosità) all'illuminamento diretto
+ILLUMINANCE_INDIRECT = False
+
+# Radiosità: lato delle patch di pareti, soffitto e pavimento (m)
+RADIOSITY_PATCH_SIZE = 0.5
+
+# Radiosità: numero massimo di patch per locale (oltre si ingrandiscono le patch)
+RADIOSITY_MAX_PATCHES = 2000
+
+# Radiosità: fattori di forma sotto questa soglia non sono conservati (matrice sparsa)
+RADIOSITY_FF_THRESHOLD = 1e-6
+
+# Radiosità: variazione relativa massima tra due iterazioni per la convergenza
+RADIOSITY_TOLERANCE = 1e-4
+
+# Radiosità: numero massimo di iterazioni
+RADIOSITY_MAX_ITERATIONS = 200
+
+# Radiosità: locali (fattori di forma) tenuti in memoria
+RADIOSITY_CACHE_ROOMS = 8
+
+# Radiosità: memoria massima (MB) per i fattori di forma punti di calcolo - patch in cache
+RADIOSITY_CACHE_MB = 128
+
+# Griglie con più punti di così sono scritte su file (numpy.memmap) invece che in RAM
+ILLUMINANCE_MEMMAP_MIN_POINTS = 2_000_000
+
+# Cartella per le griglie di illuminamento su file (None = cartella temporanea di sistema)
+ILLUMINANCE_MEMMAP_DIR = None
+
 # ============================================================================
 # CONFIGURAZIONE FILE E CARTELLE
 # ============================================================================
@@ -79,6 +212,16 @@ PDF_HEADING_FONTSIZE = 12
 PDF_NORMAL_FONTSIZE = 10
 PDF_SMALL_FONTSIZE = 8
 
+# Planimetrie PDF: risoluzione di default e scelte disponibili (DPI)
+PDF_DPI = 150
+PDF_DPI_OPTIONS = (72, 100, 150, 200, 300)
+
+# Thread di rasterizzazione delle pagine PDF (None = tutti i core)
+PDF_RENDER_WORKERS = 4
+
+# Memoria massima (MB) per le pagine PDF rasterizzate in cache
+PDF_PAGE_CACHE_MB = 512
+
 # ============================================================================
 # CONFIGURAZIONE DWG
 # ============================================================================
@@ -92,6 +235,46 @@ DWG_LAMP_RADIUS = 0.1
 # Spessore linee nel DWG (mm)
 DWG_LINE_WIDTH = 0.35
 
+# ============================================================================
+# CONFIGURAZIONE IMPORTAZIONE DXF
+# ============================================================================
+
+# Lato massimo (pixel) del raster della planimetria DXF
+DXF_RENDER_MAX_PX = 4000
+
+# Segmenti per un cerchio completo (archi e bulge delle polilinee)
+DXF_ARC_SEGMENTS = 64
+
+# Segmenti medi per cella dell'indice spaziale a griglia
+DXF_INDEX_CELL_ITEMS = 16
+
+# Segmenti che coprono più celle di così sono controllati a parte
+DXF_INDEX_MAX_SPAN = 64
+
+# Profondità massima dei blocchi annidati
+DXF_MAX_BLOCK_DEPTH = 16
+
+# Numero massimo di segmenti dopo l'esplosione dei blocchi
+DXF_MAX_SEGMENTS = 20_000_000
+
+# ============================================================================
+# CONFIGURAZIONE RILEVAMENTO LOCALI
+# ============================================================================
+
+# Lato massimo (pixel) del livello della piramide usato per la segmentazione
+ROOM_DETECT_MAX_SIDE = 2048
+
+# Apertura massima chiusa come porta (m) e superficie minima di un locale (m²)
+ROOM_DOOR_WIDTH_M = 1.0
+ROOM_MIN_AREA_M2 = 2.0
+
+# Senza scala: porta e superficie minima in frazione dell'immagine (lato maggiore, area)
+ROOM_DOOR_GAP_FRACTION = 0.015
+ROOM_MIN_AREA_FRACTION = 0.002
+
+# Tolleranza di semplificazione dei contorni (pixel del livello ridotto)
+ROOM_SIMPLIFY_PX = 1.5
+
 # ============================================================================
 # CONFIGURAZIONE LDT PARSER
 # ============================================================================
@@ -103,6 +286,25 @@ LDT_MAX_FLUX = 100000
 # Numero massimo di intensità da estrarre da LDT
 LDT_MAX_INTENSITIES = 200
 
+# ============================================================================
+# CONFIGURAZIONE CACHE FOTOMETRIE
+# ============================================================================
+
+# Cartella cache fotometrie elaborate (.npz indicizzati per SHA-256)
+PHOTOMETRY_CACHE_DIR = ".cache/photometry"
+
+# Dimensione massima cache su disco (MB)
+PHOTOMETRY_CACHE_MAX_MB = 200
+
+# Numero massimo di fotometrie tenute in memoria (LRU)
+PHOTOMETRY_CACHE_MEMORY_ITEMS = 64
+
+# Cartella indice colonnare della libreria fotometrie
+PHOTOMETRY_INDEX_DIR = ".cache/library_index"
+
+# Processi per l'indicizzazione della libreria (None = tutti i core)
+PHOTOMETRY_INDEX_WORKERS = None
+
 # ============================================================================
 # LIMITI VALIDAZIONE DATI
 # ============================================================================
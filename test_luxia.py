@@ -157,6 +157,1039 @@ def test_output_folder():
         print("✗ Cartella 'outputs' non creata\n")
         return False
 
+def _sample_ldt_text(symmetry=0, mc=72, ng=181, flux=2000.0, intensity=None):
+    """
+    Genera un file LDT sintetico con distribuzione I = 300 * cos(gamma)^2 cd/klm
+    (o intensity(c, gamma) → matrice piani × gamma in cd/klm, se indicata)
+    """
+    import numpy as np
+    dc = 360.0 / mc
+    dg = 180.0 / (ng - 1)
+    n_planes = {0: mc, 1: 1, 2: mc // 2 + 1, 3: mc // 2 + 1, 4: mc // 4 + 1}[symmetry]
+    header = [
+        "LUXiA Test", "1", str(symmetry), str(mc), f"{dc:g}", str(ng), f"{dg:g}",
+        "REP-1", "Downlight Test 2000lm", "DL-2000", "test.ldt", "2026-01-09",
+        "200", "0", "100", "150", "0", "0", "0", "0", "0",
+        "100", "85", "1.0", "0", "1",
+        "1", "LED", f"{flux:g}", "4000", "80", "20.5",
+    ]
+    gamma = np.linspace(0.0, 180.0, ng)
+    row = np.where(gamma <= 90.0, 300.0 * np.cos(np.radians(gamma)) ** 2, 0.0)
+    values = ["0.5"] * 10
+    values += [f"{c:g}" for c in np.arange(mc) * dc]
+    values += [f"{g:g}" for g in gamma]
+    matrix = np.tile(row, n_planes) if intensity is None else intensity(np.arange(n_planes) * dc, gamma).ravel()
+    values += [f"{v:.3f}" for v in matrix]
+    return "\n".join(header + values) + "\n"
+
+def test_ldt_parser():
+    """Test 6: Parser LDT strutturato"""
+    print("=" * 60)
+    print("TEST 6: Parser Eulumdat")
+    print("=" * 60)
+
+    from utils.photometry import parse_ldt, full_intensity_matrix
+
+    parsed = parse_ldt(_sample_ldt_text().encode('latin1'))
+    shape = parsed['intensities'].shape
+    ok = shape == (72, 181) and parsed['intensities'].flags['C_CONTIGUOUS']
+    ok = ok and parsed['total_luminous_flux'] == 2000.0 and abs(parsed['Imax'] - 600.0) < 1e-6
+    print(f"{'✓' if ok else '✗'} Matrice intensità {shape}, Imax={parsed['Imax']:.1f} cd")
+
+    parsed_sym = parse_ldt(_sample_ldt_text(symmetry=4).encode('latin1'))
+    c_full, full = full_intensity_matrix(parsed_sym)
+    ok_sym = parsed_sym['intensities'].shape == (19, 181) and full.shape == (72, 181)
+    print(f"{'✓' if ok_sym else '✗'} Simmetria Isym=4 espansa: {parsed_sym['intensities'].shape} → {full.shape}")
+    print()
+
+    return ok and ok_sym
+
+def test_photometry_cache():
+    """Test 7: Cache fotometrie per contenuto"""
+    print("=" * 60)
+    print("TEST 7: Cache Fotometrie")
+    print("=" * 60)
+
+    import hashlib
+    import tempfile
+    from utils import photometry_cache
+    from utils.photometry_cache import PhotometryCache
+
+    data = _sample_ldt_text().encode('latin1')
+    calls = []
+
+    def counting_parser(raw):
+        from utils.photometry import parse_ldt
+        calls.append(1)
+        return parse_ldt(raw)
+
+    def other_parser(raw):
+        return counting_parser(raw)
+
+    original_version = photometry_cache.CACHE_SCHEMA_VERSION
+    with tempfile.TemporaryDirectory() as cache_dir:
+        PhotometryCache(cache_dir).load(data, counting_parser)
+        # Nuova istanza (memoria vuota): deve leggere il .npz senza rielaborare
+        reloaded = PhotometryCache(cache_dir).load(data, counting_parser)
+        ok = len(calls) == 1 and reloaded['intensities'].shape == (72, 181) \
+            and reloaded['sha256'] == hashlib.sha256(data).hexdigest()
+        print(f"{'✓' if ok else '✗'} Parsing eseguito {len(calls)} volta/e su 2 caricamenti")
+
+        # Parser diverso o schema nuovo: le voci esistenti non vengono servite
+        PhotometryCache(cache_dir).load(data, other_parser)
+        try:
+            photometry_cache.CACHE_SCHEMA_VERSION = original_version + 1
+            PhotometryCache(cache_dir).load(data, counting_parser)
+        finally:
+            photometry_cache.CACHE_SCHEMA_VERSION = original_version
+        ok_stale = len(calls) == 3
+        print(f"{'✓' if ok_stale else '✗'} Nuovo parsing con altro parser o versione dello schema\n")
+
+    return ok and ok_stale
+
+def test_ies_parser():
+    """Test 8: Parser IES LM-63"""
+    print("=" * 60)
+    print("TEST 8: Parser IES")
+    print("=" * 60)
+
+    from utils.photometry import parse_photometry
+
+    ies_text = "\n".join([
+        "IESNA:LM-63-2002",
+        "[MANUFAC] LUXiA",
+        "[LUMINAIRE] Downlight IES",
+        "TILT=NONE",
+        "1 1000 1.0 5 3 1 2 0.2 0.2 0.1",
+        "1.0 1 15.0",
+        "0 22.5 45 67.5 90",
+        "0 45 90",
+        "300 250 150 50 0",
+        "300 250 150 50 0",
+        "300 250 150 50 0",
+    ])
+    parsed = parse_photometry(ies_text.encode('latin1'))
+    ok = (parsed['format'] == 'ies' and parsed['symmetry'] == 4
+          and parsed['intensities'].shape == (3, 5) and parsed['Imax'] == 300.0
+          and parsed['name'] == "Downlight IES")
+    print(f"{'✓' if ok else '✗'} {parsed['name']}: simmetria {parsed['symmetry']}, "
+          f"flusso apparecchio {parsed['lor'] / 100 * parsed['total_luminous_flux']:.0f} lm\n")
+    return ok
+
+def test_intensity_interpolation():
+    """Test 9: Interpolazione I(C, gamma) vettorizzata"""
+    print("=" * 60)
+    print("TEST 9: Interpolazione Intensità")
+    print("=" * 60)
+
+    import numpy as np
+    from utils.photometry import parse_ldt, intensity_at
+
+    all_passed = True
+    gamma = np.linspace(0.0, 90.0, 10)
+    expected = 600.0 * np.cos(np.radians(gamma)) ** 2
+    for symmetry in range(5):
+        parsed = parse_ldt(_sample_ldt_text(symmetry=symmetry).encode('latin1'))
+        # Include angoli oltre C=360 e una griglia 2D di direzioni
+        c = np.array([0.0, 95.0, 271.0, 359.5, 362.0])[:, None]
+        values = intensity_at(parsed, c, gamma[None, :])
+        ok = values.shape == (5, 10) and np.allclose(values, expected[None, :], atol=1.0)
+        print(f"{'✓' if ok else '✗'} Isym={symmetry}: I(C, γ) su griglia {values.shape}")
+        all_passed = all_passed and ok
+
+    # Piani diversi: interpolazione tra C345 e C360 (= C0)
+    parsed = parse_ldt(_sample_ldt_text(mc=24, ng=19).encode('latin1'))
+    parsed['intensities'] = np.repeat(np.arange(24.0)[:, None], 19, axis=1)
+    parsed['multiplier'] = 1.0
+    wrap = float(intensity_at(parsed, 352.5, 0.0))
+    ok = abs(wrap - 11.5) < 1e-9
+    print(f"{'✓' if ok else '✗'} Passaggio a C=360: I(352.5°) = {wrap:.2f}\n")
+
+    return all_passed and ok
+
+def test_illuminance():
+    """Test 10: Illuminamento diretto punto per punto"""
+    print("=" * 60)
+    print("TEST 10: Illuminamento Diretto")
+    print("=" * 60)
+
+    import numpy as np
+    from utils.photometry import parse_ldt
+    from utils.illuminance import direct_illuminance
+    from utils.lamp_calculator import LampPlacementCalculator
+
+    parsed = parse_ldt(_sample_ldt_text().encode('latin1'))
+    # Sotto la lampada: E = I(0) / h² ; a 1 m: E = I(γ) cos³γ / h²
+    E = direct_illuminance(parsed, [(0.0, 0.0)], [(0.0, 0.0), (1.0, 0.0)], 2.0)
+    gamma = np.arctan(0.5)
+    expected = np.array([600.0 / 4.0, 600.0 * np.cos(gamma) ** 5 / 4.0])
+    ok = np.allclose(E, expected, rtol=1e-3)
+    print(f"{'✓' if ok else '✗'} Singola lampada: E={E[0]:.1f} / {E[1]:.1f} lux")
+
+    calc = LampPlacementCalculator(parsed)
+    room = [(0.0, 0.0), (10.0, 0.0), (10.0, 8.0), (0.0, 8.0)]
+    lamps = calc.generate_lamp_positions(room, 3.0)
+    result = calc.calculate_illuminance(room, lamps, 3.0, 0.85).summary()
+    ok_stats = result['Emin'] <= result['Em'] <= result['Emax'] and 0 < result['U0'] <= 1
+    print(f"{'✓' if ok_stats else '✗'} Area 10×8 m, {len(lamps)} lampade: "
+          f"Em={result['Em']:.0f} lux, U0={result['U0']:.2f}\n")
+
+    return ok and ok_stats
+
+def test_incremental_illuminance():
+    """Test 11: Aggiornamento incrementale di una lampada"""
+    print("=" * 60)
+    print("TEST 11: Illuminamento Incrementale")
+    print("=" * 60)
+
+    import numpy as np
+    from utils.photometry import parse_ldt
+    from utils.illuminance import compute_illuminance
+
+    parsed = parse_ldt(_sample_ldt_text().encode('latin1'))
+    room = [(0.0, 0.0), (10.0, 0.0), (10.0, 8.0), (0.0, 8.0)]
+    lamps = [(x, y) for x in (2.0, 5.0, 8.0) for y in (2.0, 6.0)]
+    result = compute_illuminance(parsed, lamps, room, 3.0, 0.85)
+    result.move_lamp(0, (1.5, 3.0))
+    result.add_lamp((5.0, 4.0))
+    result.remove_lamp(3)
+
+    reference = compute_illuminance(parsed, result.lamps, room, 3.0, 0.85)
+    ok = np.allclose(result.E, reference.E, equal_nan=True)
+    print(f"{'✓' if ok else '✗'} Griglia uguale al ricalcolo completo")
+    ok_stats = all(np.isclose(result.summary()[k], reference.summary()[k]) for k in ('Em', 'Emin', 'Emax', 'U0'))
+    print(f"{'✓' if ok_stats else '✗'} Statistiche aggiornate: "
+          f"Em={result.Em:.1f} lux, U0={result.U0:.2f}\n")
+
+    return ok and ok_stats
+
+def test_lamp_culling():
+    """Test 12: Esclusione delle lampade lontane"""
+    print("=" * 60)
+    print("TEST 12: Esclusione Lampade Lontane")
+    print("=" * 60)
+
+    import numpy as np
+    from utils.photometry import parse_ldt
+    from utils.illuminance import compute_illuminance, cutoff_radius, LampGridIndex
+
+    parsed = parse_ldt(_sample_ldt_text().encode('latin1'))
+    hall = [(0.0, 0.0), (60.0, 0.0), (60.0, 30.0), (0.0, 30.0)]
+    lamps = [(x, y) for x in np.arange(1.5, 60.0, 3.0) for y in np.arange(1.5, 30.0, 3.0)]
+
+    index = LampGridIndex(lamps, 5.0)
+    found = set(index.query(10.0, 10.0, 14.0, 14.0).tolist())
+    expected = {i for i, (x, y) in enumerate(lamps) if 10.0 <= x <= 14.0 and 10.0 <= y <= 14.0}
+    ok_index = expected <= found
+    print(f"{'✓' if ok_index else '✗'} Indice a griglia: {len(found)} candidate, {len(expected)} nel rettangolo")
+
+    tolerance = 0.5
+    radius = cutoff_radius(parsed, 2.15, tolerance, len(lamps))
+    culled = compute_illuminance(parsed, lamps, hall, 3.0, 0.85, spacing=1.0, cull_tolerance=tolerance)
+    full = compute_illuminance(parsed, lamps, hall, 3.0, 0.85, spacing=1.0, cull_tolerance=0)
+    error = float(np.nanmax(np.abs(culled.E - full.E)))
+    ok = np.isfinite(radius) and error <= tolerance
+    print(f"{'✓' if ok else '✗'} Raggio {radius:.1f} m, errore massimo {error:.3f} lux (tolleranza {tolerance})\n")
+
+    return ok_index and ok
+
+def test_lumen_method():
+    """Test 13: Metodo del flusso con tabella UF"""
+    print("=" * 60)
+    print("TEST 13: Metodo del Flusso")
+    print("=" * 60)
+
+    import os
+    import tempfile
+    import numpy as np
+    from utils import photometry_cache
+    from utils.photometry import parse_ldt
+    from utils.photometry_cache import PhotometryCache, load_photometry
+    from utils.lumen_method import room_index, compute_utilization_factors, lamps_required, utilization_table
+
+    parsed = parse_ldt(_sample_ldt_text().encode('latin1'))
+    k = float(room_index(20.0 * 10.0, 60.0, 2.15))
+    ok_k = abs(k - 200.0 / (2.15 * 30.0)) < 1e-9
+    print(f"{'✓' if ok_k else '✗'} Indice del locale 20×10 m, hm=2.15 m: K={k:.2f}")
+
+    indices, uf = compute_utilization_factors(parsed)
+    ok_uf = np.all(np.diff(uf) > 0) and 0 < uf[0] < uf[-1]
+    print(f"{'✓' if ok_uf else '✗'} UF crescente con K: {uf[0]:.2f} (K={indices[0]}) → {uf[-1]:.2f} (K={indices[-1]})")
+
+    result = lamps_required(parsed, 300, 200.0, 60.0, 2.15, maintenance_factor=0.8)
+    expected = int(np.ceil(300 * 200.0 / (result['flux'] * result['uf'] * 0.8)))
+    batch = lamps_required(parsed, 300, np.array([200.0, 50.0]), np.array([60.0, 30.0]), 2.15, maintenance_factor=0.8)
+    ok_n = result['lamps'] == expected and batch['lamps'][0] == expected
+    print(f"{'✓' if ok_n else '✗'} 300 lux su 200 m²: {result['lamps']} apparecchi (UF={result['uf']:.2f})")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = PhotometryCache(tmp)
+        cache.put('uf', parsed)
+        restored = PhotometryCache(tmp).get('uf')
+    ok_cache = restored.get('uf_tables') == parsed['uf_tables']
+
+    # Percorso reale: load_photometry → tabella UF → nuovo processo (memoria vuota) → load_photometry
+    original_cache = photometry_cache._default_cache
+    data = _sample_ldt_text(flux=3000.0).encode('latin1')
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            photometry_cache._default_cache = PhotometryCache(tmp)
+            utilization_table(load_photometry(data))
+            photometry_cache._default_cache = PhotometryCache(tmp)
+            reloaded = load_photometry(data)
+            files = [f for f in os.listdir(tmp) if f.endswith('.npz')]
+        finally:
+            photometry_cache._default_cache = original_cache
+    ok_cache &= bool(reloaded.get('uf_tables')) and len(files) == 1
+    print(f"{'✓' if ok_cache else '✗'} Tabella UF salvata con la fotometria in cache "
+          f"({len(files)} file, ritrovata da load_photometry)\n")
+
+    return ok_k and ok_uf and ok_n and ok_cache
+
+def test_radiosity():
+    """Test 14: Interriflessioni con la radiosità"""
+    print("=" * 60)
+    print("TEST 14: Interriflessioni (Radiosità)")
+    print("=" * 60)
+
+    import numpy as np
+    from utils.photometry import parse_ldt, luminous_flux
+    from utils.radiosity import get_room_model
+    from utils.illuminance import compute_illuminance
+
+    parsed = parse_ldt(_sample_ldt_text().encode('latin1'))
+    room = [(0.0, 0.0), (10.0, 0.0), (10.0, 8.0), (0.0, 8.0)]
+    lamps = [(x, y) for x in (2.0, 5.0, 8.0) for y in (2.0, 6.0)]
+
+    model = get_room_model(room, 3.0)
+    direct = model.direct_on_patches(parsed, lamps, 3.0)
+    received = float((direct * model.areas).sum())
+    # Luce tutta verso il basso: le patch ricevono l'intero flusso emesso
+    emitted = len(lamps) * luminous_flux(parsed)
+    ok_energy = abs(received - emitted) < 0.02 * emitted and get_room_model(room, 3.0) is model
+    print(f"{'✓' if ok_energy else '✗'} {model.n_patches} patch, flusso diretto ricevuto {received:.0f} lm "
+          f"su {emitted:.0f} lm emessi, modello riutilizzato")
+
+    dark = compute_illuminance(parsed, lamps, room, 3.0, 0.85, indirect=True, reflectances=(0.0, 0.0, 0.0))
+    direct_only = compute_illuminance(parsed, lamps, room, 3.0, 0.85)
+    bright = compute_illuminance(parsed, lamps, room, 3.0, 0.85, indirect=True)
+    ok = np.isclose(dark.Em, direct_only.Em) and bright.Em > direct_only.Em and bright.U0 > direct_only.U0
+    print(f"{'✓' if ok else '✗'} Em diretto {direct_only.Em:.1f} lux → con interriflessioni {bright.Em:.1f} lux")
+
+    bright.move_lamp(0, (1.5, 3.0))
+    reference = compute_illuminance(parsed, bright.lamps, room, 3.0, 0.85, indirect=True)
+    ok_update = np.allclose(bright.E, reference.E, equal_nan=True)
+    print(f"{'✓' if ok_update else '✗'} Aggiornamento lampada con componente indiretta\n")
+
+    return ok_energy and ok and ok_update
+
+def test_vectorized_polygon():
+    """Test 15: Test punto-poligono vettoriale"""
+    print("=" * 60)
+    print("TEST 15: Punto in Poligono Vettoriale")
+    print("=" * 60)
+
+    import numpy as np
+    from utils.geometry import point_in_polygon, points_in_polygon, polygon_edges
+    from utils.lamp_calculator import LampPlacementCalculator
+
+    # Magazzino a L con vertici interi: molti candidati cadono esattamente sui lati
+    warehouse = [(0, 0), (60, 0), (60, 20), (25, 20), (25, 45), (0, 45)]
+    gx, gy = np.meshgrid(np.arange(-1.0, 62.0, 0.5), np.arange(-1.0, 47.0, 0.5))
+    points = np.column_stack([gx.ravel(), gy.ravel()])
+    expected = np.array([point_in_polygon(p, warehouse) for p in points.tolist()])
+    ok = np.array_equal(points_in_polygon(points, edges=polygon_edges(warehouse)), expected)
+    print(f"{'✓' if ok else '✗'} {len(points)} punti: risultato identico al ray casting scalare")
+
+    calc = LampPlacementCalculator()
+    positions = calc.generate_lamp_positions(warehouse, 3.0)
+    spacing = calc.calculate_spacing(60, 45, 3.0)
+    reference = []
+    x = 0.5
+    while x < 60:
+        y = 0.5
+        while y < 45:
+            if point_in_polygon((x, y), warehouse):
+                reference.append((x, y))
+            y += spacing['spacing_y']
+        x += spacing['spacing_x']
+    ok_positions = positions == reference
+    print(f"{'✓' if ok_positions else '✗'} Posizioni lampade identiche alla scansione con while: {len(positions)}\n")
+
+    return ok and ok_positions
+
+def test_layout_optimizer():
+    """Test 16: Ottimizzazione del layout"""
+    print("=" * 60)
+    print("TEST 16: Ottimizzazione Layout")
+    print("=" * 60)
+
+    from utils.photometry import parse_ldt
+    from utils.geometry import as_shape
+    from utils.illuminance import compute_illuminance
+    from utils.lamp_calculator import LampPlacementCalculator
+    from utils.layout_optimizer import grid_layout, _photometry_key
+    import config
+
+    parsed = parse_ldt(_sample_ldt_text().encode('latin1'))
+    calc = LampPlacementCalculator(parsed)
+    room = [(0.0, 0.0), (30.0, 0.0), (30.0, 10.0), (12.0, 10.0), (12.0, 25.0), (0.0, 25.0)]
+    target, u0 = config.EN12464_TASKS["Corridoi"]
+    layout = calc.optimize_layout(room, 3.0, 0.85, target, u0, maintenance_factor=0.8)
+    check = compute_illuminance(parsed, layout['positions'], room, 3.0, 0.85, maintenance_factor=0.8)
+    ok = layout['compliant'] and check.Em >= target and check.U0 >= u0
+    print(f"{'✓' if ok else '✗'} {layout['lamps']} apparecchi: Em={check.Em:.0f} lux (≥ {target}), "
+          f"U0={check.U0:.2f} (≥ {u0}), {layout['evaluated']} layout valutati")
+
+    # Area a L: griglie con più file nominali ma meno apparecchi dentro l'area non vanno perse
+    shape = as_shape(room)
+    fewer = []
+    for nx in range(1, 16):
+        for ny in range(1, 16):
+            for offset in [(fx, fy) for fx in config.LAYOUT_OFFSETS for fy in config.LAYOUT_OFFSETS]:
+                positions = grid_layout(shape, nx, ny, 0.0, offset, shape)
+                if 0.8 * layout['lamps'] <= len(positions) < layout['lamps']:
+                    stats = compute_illuminance(parsed, positions, room, 3.0, 0.85, maintenance_factor=0.8)
+                    if stats.Em >= target and stats.U0 >= u0:
+                        fewer.append((nx, ny, len(positions)))
+    ok_fewest = not fewer
+    print(f"{'✓' if ok_fewest else '✗'} Nessuna griglia conforme con meno apparecchi {fewer[:3]}")
+
+    again = calc.optimize_layout(room, 3.0, 0.85, target, u0, maintenance_factor=0.8)
+    ok_memo = again['positions'] == layout['positions']
+    print(f"{'✓' if ok_memo else '✗'} Secondo calcolo dalle valutazioni memorizzate: {again['elapsed']:.3f} s")
+
+    # Senza SHA-256 la memoria usa il contenuto, non l'id del dict (riutilizzabile)
+    same = parse_ldt(_sample_ldt_text().encode('latin1'))
+    brighter = parse_ldt(_sample_ldt_text(flux=4000.0).encode('latin1'))
+    ok_key = _photometry_key(same) == _photometry_key(parsed) != _photometry_key(brighter)
+    print(f"{'✓' if ok_key else '✗'} Chiave di memoria dal contenuto della fotometria\n")
+
+    return ok and ok_fewest and ok_memo and ok_key
+
+def test_area_holes():
+    """Test 17: Aree con fori e zone escluse"""
+    print("=" * 60)
+    print("TEST 17: Fori e Zone Escluse")
+    print("=" * 60)
+
+    import numpy as np
+    from utils.geometry import AreaShape, area_shape
+    from utils.illuminance import compute_illuminance
+    from utils.lamp_calculator import LampPlacementCalculator
+
+    column = [(4.0, 4.0), (6.0, 4.0), (6.0, 6.0), (4.0, 6.0)]
+    keepout = [(12.0, 2.0), (18.0, 2.0), (18.0, 8.0), (12.0, 8.0)]
+    shape = AreaShape([(0.0, 0.0), (20.0, 0.0), (20.0, 10.0), (0.0, 10.0)], [column], [keepout])
+    ok_area = abs(shape.area - (200.0 - 4.0 - 36.0)) < 1e-9
+    print(f"{'✓' if ok_area else '✗'} Superficie utile {shape.area:.1f} m² (contorno meno foro e zona esclusa)")
+
+    calc = LampPlacementCalculator({'beam_angle': 60})
+    lamps = np.array(calc.generate_lamp_positions(shape, 1.0))
+    in_hole = ((lamps[:, 0] > 4) & (lamps[:, 0] < 6) & (lamps[:, 1] > 4) & (lamps[:, 1] < 6)).any()
+    in_keepout = ((lamps[:, 0] > 12) & (lamps[:, 0] < 18) & (lamps[:, 1] > 2) & (lamps[:, 1] < 8)).any()
+    ok_lamps = lamps.shape[0] > 0 and not in_hole and not in_keepout
+    print(f"{'✓' if ok_lamps else '✗'} {lamps.shape[0]} lampade, nessuna nel foro o nella zona esclusa")
+
+    parsed = {'c_angles': [0.0], 'gamma_angles': [0.0, 90.0], 'intensities': [[1000.0, 1000.0]],
+              'multiplier': 1.0, 'symmetry': 1}
+    result = compute_illuminance(parsed, [(10.0, 5.0)], shape, 3.0, 0.0, spacing=0.5)
+    gx, gy = np.meshgrid(result.xs, result.ys)
+    excluded = ((gx > 4) & (gx < 6) & (gy > 4) & (gy < 6)) | ((gx > 12) & (gx < 18) & (gy > 2) & (gy < 8))
+    ok_grid = not result.mask[excluded].any() and result.mask.sum() == 640
+    print(f"{'✓' if ok_grid else '✗'} {int(result.mask.sum())} punti di calcolo, esclusi foro e zona esclusa")
+
+    # Area in pixel dalla sessione: foro rettangolare definito da due punti
+    px_shape = area_shape({'points': [(0, 0), (200, 100)], 'holes': [[(40, 40), (60, 60)]]}, 10.0)
+    ok_px = abs(px_shape.area - 196.0) < 1e-9
+    print(f"{'✓' if ok_px else '✗'} Forma da pixel: {px_shape.area:.1f} m²\n")
+
+    return ok_area and ok_lamps and ok_grid and ok_px
+
+def test_project_placement():
+    """Test 18: Posizionamento di progetto in un'unica chiamata"""
+    print("=" * 60)
+    print("TEST 18: Posizionamento di Progetto")
+    print("=" * 60)
+
+    import numpy as np
+    from utils.photometry import parse_ldt, calculate_beam_spread, calculate_beam_spread_xy
+    from utils.geometry import area_shape
+    from utils.lamp_calculator import LampPlacementCalculator
+    from utils.project_placement import place_project
+
+    parsed = parse_ldt(_sample_ldt_text().encode('latin1'))
+    photometries = {'a.ldt': parsed}
+    areas = []
+    for i in range(60):
+        x0 = i * 500
+        if i % 2:
+            points = [(x0, 0), (x0 + 400, 0), (x0 + 400, 300), (x0 + 200, 300), (x0 + 200, 150), (x0, 150)]
+            areas.append({'points': points, 'type': 'polygon', 'height_mounting': 4.0,
+                          'height_calc_plane': 0.85, 'photometry': '<Manual>'})
+        else:
+            areas.append({'points': [(x0, 0), (x0 + 300, 200)], 'type': 'rectangle', 'height_mounting': 3.0,
+                          'height_calc_plane': 0.85, 'photometry': 'a.ldt',
+                          'holes': [[(x0 + 100, 80), (x0 + 140, 120)]]})
+    placement = place_project(areas, photometries, 20.0)
+    ok_columns = placement.area.shape == placement.x.shape == placement.y.shape == placement.photometry.shape
+    print(f"{'✓' if ok_columns else '✗'} {placement.x.size} lampade in {len(areas)} aree (array colonnari)")
+
+    ok_same = True
+    for idx, area in enumerate(areas):
+        photom = photometries.get(area['photometry'], {})
+        if photom:
+            bx, by = calculate_beam_spread_xy(area['height_mounting'], area['height_calc_plane'], photom)
+        else:
+            bx = by = calculate_beam_spread(area['height_mounting'], area['height_calc_plane'], 15)
+        expected = LampPlacementCalculator(photom).generate_lamp_positions(area_shape(area, 20.0), bx, beam_width_y=by)
+        ok_same = ok_same and placement.positions(idx) == expected
+        names = placement.photometry_names
+        ok_same = ok_same and all(names[c] == area['photometry']
+                                  for c in placement.photometry[placement.area == idx])
+    print(f"{'✓' if ok_same else '✗'} Stesse posizioni del calcolo area per area\n")
+
+    return ok_columns and ok_same
+
+def test_placement_patterns():
+    """Test 19: Schemi di posizionamento"""
+    print("=" * 60)
+    print("TEST 19: Schemi di Posizionamento")
+    print("=" * 60)
+
+    import numpy as np
+    from utils.geometry import AreaShape
+    from utils.lamp_calculator import LampPlacementCalculator
+    from utils.project_placement import PATTERNS, pattern_counts, fewest_lamps_patterns
+
+    room = AreaShape([(0.0, 0.0), (40.0, 0.0), (40.0, 25.0), (0.0, 25.0)])
+    corridor = AreaShape([(0.0, 0.0), (2.0, 0.0), (2.0, 30.0), (0.0, 30.0)])
+    counts = pattern_counts([room, corridor], [4.0, 4.0])
+    calc = LampPlacementCalculator()
+    ok_same = all(len(calc.generate_lamp_positions(shape, 4.0, pattern=p)) == counts[p][i]
+                  for p in PATTERNS for i, shape in enumerate([room, corridor]))
+    print(f"{'✓' if ok_same else '✗'} Conteggi batch = generate_lamp_positions: "
+          + ", ".join(f"{p}={counts[p][0]}" for p in PATTERNS))
+
+    # Stesso raggio di copertura: distanza massima di un punto interno dalla lampada più vicina
+    gx, gy = np.meshgrid(np.arange(3.0, 37.0, 0.1), np.arange(3.0, 22.0, 0.1))
+    probe = np.column_stack([gx.ravel(), gy.ravel()])
+    reach = {}
+    for p in ('grid', 'hex'):
+        lamps = np.array(calc.generate_lamp_positions(room, 4.0, pattern=p))
+        reach[p] = np.sqrt(((probe[:, None, :] - lamps[None]) ** 2).sum(-1)).min(axis=1).max()
+    ok_hex = counts['hex'][0] < counts['grid'][0] and reach['hex'] <= reach['grid'] * 1.02
+    print(f"{'✓' if ok_hex else '✗'} Esagonale: {counts['hex'][0]} lampade contro {counts['grid'][0]}, "
+          f"copertura {reach['hex']:.2f} m contro {reach['grid']:.2f} m")
+
+    best = fewest_lamps_patterns([room, corridor], [4.0, 4.0])
+    line = calc.generate_lamp_positions(corridor, 4.0, pattern='line')
+    ok_line = best[0] == 'hex' and all(x == 1.0 for x, _ in line)
+    print(f"{'✓' if ok_line else '✗'} Schema con meno lampade: {best}; fila singola in asse al corridoio\n")
+
+    return ok_same and ok_hex and ok_line
+
+def test_area_cache():
+    """Test 20: Risultati per area tra i rerun"""
+    print("=" * 60)
+    print("TEST 20: Cache Risultati per Area")
+    print("=" * 60)
+
+    from utils.area_cache import AreaResultCache, area_key, ensure_area_id
+
+    areas = [{'name': f"A{i}", 'points': [(0, 0), (100 + i, 80)], 'type': 'rectangle',
+              'height_mounting': 3.0, 'height_calc_plane': 0.85, 'photometry': 'a.ldt'} for i in range(100)]
+    ids = [ensure_area_id(area) for area in areas]
+    keys = {i: area_key(a, 20.0, 'sha', beam_angle=30, pattern='grid') for i, a in zip(ids, areas)}
+    cache = AreaResultCache()
+    for area_id in cache.stale(keys):
+        cache.put(area_id, keys[area_id], {'lamps': 1})
+    ok_ids = len(set(ids)) == len(ids) and ensure_area_id(areas[0]) == ids[0]
+    print(f"{'✓' if ok_ids else '✗'} Identificativi stabili e distinti per {len(ids)} aree")
+
+    # Modifica di un solo angolo: una sola area da ricalcolare
+    keys[ids[7]] = area_key(areas[7], 20.0, 'sha', beam_angle=35, pattern='grid')
+    stale = cache.stale(keys)
+    ok_dirty = stale == [ids[7]] and cache.get(ids[7], keys[ids[7]]) is None and cache.get(ids[8], keys[ids[8]])
+    print(f"{'✓' if ok_dirty else '✗'} Aree da ricalcolare dopo la modifica di un angolo: {len(stale)}")
+
+    evicted = cache.retain(ids[:-3])
+    ok_evict = evicted == 3 and len(cache) == 97 and ids[-1] not in cache
+    print(f"{'✓' if ok_evict else '✗'} Aree eliminate: {evicted} voci rimosse\n")
+
+    return ok_ids and ok_dirty and ok_evict
+
+def test_blueprint_pyramid():
+    """Test 21: Piramide della planimetria"""
+    print("=" * 60)
+    print("TEST 21: Piramide Planimetria")
+    print("=" * 60)
+
+    import numpy as np
+    from utils.blueprint_processor import BlueprintProcessor
+
+    scan = np.random.default_rng(0).integers(0, 256, (3000, 4200, 3), dtype=np.uint8)
+    bp = BlueprintProcessor(image=scan)
+    shapes = [level.shape[:2] for level in bp.levels]
+    ok_levels = bp.levels[0] is scan and all(b == (a[0] // 2, a[1] // 2) for a, b in zip(shapes, shapes[1:]))
+    print(f"{'✓' if ok_levels else '✗'} {len(shapes)} livelli: {shapes[0]} → {shapes[-1]}")
+
+    bp.resize_for_display(800, 600)
+    first = bp.display_image
+    bp.resize_for_display(800, 600)
+    ok_display = first.shape[:2] == (571, 800) and bp.display_image is first and abs(bp.scale_factor - 800 / 4200) < 1e-12
+    print(f"{'✓' if ok_display else '✗'} Display {first.shape[1]}×{first.shape[0]} dal livello "
+          f"{bp.level_for_scale(bp.scale_factor)}, riusato al rerun")
+
+    # Zoom: regione piccola dall'originale, regione ampia da un livello ridotto
+    detail, detail_scale = bp.get_region(1000, 1000, 1400, 1300)
+    overview, overview_scale = bp.get_region(0, 0, 3200, 2400)
+    ok_zoom = (np.array_equal(detail, scan[1000:1300, 1000:1400]) and detail_scale == 1.0
+               and overview.shape[:2] == (600, 800) and bp.level_for_scale(overview_scale) == 2)
+    print(f"{'✓' if ok_zoom else '✗'} Zoom: dettaglio alla risoluzione piena, panoramica dal livello "
+          f"{bp.level_for_scale(overview_scale)}\n")
+
+    return ok_levels and ok_display and ok_zoom
+
+def test_overlay_cache():
+    """Test 22: Cache degli overlay delle aree"""
+    print("=" * 60)
+    print("TEST 22: Cache Overlay")
+    print("=" * 60)
+
+    import numpy as np
+    from PIL import Image, ImageDraw
+    from utils.blueprint_processor import BlueprintProcessor
+
+    bp = BlueprintProcessor(image=np.full((300, 400, 3), 255, dtype=np.uint8))
+    bp.resize_for_display(400, 300)
+    areas = [
+        {'type': 'rectangle', 'points': [(20, 40), (180, 140)]},
+        {'type': 'polygon', 'points': [(200, 40), (380, 40), (380, 280), (200, 280)],
+         'holes': [[(250, 100), (300, 100), (300, 150), (250, 150)]]},
+    ]
+
+    # Riferimento: disegno diretto sull'immagine intera
+    reference = Image.fromarray(bp.display_image).convert('RGB')
+    draw = ImageDraw.Draw(reference)
+    draw.rectangle([(20, 40), (180, 140)], outline=(255, 0, 0), width=2)
+    draw.text((20, 25), "A1", fill=(255, 0, 0))
+    draw.polygon(areas[1]['points'], outline=(0, 255, 0))
+    draw.polygon(areas[1]['holes'][0], outline=(0, 255, 0), fill=(200, 200, 200))
+    draw.text((200, 25), "A2", fill=(0, 255, 0))
+
+    first = bp.draw_areas(areas)
+    ok_pixels = np.array_equal(np.asarray(first), np.asarray(reference))
+    ok_cached = bp.draw_areas(areas) is first
+    print(f"{'✓' if ok_pixels else '✗'} Composizione identica al disegno diretto")
+    print(f"{'✓' if ok_cached else '✗'} Immagine composta riusata al rerun")
+
+    # Una nuova area ridisegna solo il proprio overlay; eliminarla lo rimuove
+    before = dict(bp._overlays)
+    bp.draw_areas(areas + [{'type': 'rectangle', 'points': [(30, 180), (120, 260)]}])
+    reused = sum(bp._overlays[k] is v for k, v in before.items() if k in bp._overlays)
+    bp.draw_areas(areas[:1])
+    ok_incremental = reused == 2 and len(bp._overlays) == 1
+    print(f"{'✓' if ok_incremental else '✗'} Overlay riusati: {reused}, dopo l'eliminazione: {len(bp._overlays)}\n")
+
+    return ok_pixels and ok_cached and ok_incremental
+
+def test_pdf_pages():
+    """Test 23: Planimetrie PDF multipagina"""
+    print("=" * 60)
+    print("TEST 23: Pagine PDF")
+    print("=" * 60)
+
+    import threading
+    from fpdf import FPDF
+    from PIL import Image
+    from utils import pdf_pages
+    from utils.pdf_pages import PdfPages
+
+    pdf = FPDF(unit='mm')
+    for size, orientation in [('A4', 'P'), ('A3', 'L'), ((594, 841), 'L')]:
+        pdf.add_page(orientation=orientation, format=size)
+    doc = PdfPages(bytes(pdf.output()))
+    ok_list = doc.page_count == 3 and doc.page_label(2) == "Pagina 2 (420 × 297 mm)" \
+        and doc.pixel_size(1, 72) == (595, 842)
+    print(f"{'✓' if ok_list else '✗'} {doc.page_count} pagine elencate senza rasterizzare: {doc.page_label(3)}")
+
+    # Rasterizzatore sostitutivo: conta le chiamate e i thread (poppler può mancare)
+    calls, threads = [], set()
+    def fake_rasterize(path, page, dpi):
+        calls.append((page, dpi))
+        threads.add(threading.get_ident())
+        return Image.new('RGB', doc.pixel_size(page, dpi), 'white')
+
+    original = pdf_pages._rasterize
+    pdf_pages._rasterize = fake_rasterize
+    try:
+        pdf_pages.clear_page_cache()
+        first = doc.render(2, dpi=50)
+        again = PdfPages(bytes(pdf.output())).render(2, dpi=50)
+        ok_cache = again is first and calls == [(2, 50)] and first.size == doc.pixel_size(2, 50)
+        print(f"{'✓' if ok_cache else '✗'} Pagina in cache per (file, pagina, DPI): {len(calls)} rasterizzazione")
+
+        pages = doc.render_pages([1, 2, 3], dpi=50, workers=2)
+        doc.render(2, dpi=72)
+        ok_batch = sorted(calls) == [(1, 50), (2, 50), (2, 72), (3, 50)] and pages[2] is first
+        print(f"{'✓' if ok_batch else '✗'} Set di tavole: {len(calls)} rasterizzazioni su {len(threads)} thread\n")
+    finally:
+        pdf_pages._rasterize = original
+        pdf_pages.clear_page_cache()
+
+    return ok_list and ok_cache and ok_batch
+
+def test_dxf_drawing():
+    """Test 24: Importazione DXF vettoriale"""
+    print("=" * 60)
+    print("TEST 24: Importazione DXF")
+    print("=" * 60)
+
+    import io
+    import ezdxf
+    import numpy as np
+    from ezdxf import disassemble
+    from utils.dxf_drawing import DxfDrawing
+
+    doc = ezdxf.new('R2010', units=4)
+    msp = doc.modelspace()
+    msp.add_line((0, 0), (12000, 0))
+    msp.add_lwpolyline([(0, 0, 0, 0, 0), (5000, 0, 0, 0, 1), (5000, 5000, 0, 0, 0), (0, 5000)],
+                       format='xyseb', close=True)
+    msp.add_polyline2d([(6000, 0), (8000, 0), (8000, 2000)], close=True)
+    msp.add_arc((2000, 2000), 500, 0, 90)
+    msp.add_circle((3000, 3000), 200)
+    hatch = msp.add_hatch()
+    hatch.paths.add_polyline_path([(9000, 9000), (9500, 9000), (9500, 9500)], is_closed=True)
+    door = doc.blocks.new('DOOR', base_point=(100, 100))
+    door.add_line((100, 100), (900, 100))
+    door.add_arc((100, 100), 800, 0, 90)
+    pair = doc.blocks.new('PAIR')
+    pair.add_blockref('DOOR', (0, 0))
+    pair.add_blockref('DOOR', (2000, 0), dxfattribs={'rotation': 90, 'xscale': 2})
+    msp.add_blockref('PAIR', (1000, 7000), dxfattribs={'rotation': 30})
+    msp.add_blockref('DOOR', (6000, 4000)).grid(size=(2, 3), spacing=(1000, 1500))
+    stream = io.StringIO()
+    doc.write(stream)
+
+    drawing = DxfDrawing(stream.getvalue().encode())
+    reference = []
+    for primitive in disassemble.to_primitives(disassemble.recursive_decompose(msp)):
+        vertices = [(v.x, v.y) for v in primitive.vertices()]
+        reference.extend((*a, *b) for a, b in zip(vertices, vertices[1:]))
+    reference = np.array(reference)
+    length = lambda s: np.hypot(s[:, 2] - s[:, 0], s[:, 3] - s[:, 1]).sum()
+    ratio = length(drawing.segments) / length(reference)
+    extents_ref = (reference[:, [0, 2]].min(), reference[:, [1, 3]].min(),
+                   reference[:, [0, 2]].max(), reference[:, [1, 3]].max())
+    ok_geometry = abs(ratio - 1.0) < 0.005 and np.allclose(drawing.extents, extents_ref, atol=1.0)
+    print(f"{'✓' if ok_geometry else '✗'} {len(drawing.segments)} segmenti (blocchi esplosi), "
+          f"lunghezza / ezdxf = {ratio:.4f}")
+
+    image, pixels_per_unit, _ = drawing.render(max_width=800, max_height=800)
+    ok_units = drawing.meters_per_unit == 0.001 and abs(drawing.pixels_per_meter(pixels_per_unit)
+                                                        - pixels_per_unit * 1000) < 1e-9
+    print(f"{'✓' if ok_units else '✗'} $INSUNITS mm: {drawing.pixels_per_meter(pixels_per_unit):.1f} px/m "
+          f"a {image.shape[1]}×{image.shape[0]} px")
+
+    # Indice a griglia: stessi segmenti del filtro esaustivo sugli ingombri
+    rng = np.random.default_rng(0)
+    boxes = drawing.index.boxes
+    ok_index = True
+    for _ in range(50):
+        x0, y0 = rng.uniform(-1000, 12000, 2)
+        x1, y1 = x0 + rng.uniform(10, 4000), y0 + rng.uniform(10, 4000)
+        brute = np.flatnonzero((boxes[:, 0] <= x1) & (boxes[:, 2] >= x0) & (boxes[:, 1] <= y1) & (boxes[:, 3] >= y0))
+        ok_index &= np.array_equal(np.sort(drawing.index.query(x0, y0, x1, y1)), brute)
+    detail, _, _ = drawing.render((0, 0, 1000, 1000), max_width=400, max_height=400)
+    ok_index &= detail.shape[:2] == (400, 400) and (detail < 128).any()
+    print(f"{'✓' if ok_index else '✗'} Finestra di zoom: segmenti dall'indice identici al filtro esaustivo\n")
+
+    return ok_geometry and ok_units and ok_index
+
+def test_room_detection():
+    """Test 25: Rilevamento automatico locali"""
+    print("=" * 60)
+    print("TEST 25: Rilevamento Locali")
+    print("=" * 60)
+
+    import numpy as np
+    import config
+    from utils import room_detection
+    from utils.blueprint_processor import BlueprintProcessor
+
+    # Pianta 1200×800 px a 20 px/m: muri di 6 px, porte di 16 px (0.8 m), un'apertura di 1.5 m
+    plan = np.full((800, 1200, 3), 255, dtype=np.uint8)
+    for y0, y1, x0, x1 in [(40, 46, 40, 1160), (754, 760, 40, 1160), (40, 760, 40, 46), (40, 760, 1154, 1160),
+                           (40, 360, 480, 486), (376, 760, 480, 486), (400, 406, 46, 480), (300, 303, 200, 260)]:
+        plan[y0:y1, x0:x1] = 0
+    plan[400:406, 200:216] = 255
+    plan[500:760, 800:806] = 0
+    plan[46:470, 800:806] = 0
+    bp = BlueprintProcessor(image=plan)
+    expected = sorted([(46, 46, 479, 399), (46, 406, 479, 753), (486, 46, 1153, 753)])
+
+    def boxes(rooms):
+        return sorted(tuple(int(round(v)) for v in (*np.min(r['points'], axis=0), *np.max(r['points'], axis=0)))
+                      for r in rooms)
+
+    original_side, original_cv2 = config.ROOM_DETECT_MAX_SIDE, room_detection.HAS_CV2
+    results = {}
+    try:
+        # Segmentazione sul livello 1/4, lati rifiniti sull'originale
+        config.ROOM_DETECT_MAX_SIDE = 400
+        for backend in ([True, False] if original_cv2 else [False]):
+            room_detection.HAS_CV2 = backend
+            results['cv2' if backend else 'numpy'] = boxes(room_detection.detect_rooms(bp, pixels_per_meter=20))
+    finally:
+        config.ROOM_DETECT_MAX_SIDE, room_detection.HAS_CV2 = original_side, original_cv2
+
+    ok = True
+    for backend, found in results.items():
+        ok_backend = found == expected
+        ok &= ok_backend
+        print(f"{'✓' if ok_backend else '✗'} {backend}: {len(found)} locali, filo interno dei muri: {found}")
+    print()
+    return ok
+
+def test_blueprint_storage():
+    """Test 26: Planimetria in scala di grigi / palette su file"""
+    print("=" * 60)
+    print("TEST 26: Memoria Planimetria")
+    print("=" * 60)
+
+    import gc
+    import os
+    import pickle
+    import numpy as np
+    from PIL import Image
+    import config
+    from utils.blueprint_processor import BlueprintProcessor
+
+    scan = np.full((1600, 2400, 3), 255, dtype=np.uint8)
+    scan[100:1500, 100:112] = 0
+    scan[400:600, 800:1000] = (200, 30, 30)
+    reference = BlueprintProcessor(image=scan)
+    reference.resize_for_display(800, 600)
+
+    original_min = config.BLUEPRINT_MEMMAP_MIN_PIXELS
+    config.BLUEPRINT_MEMMAP_MIN_PIXELS = 1_000_000
+    try:
+        gray = BlueprintProcessor(image=Image.fromarray(scan), storage='gray')
+        palette = BlueprintProcessor(image=scan, storage='palette')
+    finally:
+        config.BLUEPRINT_MEMMAP_MIN_PIXELS = original_min
+    for bp in (gray, palette):
+        bp.resize_for_display(800, 600)
+
+    ok_storage = all(isinstance(bp.original_image, np.memmap) and bp.original_image.dtype == np.uint8
+                     and bp.original_image.ndim == 2 for bp in (gray, palette))
+    expected_gray = np.asarray(Image.fromarray(reference.display_image).convert('L')).astype(int)
+    ok_display = (np.abs(gray.display_image.astype(int) - expected_gray).max() <= 2
+                  and np.array_equal(palette.display_image, reference.display_image))
+    region, _ = palette.get_region(850, 450, 950, 550)
+    ok_display &= bool((region == (200, 30, 30)).all())
+    print(f"{'✓' if ok_storage else '✗'} Originale uint8 su file: {gray.original_image.nbytes // 1024} kB "
+          f"invece di {scan.nbytes // 1024} kB in RAM")
+    print(f"{'✓' if ok_display else '✗'} Display e zoom coerenti con l'originale RGB")
+
+    # In sessione (pickle) resta solo il riferimento al file
+    blob = pickle.dumps(gray)
+    restored = pickle.loads(blob)
+    path = gray.storage_path
+    ok_pickle = (len(blob) < scan.nbytes // 50 and restored.storage_path == path
+                 and np.array_equal(restored.display_image, gray.display_image))
+    del gray, restored
+    gc.collect()
+    ok_pickle &= not os.path.exists(path)
+    print(f"{'✓' if ok_pickle else '✗'} Pickle: {len(blob) // 1024} kB, file rimosso con la planimetria\n")
+
+    return ok_storage and ok_display and ok_pickle
+
+def test_tiled_illuminance():
+    """Test 27: Illuminamento a blocchi con budget di memoria"""
+    print("=" * 60)
+    print("TEST 27: Illuminamento a Blocchi")
+    print("=" * 60)
+
+    import os
+    import numpy as np
+    from utils.photometry import parse_ldt
+    from utils.illuminance import direct_illuminance, tile_shape, create_grid_memmap
+
+    parsed = parse_ldt(_sample_ldt_text().encode('latin1'))
+    lamps = [(x, y) for x in np.arange(1.0, 20.0, 2.5) for y in np.arange(1.0, 12.0, 2.5)]
+    gx, gy = np.meshgrid(np.arange(0.0, 20.0, 0.25), np.arange(0.0, 12.0, 0.25))
+    points = np.column_stack([gx.ravel(), gy.ravel()])
+
+    reference = direct_illuminance(parsed, lamps, points, 2.2, memory_budget_mb=1024)
+    tile, _ = tile_shape(len(lamps), 100, 1)
+    tiled = direct_illuminance(parsed, lamps, points, 2.2, tile_size=100, memory_budget_mb=1)
+    ok_tiled = tile == 100 and np.allclose(tiled, reference)
+    # Budget minimo: anche le lampade sono divise in blocchi
+    _, chunk_small = tile_shape(len(lamps), 20000, 1)
+    split = direct_illuminance(parsed, lamps, points, 2.2, tile_size=20000, memory_budget_mb=1)
+    ok_tiled &= chunk_small < len(lamps) and np.allclose(split, reference)
+    print(f"{'✓' if ok_tiled else '✗'} Budget 1 MB: {len(points)} punti a blocchi di {tile}, "
+          f"{len(lamps)} lampade a blocchi di {chunk_small} → stessa griglia")
+
+    grid = create_grid_memmap((len(points),))
+    path = grid.filename
+    out = direct_illuminance(parsed, lamps, points, 2.2, tile_size=100, memory_budget_mb=1, out=grid)
+    ok_memmap = out is grid and isinstance(out, np.memmap) and np.allclose(np.asarray(grid), reference)
+    del out, grid
+    print(f"{'✓' if ok_memmap else '✗'} Uscita scritta nel numpy.memmap passato ({os.path.basename(path)})\n")
+
+    return ok_tiled and ok_memmap
+
+def test_parallel_illuminance():
+    """Test 28: Illuminamento su più processi con memoria condivisa"""
+    print("=" * 60)
+    print("TEST 28: Illuminamento Parallelo")
+    print("=" * 60)
+
+    import os
+    import numpy as np
+    import config
+    from utils import illuminance
+    from utils.photometry import parse_ldt
+    from utils.illuminance import compute_illuminance
+
+    parsed = parse_ldt(_sample_ldt_text().encode('latin1'))
+    room = [(0.0, 0.0), (24.0, 0.0), (24.0, 16.0), (0.0, 16.0)]
+    lamps = [(x, y) for x in np.arange(2.0, 24.0, 4.0) for y in np.arange(2.0, 16.0, 4.0)]
+
+    def segments():
+        return {name for name in os.listdir('/dev/shm') if name.startswith('psm_')} \
+            if os.path.isdir('/dev/shm') else set()
+
+    original_min = config.ILLUMINANCE_PARALLEL_MIN_PAIRS
+    if illuminance._pool is not None:
+        illuminance._pool.shutdown()
+        illuminance._pool = None
+    try:
+        # Lavoro piccolo: resta seriale, il pool non viene avviato
+        compute_illuminance(parsed, lamps[:2], [(0.0, 0.0), (2.0, 0.0), (2.0, 2.0), (0.0, 2.0)],
+                            3.0, 0.85, workers=4)
+        ok_small = illuminance._pool is None
+        print(f"{'✓' if ok_small else '✗'} Calcolo sotto soglia: nessun processo avviato")
+
+        # Soglia abbassata per restare veloci: la griglia supera il minimo e va sul pool
+        config.ILLUMINANCE_PARALLEL_MIN_PAIRS = 1000
+        before = segments()
+        serial = compute_illuminance(parsed, lamps, room, 3.0, 0.85, spacing=0.2, workers=1)
+        parallel = compute_illuminance(parsed, lamps, room, 3.0, 0.85, spacing=0.2, workers=2)
+        used_pool = illuminance._pool is not None
+        ok_equal = used_pool and np.allclose(parallel.E, serial.E, equal_nan=True) and all(
+            np.isclose(parallel.summary()[k], serial.summary()[k]) for k in ('Em', 'Emin', 'Emax', 'U0'))
+        print(f"{'✓' if ok_equal else '✗'} 2 processi = seriale su {int(serial.mask.sum())} punti: "
+              f"Em={parallel.Em:.1f} lux")
+
+        # I blocchi di memoria condivisa sono rimossi a fine calcolo
+        ok_cleanup = segments() <= before
+        print(f"{'✓' if ok_cleanup else '✗'} Memoria condivisa rilasciata\n")
+    finally:
+        config.ILLUMINANCE_PARALLEL_MIN_PAIRS = original_min
+        if illuminance._pool is not None:
+            illuminance._pool.shutdown()
+            illuminance._pool = None
+
+    return ok_small and ok_equal and ok_cleanup
+
+def test_photometry_library():
+    """Test 29: Indice colonnare della libreria fotometrie"""
+    print("=" * 60)
+    print("TEST 29: Libreria Fotometrie")
+    print("=" * 60)
+
+    import os
+    import tempfile
+    import numpy as np
+    from utils.photometry_library import build_library_index, PhotometryLibrary
+
+    with tempfile.TemporaryDirectory() as tmp:
+        library_dir = os.path.join(tmp, 'library')
+        index_dir = os.path.join(tmp, 'index')
+        # Percorso lungo con caratteri multibyte (oltre 260 byte in UTF-8)
+        deep = os.path.join(library_dir, *['Ø' * 50] * 3)
+        os.makedirs(deep)
+        files = {}
+        for name, flux in [('small', 800.0), ('medium', 2000.0), ('large', 6000.0)]:
+            folder = deep if name == 'large' else library_dir
+            files[name] = os.path.join(folder, f"{name}.ldt")
+            with open(files[name], 'w', encoding='latin1') as f:
+                f.write(_sample_ldt_text(flux=flux))
+
+        first = build_library_index(library_dir, index_dir, workers=1)
+        library = PhotometryLibrary(index_dir)
+        paths = {library.row(i)['path'] for i in range(len(library))}
+        ok_index = (first['total'] == 3 and first['parsed'] == 3 and paths == set(files.values())
+                    and len(files['large'].encode('utf-8')) > 260)
+        print(f"{'✓' if ok_index else '✗'} {first['total']} file indicizzati, percorso di "
+              f"{len(files['large'].encode('utf-8'))} byte conservato intero")
+
+        # Solo il file toccato viene riletto; il contenuto invariato non è rielaborato
+        untouched = build_library_index(library_dir, index_dir, workers=1)
+        stat = os.stat(files['large'])
+        os.utime(files['large'], (stat.st_atime, stat.st_mtime + 10))
+        touched = build_library_index(library_dir, index_dir, workers=1)
+        ok_rescan = (untouched['rescanned'] == 0 and touched['rescanned'] == 1
+                     and touched['parsed'] == 0 and touched['total'] == 3)
+        print(f"{'✓' if ok_rescan else '✗'} Reindicizzazione: {untouched['rescanned']} file riletti senza "
+              f"modifiche, {touched['rescanned']} dopo averne toccato uno")
+
+        library = PhotometryLibrary(index_dir)
+        names = lambda rows: sorted(os.path.basename(library.row(i)['path']) for i in rows)
+        ok_search = (names(library.search(min_flux=1000)) == ['large.ldt', 'medium.ldt']
+                     and names(library.search(text='ØØØ')) == ['large.ldt']
+                     and names(library.search(max_flux=1000, text='downlight')) == ['small.ldt'])
+        versions = [d for d in os.listdir(index_dir) if d.startswith('index-')]
+        ok_search &= len(versions) == 1 and np.all(np.isfinite(library.columns['flux']))
+        print(f"{'✓' if ok_search else '✗'} Ricerca per flusso e testo, una sola versione su disco\n")
+        del library
+
+    return ok_index and ok_rescan and ok_search
+
+def test_plane_beam_angles():
+    """Test 30: Angoli di fascio e di campo per piano C"""
+    print("=" * 60)
+    print("TEST 30: Fascio per Piano C")
+    print("=" * 60)
+
+    import numpy as np
+    from utils.photometry import parse_ldt, beam_angles, plane_half_angle, calculate_beam_spread_xy
+
+    # Decrescita lineare fino a zero a 50° (C0/C180) e 30° (C90/C270), passo gamma 10°:
+    # metà intensità a 25° / 15°, 10% a 45° / 27°, tutti tra due angoli campionati
+    def intensity(c, gamma):
+        cutoff = np.where(np.isin(c, (90.0, 270.0)), 30.0, 50.0)[:, None]
+        return 100.0 * np.clip(1.0 - gamma[None, :] / cutoff, 0.0, None)
+
+    parsed = parse_ldt(_sample_ldt_text(mc=4, ng=19, intensity=intensity).encode('latin1'))
+    angles = beam_angles(parsed)
+    c = list(angles['c_angles'])
+    expected = {0.0: (25.0, 45.0), 90.0: (15.0, 27.0), 180.0: (25.0, 45.0), 270.0: (15.0, 27.0)}
+    ok_planes = all(np.isclose(angles['beam'][c.index(plane)], beam, atol=1e-2)
+                    and np.isclose(angles['field'][c.index(plane)], field, atol=1e-2)
+                    for plane, (beam, field) in expected.items())
+    print(f"{'✓' if ok_planes else '✗'} Semi-angoli interpolati: C0 {plane_half_angle(parsed, 0):.1f}°/"
+          f"{plane_half_angle(parsed, 0, 'field'):.1f}°, C90 {plane_half_angle(parsed, 90):.1f}°/"
+          f"{plane_half_angle(parsed, 90, 'field'):.1f}°")
+    # Tra due piani il semi-angolo è interpolato in C (anche attraverso 360°)
+    ok_interp = (np.isclose(plane_half_angle(parsed, 45.0), 20.0, atol=1e-2)
+                 and np.isclose(plane_half_angle(parsed, 315.0), 20.0, atol=1e-2))
+    print(f"{'✓' if ok_interp else '✗'} C45: {plane_half_angle(parsed, 45.0):.1f}°, "
+          f"C315: {plane_half_angle(parsed, 315.0):.1f}°")
+
+    width_x, width_y = calculate_beam_spread_xy(3.0, 0.85, parsed)
+    dh = 3.0 - 0.85
+    ok_spread = (np.isclose(width_x, 2 * dh * np.tan(np.radians(25.0)), rtol=1e-3)
+                 and np.isclose(width_y, 2 * dh * np.tan(np.radians(15.0)), rtol=1e-3))
+    print(f"{'✓' if ok_spread else '✗'} Fascio allungato: X={width_x:.2f} m, Y={width_y:.2f} m\n")
+
+    return ok_planes and ok_interp and ok_spread
+
 def main():
     """Esegui tutti i test"""
     print("\n")
@@ -173,6 +1206,31 @@ def main():
         ("Calcolatore Lampade", test_lamp_calculator),
         ("Configurazione", test_config),
         ("Cartella Output", test_output_folder),
+        ("Parser LDT", test_ldt_parser),
+        ("Cache Fotometrie", test_photometry_cache),
+        ("Parser IES", test_ies_parser),
+        ("Interpolazione Intensità", test_intensity_interpolation),
+        ("Illuminamento Diretto", test_illuminance),
+        ("Illuminamento Incrementale", test_incremental_illuminance),
+        ("Esclusione Lampade Lontane", test_lamp_culling),
+        ("Metodo del Flusso", test_lumen_method),
+        ("Interriflessioni", test_radiosity),
+        ("Punto in Poligono Vettoriale", test_vectorized_polygon),
+        ("Ottimizzazione Layout", test_layout_optimizer),
+        ("Fori e Zone Escluse", test_area_holes),
+        ("Posizionamento di Progetto", test_project_placement),
+        ("Schemi di Posizionamento", test_placement_patterns),
+        ("Cache Risultati per Area", test_area_cache),
+        ("Piramide Planimetria", test_blueprint_pyramid),
+        ("Cache Overlay", test_overlay_cache),
+        ("Pagine PDF", test_pdf_pages),
+        ("Importazione DXF", test_dxf_drawing),
+        ("Rilevamento Locali", test_room_detection),
+        ("Memoria Planimetria", test_blueprint_storage),
+        ("Illuminamento a Blocchi", test_tiled_illuminance),
+        ("Illuminamento Parallelo", test_parallel_illuminance),
+        ("Libreria Fotometrie", test_photometry_library),
+        ("Fascio per Piano C", test_plane_beam_angles),
     ]
     
     results = []
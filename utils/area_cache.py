@@ -0,0 +1,83 @@
+import hashlib
+import json
+import uuid
+
+from utils.photometry_cache import _json_default
+
+
+def ensure_area_id(area):
+    """Identificativo stabile dell'area (non cambia se le aree precedenti vengono eliminate)"""
+    if not area.get('id'):
+        area['id'] = uuid.uuid4().hex[:12]
+    return area['id']
+
+
+def photometry_id(photometries, name):
+    """Identificativo del contenuto della fotometria (SHA-256 se disponibile, altrimenti il nome)"""
+    photometry = photometries.get(name) or {}
+    return photometry.get('sha256') or f"{name}:{photometry.get('intensities') is not None}"
+
+
+def area_key(area, pixels_per_meter=None, photometry=None, **options):
+    """
+    Chiave degli input di un'area: SHA-1 di punti, fori, zone escluse, altezze,
+    fotometria, scala e opzioni di calcolo
+
+    Args:
+        area: dict area
+        pixels_per_meter: scala della planimetria
+        photometry: identificativo della fotometria (photometry_id)
+        options: altri valori che influenzano il risultato (angolo, schema, ...)
+
+    Returns:
+        stringa esadecimale
+    """
+    inputs = [
+        area.get('points', []), area.get('holes', []), area.get('keepouts', []),
+        area.get('height_mounting'), area.get('height_calc_plane'),
+        photometry, pixels_per_meter, sorted(options.items()),
+    ]
+    payload = json.dumps(inputs, default=_json_default, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class AreaResultCache:
+    """
+    Risultati per area conservati tra i rerun di Streamlit
+
+    Ogni voce è valida finché la chiave degli input dell'area non cambia: solo
+    le aree modificate vengono ricalcolate. Le voci delle aree eliminate sono
+    rimosse con retain().
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, area_id, key=None):
+        """Risultato dell'area se la chiave coincide (key=None: qualunque risultato)"""
+        entry = self._entries.get(area_id)
+        if entry is None or (key is not None and entry[0] != key):
+            return None
+        return entry[1]
+
+    def put(self, area_id, key, value):
+        self._entries[area_id] = (key, value)
+
+    def stale(self, keys):
+        """Aree (dict id → chiave) senza risultato valido"""
+        return [area_id for area_id, key in keys.items()
+                if area_id not in self._entries or self._entries[area_id][0] != key]
+
+    def retain(self, area_ids):
+        """Rimuove le voci delle aree non più presenti; restituisce quante sono state rimosse"""
+        keep = set(area_ids)
+        evicted = [area_id for area_id in self._entries if area_id not in keep]
+        for area_id in evicted:
+            del self._entries[area_id]
+        return len(evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, area_id):
+        return area_id in self._entries
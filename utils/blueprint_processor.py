@@ -1,8 +1,14 @@
+import math
+import os
+import tempfile
+import weakref
 import numpy as np
 from PIL import Image
 import io
 import streamlit as st
 
+import config
+
 try:
     import cv2
     HAS_CV2 = True
@@ -10,37 +16,164 @@ except Exception:
     # Catch broad exceptions (ImportError, OSError due to missing libGL, etc.)
     HAS_CV2 = False
 
+def _half(image):
+    """Livello successivo della piramide: media di blocchi 2×2"""
+    h, w = image.shape[0] // 2, image.shape[1] // 2
+    if HAS_CV2:
+        return cv2.resize(image[:2 * h, :2 * w], (w, h), interpolation=cv2.INTER_AREA)
+    block = image[:2 * h, :2 * w].reshape(h, 2, w, 2, *image.shape[2:])
+    return ((block.sum(axis=(1, 3), dtype=np.uint16) + 2) // 4).astype(image.dtype)
+
+
+def _expand(palette, indices):
+    """Colori RGB di un array di indici di palette (tabella di 256 colori)"""
+    if HAS_CV2 and indices.ndim == 2 and indices.size:
+        indices = np.ascontiguousarray(indices)
+        return cv2.merge([cv2.LUT(indices, np.ascontiguousarray(palette[:, k])) for k in range(3)])
+    return np.take(palette, indices, axis=0)
+
+
+def _half_rows(image, palette=None):
+    """
+    Come _half, a fasce di righe: l'originale (anche su file o a palette) non
+    viene mai espanso o copiato per intero
+    """
+    rows = 2 * (config.BLUEPRINT_CHUNK_ROWS // 2)
+    end = 2 * (image.shape[0] // 2)
+    bands = []
+    for r in range(0, end, rows):
+        band = image[r:min(r + rows, end)]
+        bands.append(_half(_expand(palette, band) if palette is not None else band))
+    return np.concatenate(bands) if bands else _half(image)
+
+
+def _to_memmap(pixels, directory=None):
+    """Copia i pixel in un numpy.memmap su file temporaneo, riaperto in sola lettura"""
+    directory = directory or config.BLUEPRINT_MEMMAP_DIR
+    tmp = tempfile.NamedTemporaryFile(prefix='luxia_bp_', suffix='.dat', dir=directory, delete=False)
+    tmp.close()
+    stored = np.memmap(tmp.name, dtype=np.uint8, mode='w+', shape=pixels.shape)
+    stored[:] = pixels
+    stored.flush()
+    del stored
+    return np.memmap(tmp.name, dtype=np.uint8, mode='r', shape=pixels.shape)
+
+
 class BlueprintProcessor:
-    """Gestisce upload, visualizzazione e selezione aree su planimetrie"""
+    """
+    Gestisce upload, visualizzazione e selezione aree su planimetrie
+
+    Al caricamento viene costruita una piramide di livelli dimezzati
+    (levels[0] è l'originale): visualizzazione e zoom leggono dal livello più
+    vicino alla risoluzione richiesta, la risoluzione piena solo per zoom stretti.
+
+    L'originale può essere conservato in scala di grigi o a palette (uint8, un
+    byte per pixel) e in tal caso, oltre config.BLUEPRINT_MEMMAP_MIN_PIXELS, su
+    file temporaneo (numpy.memmap): in memoria restano solo i livelli ridotti e,
+    con pickle, solo il riferimento al file.
+    """
     
-    def __init__(self, file_path=None, image=None):
+    def __init__(self, file_path=None, image=None, storage=None):
+        """
+        Args:
+            file_path: immagine da file (JPG, PNG)
+            image: PIL Image o array
+            storage: 'rgb', 'gray' o 'palette' (default config.BLUEPRINT_STORAGE)
+        """
         self.original_image = None
         self.display_image = None
         self.scale_factor = 1.0
+        self.levels = []
+        self.storage = storage or config.BLUEPRINT_STORAGE
+        # Tabella (256, 3) dei colori degli indici dell'originale con storage 'palette'
+        self.palette = None
+        # File del memmap dell'originale (None se in RAM)
+        self.storage_path = None
+        self._display_key = None
+        # Immagine PIL del display, livelli overlay per area e composizione, validi per questa versione del display
+        self._display_version = 0
+        self._base_pil = None
+        self._overlays = {}
+        self._composite = None
         
         if file_path:
             self.load_from_file(file_path)
-        elif image:
+        elif image is not None:
+            self._set_original(image)
+            self._build_pyramid()
+    
+    def _set_original(self, image):
+        """Converte l'immagine nel formato di conservazione scelto e, se grande, la sposta su file"""
+        self.palette = None
+        if self.storage == 'gray':
+            if isinstance(image, Image.Image) or image.ndim == 3:
+                image = image if isinstance(image, Image.Image) else Image.fromarray(image)
+                image = np.asarray(image.convert('L'))
+        elif self.storage == 'palette':
+            image = image if isinstance(image, Image.Image) else Image.fromarray(image)
+            quantized = image.convert('RGB').quantize(config.BLUEPRINT_PALETTE_COLORS,
+                                                      method=Image.Quantize.FASTOCTREE)
+            image = np.asarray(quantized)
+            colors = np.array(quantized.getpalette(), dtype=np.uint8).reshape(-1, 3)[:256]
+            self.palette = np.zeros((256, 3), dtype=np.uint8)
+            self.palette[:len(colors)] = colors
+        elif isinstance(image, Image.Image):
             # Converti PIL Image a numpy array
-            if isinstance(image, Image.Image):
-                self.original_image = np.array(image.convert('RGB'))
-            else:
-                self.original_image = image
-            self.display_image = self.original_image.copy()
+            image = np.array(image.convert('RGB'))
+        
+        # 'rgb' resta in RAM senza copie, come in passato
+        if self.storage != 'rgb' and image.shape[0] * image.shape[1] >= config.BLUEPRINT_MEMMAP_MIN_PIXELS:
+            self.original_image = _to_memmap(image)
+            self.storage_path = self.original_image.filename
+            # Il file è rimosso con l'oggetto (su POSIX le mappature già aperte restano valide)
+            weakref.finalize(self, os.remove, self.storage_path)
+        else:
+            self.original_image = image
+            self.storage_path = None
+    
+    def level_image(self, level):
+        """Pixel (grigio o RGB) di un livello; a palette si espande solo il livello 0"""
+        if level == 0 and self.palette is not None:
+            return _expand(self.palette, self.original_image)
+        return self.levels[level]
+    
+    def __getstate__(self):
+        """
+        Con l'originale su file si serializza solo il riferimento; livelli e cache si ricostruiscono
+
+        Il file appartiene all'oggetto che l'ha creato: le copie ripristinate lo
+        riaprono ma non lo rimuovono.
+        """
+        state = self.__dict__.copy()
+        if self.storage_path:
+            state['original_image'] = None
+        state.update(levels=[], display_image=None, _base_pil=None, _overlays={}, _composite=None)
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.storage_path:
+            shape = state['_original_shape']
+            self.original_image = np.memmap(self.storage_path, dtype=np.uint8, mode='r', shape=shape)
+        if self.original_image is not None:
+            display_key = self._display_key
+            self._build_pyramid()
+            if display_key:
+                self.resize_for_display(*display_key)
     
     def load_from_file(self, file_path):
         """Carica immagine da file (JPG, PNG)"""
         try:
             if HAS_CV2:
-                img = cv2.imread(file_path)
+                gray = self.storage == 'gray'
+                img = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE if gray else cv2.IMREAD_COLOR)
                 if img is None:
                     raise ValueError("Non riesco a leggere il file immagine")
-                self.original_image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+                self._set_original(img if gray else cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
             else:
                 # Fallback a PIL se cv2 non disponibile
-                pil_img = Image.open(file_path).convert('RGB')
-                self.original_image = np.array(pil_img)
-            self.display_image = self.original_image.copy()
+                self._set_original(Image.open(file_path))
+            self._build_pyramid()
             return True
         except Exception as e:
             st.error(f"Errore nel caricamento: {str(e)}")
@@ -48,38 +181,160 @@ class BlueprintProcessor:
     
     def load_from_pil(self, pil_image):
         """Carica da PIL Image"""
-        self.original_image = np.array(pil_image.convert('RGB'))
-        self.display_image = self.original_image.copy()
+        self._set_original(pil_image)
+        self._build_pyramid()
+    
+    def _build_pyramid(self):
+        """Livelli dimezzati dell'originale, calcolati una sola volta al caricamento"""
+        self._original_shape = self.original_image.shape
+        self.levels = [self.original_image]
+        while max(self.levels[-1].shape[:2]) > config.BLUEPRINT_PYRAMID_MIN_SIZE and min(self.levels[-1].shape[:2]) >= 2:
+            if len(self.levels) == 1:
+                # Primo livello a fasce: l'originale resta su file / a palette
+                self.levels.append(_half_rows(self.original_image, self.palette))
+            else:
+                self.levels.append(_half(self.levels[-1]))
+        # Finché non si chiede una dimensione di visualizzazione si mostra l'originale (senza copia)
+        self.display_image = self.level_image(0) if self.palette is not None else self.original_image
+        self.scale_factor = 1.0
+        self._display_key = None
+        self._display_version += 1
+    
+    def level_for_scale(self, scale):
+        """Indice del livello più piccolo con risoluzione almeno pari a scale (1 = originale)"""
+        if scale >= 1.0 or not self.levels:
+            return 0
+        return min(len(self.levels) - 1, int(math.floor(math.log2(1.0 / scale))))
+    
+    def _resample(self, image, size):
+        """Ridimensiona un livello alla dimensione (larghezza, altezza) richiesta"""
+        if image.shape[1] == size[0] and image.shape[0] == size[1]:
+            return image
+        if HAS_CV2:
+            return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        return np.array(Image.fromarray(image).resize(size, Image.Resampling.LANCZOS))
     
     def resize_for_display(self, max_width=800, max_height=600):
-        """Ridimensiona per il display mantenendo proporzioni"""
+        """
+        Ridimensiona per il display mantenendo proporzioni
+
+        L'immagine è ricavata dal livello della piramide più vicino e resta in
+        memoria finché non cambia la dimensione richiesta: ai rerun successivi
+        non si rielabora l'originale.
+        """
+        if self._display_key == (max_width, max_height):
+            return
         h, w = self.original_image.shape[:2]
         scale = min(max_width/w, max_height/h, 1.0)
         
         if scale < 1.0:
-            if HAS_CV2:
-                new_w = int(w * scale)
-                new_h = int(h * scale)
-                self.display_image = cv2.resize(self.original_image, (new_w, new_h))
-            else:
-                # Fallback con PIL
-                pil_img = Image.fromarray(self.original_image)
-                new_w = int(w * scale)
-                new_h = int(h * scale)
-                pil_img = pil_img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-                self.display_image = np.array(pil_img)
+            new_w = int(w * scale)
+            new_h = int(h * scale)
+            self.display_image = self._resample(self.level_image(self.level_for_scale(scale)), (new_w, new_h))
             self.scale_factor = scale
         else:
-            self.display_image = self.original_image.copy()
+            self.display_image = self.level_image(0) if self.palette is not None else self.original_image
             self.scale_factor = 1.0
+        self._display_key = (max_width, max_height)
+        self._display_version += 1
+    
+    def tile(self, level, tx, ty):
+        """Tessera (tx, ty) di un livello della piramide (vista, senza copia)"""
+        size = config.BLUEPRINT_TILE_SIZE
+        tile = self.levels[level][ty * size:(ty + 1) * size, tx * size:(tx + 1) * size]
+        return _expand(self.palette, tile) if level == 0 and self.palette is not None else tile
+    
+    def get_region(self, x0, y0, x1, y1, max_width=800, max_height=600):
+        """
+        Vista ingrandita di una regione (coordinate dell'originale in pixel)
+
+        Legge dal livello più piccolo che ha ancora almeno la risoluzione di
+        uscita: l'originale è usato solo se la regione è più piccola dell'uscita.
+
+        Returns:
+            (array immagine, scala uscita / originale)
+        """
+        h, w = self.original_image.shape[:2]
+        x0, x1 = max(0, int(x0)), min(w, int(math.ceil(x1)))
+        y0, y1 = max(0, int(y0)), min(h, int(math.ceil(y1)))
+        if x1 <= x0 or y1 <= y0:
+            raise ValueError("Regione vuota o fuori dalla planimetria")
+        scale = min(max_width / (x1 - x0), max_height / (y1 - y0), 1.0)
+        level = self.level_for_scale(scale)
+        factor = 2 ** level
+        crop = self.levels[level][y0 // factor:max(y0 // factor + 1, y1 // factor),
+                                  x0 // factor:max(x0 // factor + 1, x1 // factor)]
+        if level == 0 and self.palette is not None:
+            crop = _expand(self.palette, crop)
+        size = (max(1, int((x1 - x0) * scale)), max(1, int((y1 - y0) * scale)))
+        return self._resample(crop, size), scale
     
     def get_pil_image(self):
-        """Restituisce come PIL Image"""
-        return Image.fromarray(self.display_image)
+        """
+        Restituisce come PIL Image (RGB), convertita una volta per versione del display
+
+        L'immagine è condivisa tra le chiamate: non va modificata.
+        """
+        if self._base_pil is None or self._base_pil[0] != self._display_version:
+            self._base_pil = (self._display_version, Image.fromarray(self.display_image).convert('RGB'))
+            self._overlays = {}
+            self._composite = None
+        return self._base_pil[1]
+    
+    @staticmethod
+    def _overlay_key(area, idx, color):
+        """Chiave dell'overlay di un'area: geometria, fori, zone escluse, colore ed etichetta"""
+        rings = lambda name: tuple(tuple(map(tuple, ring)) for ring in area.get(name, []))
+        return (area.get('type'), tuple(map(tuple, area.get('points', []))), rings('holes'), rings('keepouts'),
+                color, f"A{idx+1}")
+    
+    @staticmethod
+    def _render_overlay(key):
+        """
+        Disegna un'area su un livello RGBA trasparente grande quanto il suo ingombro
+
+        Returns:
+            (origine (x, y) nel display, immagine RGBA) o None se non c'è nulla da disegnare
+        """
+        area_type, points, holes, keepouts, color, label = key
+        xs = [int(p[0]) for p in points] + [int(p[0]) for ring in holes + keepouts for p in ring]
+        ys = [int(p[1]) for p in points] + [int(p[1]) for ring in holes + keepouts for p in ring]
+        if not xs:
+            return None
+        # Margine per lo spessore dei bordi e l'etichetta sopra il primo punto
+        x0, y0 = min(xs) - 3, min(min(ys), int(points[0][1]) - 15) - 3
+        x1, y1 = max(max(xs), int(points[0][0]) + 6 * len(label)) + 3, max(ys) + 3
+        layer = Image.new('RGBA', (x1 - x0 + 1, y1 - y0 + 1), (0, 0, 0, 0))
+        from PIL import ImageDraw
+        draw = ImageDraw.Draw(layer)
+        local = lambda ring: [(int(p[0]) - x0, int(p[1]) - y0) for p in ring]
+        
+        if area_type == 'rectangle':
+            if len(points) >= 2:
+                draw.rectangle(local(points[:2]), outline=color, width=2)
+        elif area_type == 'polygon':
+            if len(points) >= 2:
+                draw.polygon(local(points), outline=color)
+        # Fori (campitura grigia) e zone escluse (contorno grigio) dell'area
+        for ring in holes:
+            draw.polygon(local(ring), outline=color, fill=(200, 200, 200))
+        for ring in keepouts:
+            draw.polygon(local(ring), outline=(128, 128, 128))
+        
+        # Etichetta area
+        x, y = local(points[:1])[0]
+        draw.text((x, y-15), label, fill=color)
+        return (x0, y0), layer
     
     def draw_areas(self, areas):
-        """Disegna le aree selezionate"""
-        img = self.display_image.copy()
+        """
+        Disegna le aree selezionate
+
+        Ogni area è disegnata una volta su un proprio livello RGBA, riusato finché
+        non cambiano punti, fori o colore; l'immagine composta resta in memoria
+        finché non cambiano il display o l'insieme degli overlay.
+        """
+        base = self.get_pil_image()
         colors = [
             (255, 0, 0),    # Red
             (0, 255, 0),    # Green
@@ -89,51 +344,41 @@ class BlueprintProcessor:
             (0, 255, 255),  # Yellow
         ]
         
-        pil_img = Image.fromarray(img)
-        from PIL import ImageDraw
-        draw = ImageDraw.Draw(pil_img)
+        keys = [self._overlay_key(area, idx, colors[idx % len(colors)]) for idx, area in enumerate(areas)]
+        if self._composite is not None and self._composite[0] == keys:
+            return self._composite[1]
         
-        for idx, area in enumerate(areas):
-            color = colors[idx % len(colors)]
-            if area['type'] == 'rectangle':
-                pts = area['points']
-                if len(pts) >= 2:
-                    pt1 = (int(pts[0][0]), int(pts[0][1]))
-                    pt2 = (int(pts[1][0]), int(pts[1][1]))
-                    draw.rectangle([pt1, pt2], outline=color, width=2)
-            elif area['type'] == 'polygon':
-                pts = [(int(p[0]), int(p[1])) for p in area['points']]
-                if len(pts) >= 2:
-                    draw.polygon(pts, outline=color)
-            
-            # Etichetta area
-            if area['points']:
-                x = int(area['points'][0][0])
-                y = int(area['points'][0][1])
-                draw.text((x, y-15), f"A{idx+1}", fill=color)
+        overlays = {}
+        for key in keys:
+            overlays[key] = self._overlays[key] if key in self._overlays else self._render_overlay(key)
+        # Restano in memoria solo gli overlay delle aree presenti
+        self._overlays = overlays
         
+        pil_img = base.copy()
+        for key in keys:
+            if overlays[key] is not None:
+                origin, layer = overlays[key]
+                pil_img.paste(layer, origin, layer)
+        self._composite = (keys, pil_img)
         return pil_img
 
 
 def convert_dwg_to_image(dwg_file):
-    """Converte DWG a immagine usando ezdxf"""
+    """Converte un DXF (o DWG esportato come DXF) a immagine, rasterizzando l'intero disegno"""
     try:
-        import ezdxf
-        doc = ezdxf.readfile(dwg_file)
-        # Semplice rendering - per soluzioni robuste usare librerie specializzate
-        st.warning("DWG support è semplificato. Usa JPG/PNG per migliori risultati.")
-        return None
+        from utils.dxf_drawing import DxfDrawing
+        image, _, _ = DxfDrawing(dwg_file).render()
+        return Image.fromarray(image)
     except Exception as e:
         st.error(f"Errore conversione DWG: {str(e)}")
         return None
 
 
-def convert_pdf_to_image(pdf_file):
-    """Converte prima pagina PDF a immagine"""
+def convert_pdf_to_image(pdf_file, page=1, dpi=None):
+    """Converte una pagina PDF (default la prima) a immagine, con cache per file, pagina e DPI"""
     try:
-        from pdf2image import convert_from_bytes
-        images = convert_from_bytes(pdf_file.read(), first_page=1, last_page=1)
-        return images[0] if images else None
+        from utils.pdf_pages import PdfPages
+        return PdfPages(pdf_file).render(page, dpi)
     except Exception as e:
         st.error(f"Errore conversione PDF: {str(e)}")
         return None
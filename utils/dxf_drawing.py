@@ -0,0 +1,550 @@
+import math
+import numpy as np
+
+import config
+
+try:
+    import cv2
+    HAS_CV2 = True
+except Exception:
+    # Catch broad exceptions (ImportError, OSError due to missing libGL, etc.)
+    HAS_CV2 = False
+
+# $INSUNITS → metri per unità di disegno (0 = senza unità)
+INSUNITS_METERS = {
+    1: 0.0254, 2: 0.3048, 3: 1609.344, 4: 0.001, 5: 0.01, 6: 1.0, 7: 1000.0,
+    8: 2.54e-8, 9: 2.54e-5, 10: 0.9144, 11: 1e-10, 12: 1e-9, 13: 1e-6,
+    14: 0.1, 15: 10.0, 16: 100.0, 17: 1e9, 18: 1.495978707e11, 19: 9.4607304725808e15,
+    20: 3.0856776e16, 21: 0.3048006096, 22: 0.0254000508, 23: 0.9144018288, 24: 1609.3472187,
+}
+
+# Entità lette direttamente dalla tabella dei tag; le altre curve passano da ezdxf una per una
+_CURVE_ENTITIES = ('HATCH', 'ELLIPSE', 'SPLINE')
+
+
+def _segments_from_points(points):
+    """Segmenti (N, 4) tra punti consecutivi di una spezzata"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return np.hstack([points[:-1], points[1:]])
+
+
+def _arc_segments(cx, cy, radius, start, sweep):
+    """
+    Archi approssimati da segmenti, tutti insieme
+
+    Args:
+        cx, cy, radius: centri e raggi (array)
+        start: angolo iniziale (radianti)
+        sweep: ampiezza con segno (radianti, positiva = antioraria)
+
+    Returns:
+        (segmenti (N, 4), indice dell'arco di ogni segmento)
+    """
+    count = np.maximum(1, np.ceil(np.abs(sweep) / (2 * math.pi) * config.DXF_ARC_SEGMENTS)).astype(np.int64)
+    arc = np.repeat(np.arange(len(count)), count)
+    step = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    t0 = start[arc] + sweep[arc] * step / count[arc]
+    t1 = start[arc] + sweep[arc] * (step + 1) / count[arc]
+    r = radius[arc]
+    segments = np.column_stack([cx[arc] + r * np.cos(t0), cy[arc] + r * np.sin(t0),
+                                cx[arc] + r * np.cos(t1), cy[arc] + r * np.sin(t1)])
+    return segments, arc
+
+
+def _polyline_segments(x, y, bulge, owner, closed):
+    """
+    Segmenti di polilinee con archi (bulge), tutte insieme
+
+    Args:
+        x, y, bulge: vertici in ordine e bulge del lato che parte dal vertice
+        owner: entità di ogni vertice (vertici della stessa entità contigui)
+        closed: array booleano per vertice, True se la sua polilinea è chiusa
+
+    Returns:
+        (segmenti (N, 4), entità di ogni segmento)
+    """
+    if len(x) == 0:
+        return np.empty((0, 4)), np.empty(0, dtype=np.int64)
+    first = np.flatnonzero(np.r_[True, owner[1:] != owner[:-1]])
+    last = np.r_[first[1:] - 1, len(x) - 1]
+    following = np.arange(1, len(x) + 1)
+    valid = np.ones(len(x), dtype=bool)
+    # L'ultimo vertice chiude sul primo solo nelle polilinee chiuse
+    following[last] = first
+    valid[last] = closed[last] & (last != first)
+    start = np.flatnonzero(valid)
+    end = following[start]
+
+    straight = bulge[start] == 0
+    s, e = start[straight], end[straight]
+    segments = [np.column_stack([x[s], y[s], x[e], y[e]])]
+    owners = [owner[s]]
+    s, e = start[~straight], end[~straight]
+    if len(s):
+        # Arco da p0 a p1 con angolo al centro 4·atan(bulge)
+        b = bulge[s]
+        dx, dy = x[e] - x[s], y[e] - y[s]
+        factor = (1.0 - b * b) / (4.0 * b)
+        cx = (x[s] + x[e]) / 2 - dy * factor
+        cy = (y[s] + y[e]) / 2 + dx * factor
+        radius = np.hypot(x[s] - cx, y[s] - cy)
+        arcs, arc = _arc_segments(cx, cy, radius, np.arctan2(y[s] - cy, x[s] - cx), 4.0 * np.arctan(b))
+        segments.append(arcs)
+        owners.append(owner[s][arc])
+    return np.vstack(segments), np.concatenate(owners)
+
+
+class _Tags:
+    """
+    Tabella dei tag di un DXF ASCII (codice di gruppo, valore) in array NumPy
+
+    Ogni tag conosce l'entità a cui appartiene (l'ultimo tag con codice 0), così
+    i campi di tutte le entità di un tipo si leggono con una sola selezione.
+    """
+
+    def __init__(self, text):
+        lines = text.splitlines()
+        lines = lines[:len(lines) - len(lines) % 2]
+        self.lines = lines
+        self.codes = np.fromiter(map(int, lines[0::2]), dtype=np.int32, count=len(lines) // 2)
+        # Valori non ripuliti: float() e int() ignorano gli spazi, le stringhe si ripuliscono solo se lette
+        self.values = np.array(lines[1::2], dtype=object)
+        self.starts = np.flatnonzero(self.codes == 0)
+        self.kinds = np.array([v.strip() for v in self.values[self.starts]], dtype=object)
+        self.owner = np.full(len(self.codes), -1, dtype=np.int64)
+        if len(self.starts):
+            lengths = np.diff(np.r_[self.starts, len(self.codes)])
+            self.owner[self.starts[0]:] = np.repeat(np.arange(len(self.starts)), lengths)
+        self._by_code = {}
+        self._first = {}
+
+    def tags(self, code):
+        """(entità, valori, posizioni) di tutti i tag con il codice dato, in ordine di file"""
+        if code not in self._by_code:
+            index = np.flatnonzero(self.codes == code)
+            self._by_code[code] = (self.owner[index], self.values[index], index)
+        return self._by_code[code]
+
+    def field(self, code, entities, default=np.nan, dtype=np.float64):
+        """Primo valore del codice per ciascuna entità (default se manca)"""
+        owner, values, _ = self.tags(code)
+        out = np.full(len(entities), default, dtype=dtype)
+        if len(owner) == 0 or len(entities) == 0:
+            return out
+        if code not in self._first:
+            self._first[code] = np.unique(owner, return_index=True)
+        unique, first = self._first[code]
+        pos = np.searchsorted(unique, entities).clip(max=len(unique) - 1)
+        found = unique[pos] == entities
+        selected = values[first[pos[found]]]
+        out[found] = [v.strip() for v in selected] if dtype is object else selected.astype(dtype)
+        return out
+
+    def text(self, entity):
+        """Testo DXF della sola entità (per caricarla con ezdxf)"""
+        start = self.starts[entity]
+        end = self.starts[entity + 1] if entity + 1 < len(self.starts) else len(self.codes)
+        return "\n".join(self.lines[2 * start:2 * end]) + "\n"
+
+    def header(self, name):
+        """Valore della variabile di intestazione ($INSUNITS, ...) o None"""
+        _, values, index = self.tags(9)
+        hits = index[np.array([v.strip() == name for v in values], dtype=bool)]
+        if len(hits) == 0 or hits[0] + 1 >= len(self.codes):
+            return None
+        return self.values[hits[0] + 1].strip()
+
+
+class _GridIndex:
+    """
+    Indice a griglia uniforme sui segmenti
+
+    Ogni cella elenca (formato CSR) i segmenti il cui ingombro la tocca; i
+    segmenti che coprono troppe celle stanno in un elenco a parte, sempre
+    controllato.
+    """
+
+    def __init__(self, segments):
+        self.boxes = np.column_stack([np.minimum(segments[:, 0], segments[:, 2]),
+                                      np.minimum(segments[:, 1], segments[:, 3]),
+                                      np.maximum(segments[:, 0], segments[:, 2]),
+                                      np.maximum(segments[:, 1], segments[:, 3])])
+        n = len(segments)
+        if n:
+            self.x0, self.y0 = self.boxes[:, 0].min(), self.boxes[:, 1].min()
+            width = max(self.boxes[:, 2].max() - self.x0, 1e-9)
+            height = max(self.boxes[:, 3].max() - self.y0, 1e-9)
+        else:
+            self.x0 = self.y0 = 0.0
+            width = height = 1.0
+        # Celle quadrate, in numero tale da avere pochi segmenti per cella (al più 2048 per lato)
+        cells = max(1, n // config.DXF_INDEX_CELL_ITEMS)
+        self.cell = max(math.sqrt(width * height / cells), max(width, height) / 2048)
+        self.nx = max(1, int(math.ceil(width / self.cell)))
+        self.ny = max(1, int(math.ceil(height / self.cell)))
+
+        cx0, cy0, cx1, cy1 = self._cells(self.boxes)
+        wide = cx1 - cx0 + 1
+        span = wide * (cy1 - cy0 + 1)
+        large = span > config.DXF_INDEX_MAX_SPAN
+        self.large = np.flatnonzero(large)
+        span = np.where(large, 0, span)
+        segment = np.repeat(np.arange(n), span)
+        k = np.arange(span.sum()) - np.repeat(np.cumsum(span) - span, span)
+        cell = (cy0[segment] + k // wide[segment]) * self.nx + cx0[segment] + k % wide[segment]
+        order = np.argsort(cell, kind='stable')
+        self.items = segment[order]
+        self.indptr = np.r_[0, np.cumsum(np.bincount(cell, minlength=self.nx * self.ny))]
+
+    def _cells(self, boxes):
+        clip = lambda v, n: np.clip(np.floor(v).astype(np.int64), 0, n - 1)
+        return (clip((boxes[:, 0] - self.x0) / self.cell, self.nx), clip((boxes[:, 1] - self.y0) / self.cell, self.ny),
+                clip((boxes[:, 2] - self.x0) / self.cell, self.nx), clip((boxes[:, 3] - self.y0) / self.cell, self.ny))
+
+    def query(self, x0, y0, x1, y1):
+        """Indici dei segmenti il cui ingombro interseca il rettangolo"""
+        cx0, cy0, cx1, cy1 = (int(v[0]) for v in self._cells(np.array([[x0, y0, x1, y1]], dtype=np.float64)))
+        # Una fetta contigua dell'indice per ogni riga di celle
+        parts = [self.items[self.indptr[row * self.nx + cx0]:self.indptr[row * self.nx + cx1 + 1]]
+                 for row in range(cy0, cy1 + 1)]
+        candidates = np.unique(np.concatenate(parts + [self.large]))
+        b = self.boxes[candidates]
+        hit = (b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0)
+        return candidates[hit]
+
+
+def _draw_segments(image, points, color):
+    """Disegna segmenti (N, 4) in pixel su un'immagine RGB"""
+    if len(points) == 0:
+        return
+    if HAS_CV2:
+        # Coordinate a virgola fissa (4 bit frazionari) per non perdere la precisione sub-pixel
+        fixed = np.round(points * 16).clip(-2**27, 2**27).astype(np.int32).reshape(-1, 2, 2)
+        cv2.polylines(image, list(fixed), False, color, 1, cv2.LINE_8, shift=4)
+        return
+    # Fallback NumPy: campionamento di ogni segmento a passo di un pixel
+    h, w = image.shape[:2]
+    for chunk in range(0, len(points), 65536):
+        p = points[chunk:chunk + 65536]
+        steps = np.ceil(np.maximum(np.abs(p[:, 2] - p[:, 0]), np.abs(p[:, 3] - p[:, 1]))).astype(np.int64) + 1
+        steps = np.minimum(steps, 2 * (w + h))
+        segment = np.repeat(np.arange(len(p)), steps)
+        t = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / np.maximum(steps - 1, 1)[segment]
+        x = np.round(p[segment, 0] + (p[segment, 2] - p[segment, 0]) * t).astype(np.int64)
+        y = np.round(p[segment, 1] + (p[segment, 3] - p[segment, 1]) * t).astype(np.int64)
+        inside = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+        image[y[inside], x[inside]] = color
+
+
+class DxfDrawing:
+    """
+    Disegno DXF vettoriale: segmenti dello spazio modello con indice spaziale
+
+    Il file ASCII è letto in un'unica passata come tabella di tag; LINE,
+    LWPOLYLINE, POLYLINE, ARC e CIRCLE sono convertiti in segmenti tutti
+    insieme per tipo, i blocchi (INSERT, anche annidati e a serie) sono esplosi
+    trasformando in blocco i segmenti della definizione. HATCH, ELLIPSE e SPLINE
+    passano da ezdxf entità per entità; i DXF binari sono letti interamente con
+    ezdxf.
+    """
+
+    def __init__(self, source):
+        """
+        Args:
+            source: percorso, bytes o file caricato (DXF ASCII o binario)
+        """
+        if isinstance(source, str):
+            with open(source, 'rb') as f:
+                data = f.read()
+        elif hasattr(source, 'getvalue'):
+            data = source.getvalue()
+        elif hasattr(source, 'read'):
+            data = source.read()
+        else:
+            data = bytes(source)
+
+        if data.startswith(b'AutoCAD Binary DXF'):
+            self.segments, units = self._load_with_ezdxf(data)
+        else:
+            self.segments, units = self._load_tags(_Tags(data.decode('utf-8', errors='replace')))
+        self.meters_per_unit = INSUNITS_METERS.get(units)
+        self.index = _GridIndex(self.segments)
+        if len(self.segments):
+            b = self.index.boxes
+            self.extents = (b[:, 0].min(), b[:, 1].min(), b[:, 2].max(), b[:, 3].max())
+        else:
+            self.extents = (0.0, 0.0, 1.0, 1.0)
+
+    # ------------------------------------------------------------------ lettura
+
+    def _load_tags(self, tags):
+        kinds = tags.kinds
+        n = len(kinds)
+        entity = np.arange(n)
+
+        # Sezione e blocco di appartenenza di ogni entità
+        section_start = np.flatnonzero(kinds == 'SECTION')
+        section_name = tags.field(2, section_start, default='', dtype=object)
+        section = np.full(n, '', dtype=object)
+        pos = np.searchsorted(section_start, entity, side='right') - 1
+        section[pos >= 0] = section_name[pos[pos >= 0]]
+
+        block_start = np.flatnonzero((kinds == 'BLOCK') & (section == 'BLOCKS'))
+        block_names = list(tags.field(2, block_start, default='', dtype=object))
+        block_base = np.column_stack([tags.field(10, block_start, 0.0), tags.field(20, block_start, 0.0)])
+        group = np.full(n, -2, dtype=np.int64)          # -2 = non disegnata
+        paper = tags.field(67, entity, 0, dtype=np.int64) == 1
+        group[(section == 'ENTITIES') & ~paper] = -1     # -1 = spazio modello
+        in_blocks = (section == 'BLOCKS') & ~np.isin(kinds, ('BLOCK', 'ENDBLK'))
+        pos = np.searchsorted(block_start, entity, side='right') - 1
+        group[in_blocks & (pos >= 0)] = pos[in_blocks & (pos >= 0)]
+
+        # Estrusione (0, 0, -1): sistema di coordinate dell'oggetto specchiato in x
+        mirror = tags.field(230, entity, 1.0) < 0
+        pieces = []                                      # (segmenti, gruppo di ogni segmento)
+
+        def select(*names):
+            return np.flatnonzero(np.isin(kinds, names) & (group >= -1))
+
+        lines = select('LINE')
+        if len(lines):
+            pieces.append((np.column_stack([tags.field(c, lines, 0.0) for c in (10, 20, 11, 21)]), group[lines]))
+
+        arcs = select('ARC', 'CIRCLE')
+        if len(arcs):
+            circle = kinds[arcs] == 'CIRCLE'
+            a0 = np.where(circle, 0.0, tags.field(50, arcs, 0.0))
+            sweep = np.where(circle, 360.0, (tags.field(51, arcs, 360.0) - a0) % 360.0)
+            sweep[sweep == 0] = 360.0
+            segments, arc = _arc_segments(tags.field(10, arcs, 0.0), tags.field(20, arcs, 0.0),
+                                          tags.field(40, arcs, 0.0), np.radians(a0), np.radians(sweep))
+            pieces.append((self._mirror(segments, mirror[arcs][arc]), group[arcs][arc]))
+
+        pieces.append(self._lwpolylines(tags, select('LWPOLYLINE'), group, mirror))
+        pieces.append(self._polylines(tags, group, mirror))
+        pieces.extend(self._curves(tags, select(*_CURVE_ENTITIES), group))
+
+        segments = np.vstack([p[0] for p in pieces if len(p[0])] or [np.empty((0, 4))])
+        owners = np.concatenate([p[1] for p in pieces if len(p[0])] or [np.empty(0, dtype=np.int64)])
+
+        inserts = select('INSERT')
+        insert_data = {
+            'group': group[inserts],
+            'block': np.array([block_names.index(name) if name in block_names else -1
+                               for name in tags.field(2, inserts, default='', dtype=object)], dtype=np.int64),
+            'x': tags.field(10, inserts, 0.0), 'y': tags.field(20, inserts, 0.0),
+            'sx': tags.field(41, inserts, 1.0), 'sy': tags.field(42, inserts, 1.0),
+            'rotation': np.radians(tags.field(50, inserts, 0.0)),
+            'columns': tags.field(70, inserts, 1, dtype=np.int64), 'rows': tags.field(71, inserts, 1, dtype=np.int64),
+            'column_spacing': tags.field(44, inserts, 0.0), 'row_spacing': tags.field(45, inserts, 0.0),
+            'mirror': mirror[inserts],
+        }
+        segments = self._explode(segments, owners, block_base, insert_data)
+        units = tags.header('$INSUNITS')
+        return segments, int(units) if units is not None else None
+
+    @staticmethod
+    def _mirror(segments, flags):
+        segments[flags, 0] *= -1
+        segments[flags, 2] *= -1
+        return segments
+
+    def _lwpolylines(self, tags, polylines, group, mirror):
+        """Segmenti di tutte le LWPOLYLINE: vertici e bulge letti per codice"""
+        if len(polylines) == 0:
+            return np.empty((0, 4)), np.empty(0, dtype=np.int64)
+        is_poly = np.zeros(len(tags.kinds), dtype=bool)
+        is_poly[polylines] = True
+        owner_x, values_x, index_x = tags.tags(10)
+        owner_y, values_y, _ = tags.tags(20)
+        keep_x, keep_y = is_poly[owner_x.clip(min=0)] & (owner_x >= 0), is_poly[owner_y.clip(min=0)] & (owner_y >= 0)
+        owner = owner_x[keep_x]
+        x = values_x[keep_x].astype(np.float64)
+        y = values_y[keep_y].astype(np.float64)
+        # Il bulge (42) segue il suo vertice: indice = numero di vertici già letti - 1
+        bulge = np.zeros(len(x))
+        owner_b, values_b, index_b = tags.tags(42)
+        keep_b = is_poly[owner_b.clip(min=0)] & (owner_b >= 0)
+        vertex = np.searchsorted(index_x[keep_x], index_b[keep_b], side='right') - 1
+        bulge[vertex] = values_b[keep_b].astype(np.float64)
+        closed = (tags.field(70, polylines, 0, dtype=np.int64) & 1).astype(bool)
+        closed_by_entity = np.zeros(len(tags.kinds), dtype=bool)
+        closed_by_entity[polylines] = closed
+        segments, seg_owner = _polyline_segments(x, y, bulge, owner, closed_by_entity[owner])
+        return self._mirror(segments, mirror[seg_owner]), group[seg_owner]
+
+    def _polylines(self, tags, group, mirror):
+        """Segmenti delle POLYLINE 2D (vertici come entità VERTEX fino a SEQEND)"""
+        kinds = tags.kinds
+        polylines = np.flatnonzero(kinds == 'POLYLINE')
+        heads = polylines[group[polylines] >= -1]
+        heads = heads[(tags.field(70, heads, 0, dtype=np.int64) & (16 | 64)) == 0]   # niente mesh e polyface
+        if len(heads) == 0:
+            return np.empty((0, 4)), np.empty(0, dtype=np.int64)
+        # Ogni VERTEX appartiene all'ultima POLYLINE prima di lui, se non c'è un SEQEND in mezzo
+        markers = np.sort(np.r_[polylines, np.flatnonzero(kinds == 'SEQEND')])
+        vertices = np.flatnonzero(kinds == 'VERTEX')
+        pos = np.searchsorted(markers, vertices, side='right') - 1
+        owner = markers[pos.clip(min=0)]
+        valid = (pos >= 0) & np.isin(owner, heads)
+        valid &= (tags.field(70, vertices, 0, dtype=np.int64) & (16 | 128)) == 0
+        vertices, owner = vertices[valid], owner[valid]
+        closed = np.zeros(len(kinds), dtype=bool)
+        closed[heads] = (tags.field(70, heads, 0, dtype=np.int64) & 1).astype(bool)
+        segments, seg_owner = _polyline_segments(tags.field(10, vertices, 0.0), tags.field(20, vertices, 0.0),
+                                                 tags.field(42, vertices, 0.0), owner, closed[owner])
+        return self._mirror(segments, mirror[seg_owner]), group[seg_owner]
+
+    @staticmethod
+    def _curves(tags, entities, group):
+        """HATCH (contorni), ELLIPSE e SPLINE caricate una per una con ezdxf"""
+        if len(entities) == 0:
+            return []
+        from ezdxf import path as ezpath
+        from ezdxf.entities import factory
+        from ezdxf.lldxf.extendedtags import ExtendedTags
+        pieces = []
+        for entity in entities:
+            try:
+                curve = factory.load(ExtendedTags.from_text(tags.text(entity)))
+                paths = ezpath.from_hatch(curve) if curve.dxftype() == 'HATCH' else [ezpath.make_path(curve)]
+                for p in paths:
+                    box = ezpath.bbox([p])
+                    if not box.has_data:
+                        continue
+                    # Scarto dalla curva confrontabile con quello degli archi a DXF_ARC_SEGMENTS lati
+                    tolerance = max(box.size.x, box.size.y) / (8 * config.DXF_ARC_SEGMENTS)
+                    points = [(v.x, v.y) for v in p.flattening(max(tolerance, 1e-9), segments=4)]
+                    if len(points) > 1:
+                        segments = _segments_from_points(points)
+                        pieces.append((segments, np.full(len(segments), group[entity])))
+            except Exception:
+                # Una curva illeggibile non deve impedire l'apertura della planimetria
+                continue
+        return pieces
+
+    @staticmethod
+    def _explode(segments, owners, block_base, inserts):
+        """
+        Segmenti dello spazio modello con i blocchi esplosi
+
+        I segmenti di ogni definizione di blocco (con i suoi blocchi annidati)
+        sono calcolati una volta e trasformati per tutti i suoi inserimenti con
+        un'unica operazione.
+        """
+        resolved = {}
+
+        def block_segments(block, depth=0):
+            if block in resolved:
+                return resolved[block]
+            if depth > config.DXF_MAX_BLOCK_DEPTH:
+                return np.empty((0, 4))
+            local = segments[owners == block] - np.tile(block_base[block], 2)
+            resolved[block] = place(local, block, depth)
+            return resolved[block]
+
+        def place(own, container, depth):
+            parts = [own]
+            for child in np.unique(inserts['block'][inserts['group'] == container]):
+                if child < 0:
+                    continue
+                geometry = block_segments(child, depth + 1)
+                if len(geometry) == 0:
+                    continue
+                sel = np.flatnonzero((inserts['group'] == container) & (inserts['block'] == child))
+                parts.append(_transform(geometry, {k: v[sel] for k, v in inserts.items()}))
+            total = sum(len(p) for p in parts)
+            if total > config.DXF_MAX_SEGMENTS:
+                raise ValueError(f"Disegno troppo complesso: {total} segmenti (max {config.DXF_MAX_SEGMENTS})")
+            return np.vstack(parts)
+
+        return place(segments[owners == -1], -1, 0)
+
+    @staticmethod
+    def _load_with_ezdxf(data):
+        """DXF binario: lettura completa con ezdxf e scomposizione in primitive"""
+        import os
+        import tempfile
+        import ezdxf
+        from ezdxf import disassemble
+        handle, path = tempfile.mkstemp(suffix='.dxf')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                f.write(data)
+            doc = ezdxf.readfile(path)
+        finally:
+            os.remove(path)
+        pieces = []
+        for primitive in disassemble.to_primitives(disassemble.recursive_decompose(doc.modelspace())):
+            points = [(v.x, v.y) for v in primitive.vertices()]
+            if len(points) > 1:
+                pieces.append(_segments_from_points(points))
+        segments = np.vstack(pieces) if pieces else np.empty((0, 4))
+        return segments, doc.header.get('$INSUNITS')
+
+    # --------------------------------------------------------------- rendering
+
+    def pixels_per_meter(self, pixels_per_unit):
+        """Scala px/m di un raster a pixels_per_unit, o None se il DXF non dichiara le unità"""
+        if not self.meters_per_unit:
+            return None
+        return pixels_per_unit / self.meters_per_unit
+
+    def render(self, viewport=None, max_width=None, max_height=None, pixels_per_unit=None, margin=0.02):
+        """
+        Rasterizza solo i segmenti visibili nella finestra
+
+        Args:
+            viewport: (x0, y0, x1, y1) in unità di disegno (default: estensione con margine)
+            max_width, max_height: dimensione massima del raster in pixel
+                (default config.DXF_RENDER_MAX_PX)
+            pixels_per_unit: scala esplicita (prevale su max_width/max_height)
+            margin: margine attorno all'estensione, in frazione (solo senza viewport)
+
+        Returns:
+            (immagine RGB (H, W, 3) uint8, pixels_per_unit, viewport)
+        """
+        if viewport is None:
+            x0, y0, x1, y1 = self.extents
+            pad = max(x1 - x0, y1 - y0) * margin
+            viewport = (x0 - pad, y0 - pad, x1 + pad, y1 + pad)
+        x0, y0, x1, y1 = viewport
+        width, height = max(x1 - x0, 1e-9), max(y1 - y0, 1e-9)
+        if pixels_per_unit is None:
+            max_width = max_width or config.DXF_RENDER_MAX_PX
+            max_height = max_height or config.DXF_RENDER_MAX_PX
+            pixels_per_unit = min(max_width / width, max_height / height)
+        size = (max(1, int(round(width * pixels_per_unit))), max(1, int(round(height * pixels_per_unit))))
+
+        visible = self.index.query(x0, y0, x1, y1)
+        s = self.segments[visible]
+        # Asse y del disegno verso l'alto, del raster verso il basso
+        points = np.column_stack([(s[:, 0] - x0) * pixels_per_unit, (y1 - s[:, 1]) * pixels_per_unit,
+                                  (s[:, 2] - x0) * pixels_per_unit, (y1 - s[:, 3]) * pixels_per_unit])
+        image = np.full((size[1], size[0], 3), 255, dtype=np.uint8)
+        _draw_segments(image, points, (0, 0, 0))
+        return image, pixels_per_unit, viewport
+
+
+def _transform(geometry, inserts):
+    """Segmenti di un blocco (già riferiti al punto base) per ogni inserimento, serie comprese"""
+    columns = np.maximum(inserts['columns'], 1)
+    rows = np.maximum(inserts['rows'], 1)
+    copies = columns * rows
+    which = np.repeat(np.arange(len(copies)), copies)
+    k = np.arange(copies.sum()) - np.repeat(np.cumsum(copies) - copies, copies)
+    col, row = k % columns[which], k // columns[which]
+    cos_r, sin_r = np.cos(inserts['rotation'][which]), np.sin(inserts['rotation'][which])
+    # La spaziatura della serie è ruotata con il blocco ma non scalata
+    ox = col * inserts['column_spacing'][which]
+    oy = row * inserts['row_spacing'][which]
+    tx = inserts['x'][which] + ox * cos_r - oy * sin_r
+    ty = inserts['y'][which] + ox * sin_r + oy * cos_r
+    sx, sy = inserts['sx'][which], inserts['sy'][which]
+
+    gx = geometry[None, :, 0::2] * sx[:, None, None]
+    gy = geometry[None, :, 1::2] * sy[:, None, None]
+    x = tx[:, None, None] + gx * cos_r[:, None, None] - gy * sin_r[:, None, None]
+    y = ty[:, None, None] + gx * sin_r[:, None, None] + gy * cos_r[:, None, None]
+    x = np.where(inserts['mirror'][which][:, None, None], -x, x)
+    return np.stack([x[..., 0], y[..., 0], x[..., 1], y[..., 1]], axis=-1).reshape(-1, 4)
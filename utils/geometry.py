@@ -0,0 +1,332 @@
+import numpy as np
+
+import config
+
+# Byte stimati per coppia punto × lato durante il test vettoriale
+_BYTES_PER_PAIR = 48
+
+
+def area_polygon(area, pixels_per_meter=None):
+    """
+    Converte i punti di un'area (coordinate display in pixel) in un poligono in metri
+
+    Args:
+        area: dict area con 'points' e 'type' ('rectangle' definito da due angoli)
+        pixels_per_meter: scala; se assente si assume 1 px = 1 m
+
+    Returns:
+        lista di [(x, y), ...] in metri
+    """
+    pts = area.get('points', [])
+    scale = 1.0 / pixels_per_meter if pixels_per_meter and pixels_per_meter > 0 else 1.0
+    if len(pts) == 2:
+        # Rettangolo definito da due angoli opposti
+        (x0, y0), (x1, y1) = pts[0], pts[1]
+        pts = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+    return [(p[0] * scale, p[1] * scale) for p in pts]
+
+
+def polygon_area(points):
+    """Area di un poligono (formula di Gauss / shoelace)"""
+    if len(points) < 3:
+        return 0.0
+    pts = np.asarray(points, dtype=np.float64)
+    x, y = pts[:, 0], pts[:, 1]
+    return float(abs(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2.0)
+
+
+def polygon_perimeter(points):
+    """Perimetro di un poligono chiuso"""
+    if len(points) < 2:
+        return 0.0
+    pts = np.asarray(points, dtype=np.float64)
+    return float(np.hypot(*(np.roll(pts, -1, axis=0) - pts).T).sum())
+
+
+def point_in_polygon(point, polygon):
+    """Ray casting algorithm per verificare se punto è dentro poligono"""
+    x, y = point
+    n = len(polygon)
+    inside = False
+
+    p1x, p1y = polygon[0]
+    for i in range(1, n + 1):
+        p2x, p2y = polygon[i % n]
+        if y > min(p1y, p2y):
+            if y <= max(p1y, p2y):
+                if x <= max(p1x, p2x):
+                    if p1y != p2y:
+                        xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+                    if p1x == p2x or x <= xinters:
+                        inside = not inside
+        p1x, p1y = p2x, p2y
+
+    return inside
+
+
+class EdgeTable:
+    """
+    Tabella dei lati di uno o più anelli ordinata per fasce orizzontali
+
+    Le quote y dei vertici dividono il piano in fasce; in ogni fascia i lati
+    attraversati sono sempre gli stessi e sono memorizzati in una matrice
+    (fasce × lati attivi). Un punto è confrontato solo con i lati della propria
+    fascia, trovata con una ricerca binaria: la tabella si costruisce una volta
+    per area e il test non ripercorre l'elenco dei vertici.
+    I lati orizzontali sono scartati: il raggio orizzontale non li attraversa mai.
+    """
+
+    def __init__(self, rings):
+        p1s, p2s = [], []
+        for ring in rings:
+            pts = np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+            if pts.shape[0] < 2:
+                continue
+            p1s.append(pts)
+            p2s.append(np.roll(pts, -1, axis=0))
+        p1 = np.concatenate(p1s) if p1s else np.zeros((0, 2))
+        p2 = np.concatenate(p2s) if p2s else np.zeros((0, 2))
+        keep = p1[:, 1] != p2[:, 1]
+        p1, p2 = p1[keep], p2[keep]
+        y_min = np.minimum(p1[:, 1], p2[:, 1])
+        y_max = np.maximum(p1[:, 1], p2[:, 1])
+
+        self.breaks = np.unique(np.concatenate([y_min, y_max]))
+        n_slabs = max(0, self.breaks.size - 1)
+        # Ogni lato copre le fasce da quella del suo y_min a quella prima del suo y_max
+        first = np.searchsorted(self.breaks, y_min)
+        last = np.searchsorted(self.breaks, y_max)
+        counts = last - first
+        edge_ids = np.repeat(np.arange(p1.shape[0]), counts)
+        slab_ids = np.repeat(first, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+        order = np.lexsort((np.maximum(p1[edge_ids, 0], p2[edge_ids, 0]), slab_ids))
+        edge_ids, slab_ids = edge_ids[order], slab_ids[order]
+        per_slab = np.bincount(slab_ids, minlength=n_slabs)
+        width = int(per_slab.max()) if per_slab.size else 0
+        column = np.arange(slab_ids.size) - np.repeat(np.cumsum(per_slab) - per_slab, per_slab)
+
+        # Matrici (fasce × lati attivi); i posti vuoti hanno x_max = -inf e non sono mai attraversati
+        self.x1 = np.zeros((n_slabs, width))
+        self.y1 = np.zeros((n_slabs, width))
+        self.x2 = np.zeros((n_slabs, width))
+        self.y2 = np.ones((n_slabs, width))
+        self.x_max = np.full((n_slabs, width), -np.inf)
+        self.vertical = np.zeros((n_slabs, width), dtype=bool)
+        self.x1[slab_ids, column] = p1[edge_ids, 0]
+        self.y1[slab_ids, column] = p1[edge_ids, 1]
+        self.x2[slab_ids, column] = p2[edge_ids, 0]
+        self.y2[slab_ids, column] = p2[edge_ids, 1]
+        self.x_max[slab_ids, column] = np.maximum(p1[edge_ids, 0], p2[edge_ids, 0])
+        self.vertical[slab_ids, column] = p1[edge_ids, 0] == p2[edge_ids, 0]
+
+    def contains(self, points, memory_budget_mb=None):
+        """
+        Test pari-dispari vettoriale: True per i punti dentro (numero dispari di attraversamenti)
+
+        Stesse condizioni (e stesse operazioni in virgola mobile) di point_in_polygon,
+        quindi i risultati coincidono punto per punto.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        inside = np.zeros(points.shape[0], dtype=bool)
+        width = self.x1.shape[1] if self.x1.ndim == 2 else 0
+        if width == 0 or points.shape[0] == 0:
+            return inside
+
+        budget = (memory_budget_mb or config.ILLUMINANCE_MEMORY_MB) * 1024 * 1024
+        block = max(1, int(budget // (width * _BYTES_PER_PAIR)))
+        n_slabs = self.x1.shape[0]
+        for start in range(0, points.shape[0], block):
+            x = points[start:start + block, 0]
+            y = points[start:start + block, 1]
+            # Fascia k: breaks[k] < y <= breaks[k + 1]
+            slab = np.searchsorted(self.breaks, y, side='left') - 1
+            valid = (slab >= 0) & (slab < n_slabs)
+            idx = np.flatnonzero(valid)
+            if idx.size == 0:
+                continue
+            s = slab[idx]
+            xv = x[idx][:, None]
+            yv = y[idx][:, None]
+            y1, y2, x1 = self.y1[s], self.y2[s], self.x1[s]
+            x_inters = (yv - y1) * (self.x2[s] - x1) / (y2 - y1) + x1
+            crossing = (xv <= self.x_max[s]) & (self.vertical[s] | (xv <= x_inters))
+            inside[start + idx] = (np.count_nonzero(crossing, axis=1) % 2) == 1
+        return inside
+
+
+def polygon_edges(polygon, holes=()):
+    """
+    Tabella dei lati (EdgeTable) di un poligono ed eventuali fori, da costruire
+    una volta per area e riusare in points_in_polygon
+    """
+    return EdgeTable([polygon, *holes])
+
+
+def points_in_polygon(points, polygon=None, edges=None, memory_budget_mb=None):
+    """
+    Test pari-dispari vettoriale di molti punti
+
+    Args:
+        points: array (N, 2) di punti
+        polygon: lista di [(x, y), ...] o AreaShape (non serve se si passa edges)
+        edges: tabella precalcolata (polygon_edges) o AreaShape
+        memory_budget_mb: budget per gli array temporanei punti × lati
+
+    Returns:
+        array booleano (N,)
+    """
+    if edges is None:
+        edges = polygon if isinstance(polygon, AreaShape) else polygon_edges(polygon)
+    return edges.contains(points, memory_budget_mb)
+
+
+class AreaShape:
+    """
+    Area con contorno esterno, fori (pilastri, cavedi, vani scala) e zone escluse
+
+    Posizionamento, superficie e statistiche di illuminamento escludono fori e
+    zone escluse. Le tabelle dei lati sono costruite una volta alla creazione.
+    """
+
+    def __init__(self, outer, holes=(), keepouts=()):
+        self.outer = [tuple(p) for p in outer]
+        self.holes = [[tuple(p) for p in ring] for ring in holes if len(ring) >= 3]
+        self.keepouts = [[tuple(p) for p in ring] for ring in keepouts if len(ring) >= 3]
+        self.edges = polygon_edges(self.outer, self.holes)
+        # Una tabella per zona esclusa: possono sovrapporsi tra loro o ai fori
+        self.keepout_edges = [polygon_edges(ring) for ring in self.keepouts]
+
+    def contains(self, points, memory_budget_mb=None):
+        """True per i punti dentro il contorno e fuori da fori e zone escluse"""
+        inside = self.edges.contains(points, memory_budget_mb)
+        for table in self.keepout_edges:
+            inside &= ~table.contains(points, memory_budget_mb)
+        return inside
+
+    @property
+    def area(self):
+        """Superficie utile (m²): contorno meno fori e zone escluse"""
+        excluded = sum(polygon_area(ring) for ring in self.holes + self.keepouts)
+        return max(0.0, polygon_area(self.outer) - excluded)
+
+    @property
+    def perimeter(self):
+        """Perimetro del contorno e dei fori (pareti del locale)"""
+        return polygon_perimeter(self.outer) + sum(polygon_perimeter(ring) for ring in self.holes)
+
+    @property
+    def key(self):
+        """Chiave hashable della geometria (per le cache)"""
+        return (tuple(self.outer), tuple(map(tuple, self.holes)), tuple(map(tuple, self.keepouts)))
+
+
+def as_shape(polygon):
+    """Restituisce un AreaShape da un AreaShape o da una lista di punti"""
+    return polygon if isinstance(polygon, AreaShape) else AreaShape(polygon)
+
+
+def points_in_shapes(points, owners, shapes, memory_budget_mb=None):
+    """
+    Test di contenimento di punti appartenenti ad aree diverse in un'unica operazione
+
+    I lati di tutte le aree sono raccolti in una matrice (aree × lati, completata
+    con lati fittizi) e ogni punto è confrontato solo con quelli della propria area.
+    Ogni anello ha un bit: il contorno con i fori è il bit 0, le zone escluse i
+    successivi; lo XOR dei bit attraversati dà la parità di ogni anello.
+    Stesse operazioni di point_in_polygon, quindi stessi risultati di AreaShape.contains.
+
+    Args:
+        points: array (N, 2) di punti
+        owners: array (N,) con l'indice in shapes dell'area di ogni punto
+        shapes: lista di AreaShape (o liste di punti)
+        memory_budget_mb: budget per gli array temporanei punti × lati
+
+    Returns:
+        array booleano (N,)
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    owners = np.asarray(owners, dtype=np.int64)
+    shapes = [as_shape(shape) for shape in shapes]
+    inside = np.zeros(points.shape[0], dtype=bool)
+    if points.shape[0] == 0 or not shapes:
+        return inside
+
+    rings, ring_owner, ring_bit = [], [], []
+    for index, shape in enumerate(shapes):
+        if len(shape.keepouts) > 62:
+            raise ValueError("Troppe zone escluse in un'area (max 62)")
+        for bit, group in enumerate([[shape.outer, *shape.holes]] + [[ring] for ring in shape.keepouts]):
+            for ring in group:
+                if len(ring) >= 2:
+                    rings.append(np.asarray(ring, dtype=np.float64))
+                    ring_owner.append(index)
+                    ring_bit.append(1 << bit)
+    if not rings:
+        return inside
+
+    # Lati (p1 → p2) di tutti gli anelli: il successivo dell'ultimo vertice è il primo dell'anello
+    sizes = np.array([ring.shape[0] for ring in rings])
+    p1 = np.concatenate(rings)
+    ring_start = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    nxt = np.arange(p1.shape[0]) + 1
+    nxt = np.where(nxt - ring_start == np.repeat(sizes, sizes), ring_start, nxt)
+    p2 = p1[nxt]
+    edge_owner = np.repeat(ring_owner, sizes)
+    edge_bit = np.repeat(np.array(ring_bit, dtype=np.uint64), sizes)
+    keep = p1[:, 1] != p2[:, 1]
+    p1, p2, edge_owner, edge_bit = p1[keep], p2[keep], edge_owner[keep], edge_bit[keep]
+
+    order = np.argsort(edge_owner, kind='stable')
+    p1, p2, edge_owner, edge_bit = p1[order], p2[order], edge_owner[order], edge_bit[order]
+    per_shape = np.bincount(edge_owner, minlength=len(shapes))
+    width = int(per_shape.max()) if per_shape.size else 0
+    if width == 0:
+        return inside
+    column = np.arange(edge_owner.size) - np.repeat(np.cumsum(per_shape) - per_shape, per_shape)
+
+    # Posti vuoti: y_min = +inf, mai attraversati
+    y_min = np.full((len(shapes), width), np.inf)
+    y_max = np.zeros((len(shapes), width))
+    x_max = np.zeros((len(shapes), width))
+    x1 = np.zeros((len(shapes), width))
+    y1 = np.zeros((len(shapes), width))
+    x2 = np.zeros((len(shapes), width))
+    y2 = np.ones((len(shapes), width))
+    bits = np.zeros((len(shapes), width), dtype=np.uint64)
+    y_min[edge_owner, column] = np.minimum(p1[:, 1], p2[:, 1])
+    y_max[edge_owner, column] = np.maximum(p1[:, 1], p2[:, 1])
+    x_max[edge_owner, column] = np.maximum(p1[:, 0], p2[:, 0])
+    x1[edge_owner, column], y1[edge_owner, column] = p1[:, 0], p1[:, 1]
+    x2[edge_owner, column], y2[edge_owner, column] = p2[:, 0], p2[:, 1]
+    bits[edge_owner, column] = edge_bit
+
+    budget = (memory_budget_mb or config.ILLUMINANCE_MEMORY_MB) * 1024 * 1024
+    block = max(1, int(budget // (width * _BYTES_PER_PAIR)))
+    for start in range(0, points.shape[0], block):
+        o = owners[start:start + block]
+        x = points[start:start + block, 0][:, None]
+        y = points[start:start + block, 1][:, None]
+        ex1, ey1 = x1[o], y1[o]
+        x_inters = (y - ey1) * (x2[o] - ex1) / (y2[o] - ey1) + ex1
+        crossing = (y > y_min[o]) & (y <= y_max[o]) & (x <= x_max[o]) & ((ex1 == x2[o]) | (x <= x_inters))
+        parity = np.bitwise_xor.reduce(np.where(crossing, bits[o], np.uint64(0)), axis=1)
+        # Dentro il contorno (bit 0 dispari) e in nessuna zona esclusa
+        inside[start:start + block] = parity == 1
+    return inside
+
+
+def area_shape(area, pixels_per_meter=None):
+    """
+    Come area_polygon, ma include 'holes' e 'keepouts' dell'area (anelli in pixel)
+
+    Returns:
+        AreaShape in metri
+    """
+    scale = 1.0 / pixels_per_meter if pixels_per_meter and pixels_per_meter > 0 else 1.0
+    outer = area_polygon(area, pixels_per_meter)
+    rings = {}
+    for name in ('holes', 'keepouts'):
+        rings[name] = [area_polygon({'points': ring}, pixels_per_meter) if len(ring) == 2
+                       else [(p[0] * scale, p[1] * scale) for p in ring]
+                       for ring in area.get(name, [])]
+    return AreaShape(outer, rings['holes'], rings['keepouts'])
@@ -0,0 +1,690 @@
+import math
+import os
+import tempfile
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+import config
+from utils.geometry import as_shape
+from utils.photometry import beam_angles, intensity_at, interpolation_table
+from utils.radiosity import indirect_illuminance
+
+# Byte stimati per coppia lampada × punto durante il calcolo (array temporanei float64)
+_BYTES_PER_PAIR = 160
+
+
+def grid_spacing_for(polygon):
+    """
+    Passo della griglia di calcolo secondo UNI EN 12464-1:
+    p = 0.2 × 5^log10(d), con d dimensione maggiore dell'area (max 10 m)
+    """
+    pts = np.asarray(as_shape(polygon).outer, dtype=np.float64)
+    d = float(max(np.ptp(pts[:, 0]), np.ptp(pts[:, 1])))
+    if d <= 0:
+        return 1.0
+    return min(10.0, 0.2 * 5.0 ** math.log10(d))
+
+
+def calculation_grid(polygon, spacing=None):
+    """
+    Griglia di punti di calcolo al centro delle celle, limitata al poligono
+
+    Args:
+        polygon: lista di [(x, y), ...] in metri o AreaShape (fori e zone escluse
+            restano fuori dalla maschera e quindi dalle statistiche)
+        spacing: passo griglia in m (default: grid_spacing_for(polygon))
+
+    Returns:
+        (xs, ys, mask) con xs (nx,), ys (ny,) e mask booleana (ny, nx) dei punti interni
+    """
+    shape = as_shape(polygon)
+    spacing = spacing or grid_spacing_for(shape)
+    pts = np.asarray(shape.outer, dtype=np.float64)
+    min_x, min_y = pts.min(axis=0)
+    max_x, max_y = pts.max(axis=0)
+    nx = max(1, int(math.ceil((max_x - min_x) / spacing)))
+    ny = max(1, int(math.ceil((max_y - min_y) / spacing)))
+    # Celle distribuite uniformemente sull'ingombro, punto al centro di ogni cella
+    xs = min_x + (np.arange(nx) + 0.5) * (max_x - min_x) / nx
+    ys = min_y + (np.arange(ny) + 0.5) * (max_y - min_y) / ny
+    gx, gy = np.meshgrid(xs, ys)
+    mask = shape.contains(np.column_stack([gx.ravel(), gy.ravel()])).reshape(ny, nx)
+    return xs, ys, mask
+
+
+def _illuminance_kernel(photometry, lamps, points, height, cutoff=None):
+    """Contributo di tutte le lampade a un blocco di punti (operazione vettoriale L × P)"""
+    dx = points[None, :, 0] - lamps[:, None, 0]
+    dy = points[None, :, 1] - lamps[:, None, 1]
+    r = np.hypot(dx, dy)
+    gamma = np.degrees(np.arctan2(r, height))
+    c = np.degrees(np.arctan2(dy, dx))
+    intensity = intensity_at(photometry, c, gamma)
+    # cos³γ / h² = h / d³
+    d3 = (r * r + height * height) ** 1.5
+    contribution = intensity * (height / d3)
+    if cutoff is not None:
+        # Esclusione per coppia: il risultato non dipende dalla suddivisione in blocchi
+        contribution[r > cutoff] = 0.0
+    return contribution.sum(axis=0)
+
+
+def cutoff_radius(photometry, height, tolerance=None, n_lamps=1):
+    """
+    Distanza orizzontale oltre la quale il contributo di una lampada è trascurabile
+
+    Il raggio non è mai inferiore a quello del fascio di campo (10% Imax) e
+    garantisce che la somma dei contributi esclusi in un punto resti entro la
+    tolleranza: per ogni gamma si usa l'inviluppo max_C I(C, γ' ≥ γ) · cos³γ / h²
+    e il limite per lampada è tolerance / n_lamps.
+
+    Args:
+        photometry: dict fotometria con matrice intensità
+        height: distanza verticale lampade - piano di calcolo (m)
+        tolerance: errore massimo (lux) per punto (default config.ILLUMINANCE_CULL_TOLERANCE_LUX);
+            0 disattiva l'esclusione
+        n_lamps: numero di lampade del calcolo
+
+    Returns:
+        raggio in m (numpy.inf se nessuna lampada può essere esclusa)
+    """
+    if tolerance is None:
+        tolerance = config.ILLUMINANCE_CULL_TOLERANCE_LUX
+    if not tolerance or tolerance <= 0 or height <= 0:
+        return np.inf
+
+    _, gamma_grid, table = interpolation_table(photometry)
+    # Massimo sui piani C e poi su tutti i gamma successivi (inviluppo decrescente)
+    peak = table.max(axis=0)
+    tail = np.maximum.accumulate(peak[::-1])[::-1]
+    cos_gamma = np.clip(np.cos(np.radians(gamma_grid)), 0.0, None)
+    bound = tail * cos_gamma ** 3 / height ** 2
+    ok = bound <= tolerance / max(1, n_lamps)
+    if not ok.any():
+        return np.inf
+    gamma_cut = gamma_grid[ok.argmax()]
+    if gamma_cut >= 90.0:
+        return np.inf
+    radius = height * math.tan(math.radians(gamma_cut))
+    if gamma_grid[-1] < 90.0:
+        # Oltre l'ultimo gamma misurato l'intensità è nulla
+        radius = min(radius, height * math.tan(math.radians(gamma_grid[-1])))
+
+    # Mai dentro il fascio di campo
+    field = float(np.nanmax(beam_angles(photometry)['field']))
+    if field < 90.0:
+        radius = max(radius, height * math.tan(math.radians(field)))
+    return radius
+
+
+class LampGridIndex:
+    """
+    Indice a griglia uniforme delle posizioni lampade
+
+    Le lampade sono ordinate per cella (riga per riga): le lampade di un
+    intervallo di celle su una stessa riga sono contigue e una ricerca in un
+    rettangolo richiede una sola fetta per riga di celle.
+    """
+
+    def __init__(self, lamps, cell_size):
+        self.lamps = np.asarray(lamps, dtype=np.float64).reshape(-1, 2)
+        self.cell_size = float(cell_size)
+        self.origin = self.lamps.min(axis=0) if self.lamps.size else np.zeros(2)
+        cells = np.floor((self.lamps - self.origin) / self.cell_size).astype(np.int64)
+        self.shape = tuple(cells.max(axis=0) + 1) if self.lamps.size else (0, 0)
+        keys = cells[:, 1] * self.shape[0] + cells[:, 0] if self.lamps.size else np.zeros(0, np.int64)
+        self.order = np.argsort(keys, kind='stable')
+        counts = np.bincount(keys, minlength=self.shape[0] * self.shape[1])
+        self.starts = np.concatenate([[0], np.cumsum(counts)])
+
+    def query(self, min_x, min_y, max_x, max_y):
+        """Indici delle lampade nelle celle che intersecano il rettangolo"""
+        nx, ny = self.shape
+        if nx == 0:
+            return np.zeros(0, dtype=np.intp)
+        lo = np.floor((np.array([min_x, min_y]) - self.origin) / self.cell_size).astype(np.int64)
+        hi = np.floor((np.array([max_x, max_y]) - self.origin) / self.cell_size).astype(np.int64)
+        x0, y0 = max(lo[0], 0), max(lo[1], 0)
+        x1, y1 = min(hi[0], nx - 1), min(hi[1], ny - 1)
+        if x0 > x1 or y0 > y1:
+            return np.zeros(0, dtype=np.intp)
+        parts = [self.order[self.starts[row * nx + x0]:self.starts[row * nx + x1 + 1]]
+                 for row in range(y0, y1 + 1)]
+        return np.concatenate(parts)
+
+
+def tile_shape(n_lamps, tile_size=None, memory_budget_mb=None):
+    """
+    Dimensioni dei blocchi (punti per tile, lampade per blocco) che rispettano
+    il budget di memoria per gli array temporanei lampade × punti.
+    """
+    budget = (memory_budget_mb or config.ILLUMINANCE_MEMORY_MB) * 1024 * 1024
+    n_lamps = max(1, n_lamps)
+    if tile_size is None:
+        tile_size = config.ILLUMINANCE_TILE_POINTS or max(256, budget // (n_lamps * _BYTES_PER_PAIR))
+    tile_size = max(1, int(tile_size))
+    lamp_chunk = max(1, min(n_lamps, budget // (tile_size * _BYTES_PER_PAIR)))
+    return tile_size, lamp_chunk
+
+
+def direct_illuminance(photometry, lamps_xy, points_xy, height, tile_size=None, memory_budget_mb=None, out=None,
+                       cutoff=None):
+    """
+    Illuminamento orizzontale diretto punto per punto:
+    E = I(C, γ) · cos³γ / h²  sommato su tutte le lampade
+
+    Calcolato con operazioni vettoriali lampade × punti, a blocchi di punti
+    (e se necessario di lampade) così che la memoria di picco resti entro il
+    budget indipendentemente dalla dimensione dell'area.
+    Gli apparecchi sono orientati con il piano C0 lungo +X e C90 lungo +Y.
+
+    Args:
+        photometry: dict fotometria (parse_ldt / parse_ies)
+        lamps_xy: array (L, 2) posizioni lampade in m
+        points_xy: array (P, 2) punti di calcolo in m
+        height: distanza verticale lampade - piano di calcolo (m)
+        tile_size: punti per blocco (default calcolato dal budget)
+        memory_budget_mb: budget per gli array temporanei (default config.ILLUMINANCE_MEMORY_MB)
+        out: array (P,) opzionale in cui scrivere il risultato (es. numpy.memmap)
+        cutoff: raggio (m) oltre il quale i contributi sono esclusi (vedi cutoff_radius);
+            con un raggio finito i punti sono raggruppati per celle e ogni gruppo
+            valuta solo le lampade vicine trovate con LampGridIndex
+
+    Returns:
+        array (P,) di illuminamenti in lux
+    """
+    lamps = np.asarray(lamps_xy, dtype=np.float64).reshape(-1, 2)
+    points = np.asarray(points_xy, dtype=np.float64).reshape(-1, 2)
+    if out is None:
+        out = np.zeros(points.shape[0])
+    if lamps.shape[0] == 0 or points.shape[0] == 0 or height <= 0:
+        out[:] = 0.0
+        return out
+    if cutoff is not None and np.isfinite(cutoff):
+        return _culled_illuminance(photometry, lamps, points, height, cutoff, tile_size, memory_budget_mb, out)
+
+    tile, lamp_chunk = tile_shape(lamps.shape[0], tile_size, memory_budget_mb)
+    for start in range(0, points.shape[0], tile):
+        block = points[start:start + tile]
+        acc = np.zeros(block.shape[0])
+        for l0 in range(0, lamps.shape[0], lamp_chunk):
+            acc += _illuminance_kernel(photometry, lamps[l0:l0 + lamp_chunk], block, height)
+        out[start:start + block.shape[0]] = acc
+    return out
+
+
+def _culled_illuminance(photometry, lamps, points, height, cutoff, tile_size, memory_budget_mb, out):
+    """
+    direct_illuminance con esclusione spaziale: i punti sono raggruppati in celle
+    quadrate e per ogni cella si valutano solo le lampade entro il raggio
+    """
+    index = LampGridIndex(lamps, cutoff)
+    tile, _ = tile_shape(lamps.shape[0], tile_size, memory_budget_mb)
+    # Celle dei punti non più piccole del raggio né di un blocco di punti
+    origin = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - origin, 1e-9)
+    cell = max(cutoff, math.sqrt(extent[0] * extent[1] * tile / points.shape[0]))
+    cells = np.floor((points - origin) / cell).astype(np.int64)
+    keys = cells[:, 1] * (int(cells[:, 0].max()) + 1) + cells[:, 0]
+    order = np.argsort(keys, kind='stable')
+    bounds = np.flatnonzero(np.diff(keys[order])) + 1
+    bounds = np.concatenate([[0], bounds, [order.size]])
+
+    for g0, g1 in zip(bounds[:-1], bounds[1:]):
+        members = order[g0:g1]
+        group = points[members]
+        (min_x, min_y), (max_x, max_y) = group.min(axis=0), group.max(axis=0)
+        near = index.query(min_x - cutoff, min_y - cutoff, max_x + cutoff, max_y + cutoff)
+        if near.size == 0:
+            out[members] = 0.0
+            continue
+        near_lamps = lamps[near]
+        _, lamp_chunk = tile_shape(near.size, tile_size, memory_budget_mb)
+        for start in range(0, members.size, tile):
+            block = group[start:start + tile]
+            acc = np.zeros(block.shape[0])
+            for l0 in range(0, near.size, lamp_chunk):
+                acc += _illuminance_kernel(photometry, near_lamps[l0:l0 + lamp_chunk], block, height, cutoff)
+            out[members[start:start + block.shape[0]]] = acc
+    return out
+
+
+def create_grid_memmap(shape, directory=None):
+    """Array float64 su file temporaneo (numpy.memmap) per griglie molto grandi"""
+    directory = directory or config.ILLUMINANCE_MEMMAP_DIR
+    tmp = tempfile.NamedTemporaryFile(prefix='luxia_E_', suffix='.dat', dir=directory, delete=False)
+    tmp.close()
+    grid = np.memmap(tmp.name, dtype=np.float64, mode='w+', shape=shape)
+    # Il file temporaneo è rimosso quando la griglia non è più referenziata
+    weakref.finalize(grid, os.remove, tmp.name)
+    return grid
+
+
+class IlluminanceResult:
+    """
+    Griglia di illuminamento sul piano di calcolo con statistiche Em, Emin, Emax, U0
+
+    Conserva fotometria, lampade e altezza del calcolo: aggiungere, spostare o
+    rimuovere una lampada aggiorna la griglia sottraendo/sommando il solo
+    contributo di quella lampada (costo O(punti) invece di O(lampade × punti)).
+    """
+
+    def __init__(self, xs, ys, mask, E, stats=None, photometry=None, lamps=None, height=None,
+                 maintenance_factor=1.0, cutoff=None, indirect=None):
+        self.xs = xs
+        self.ys = ys
+        self.mask = mask
+        # Griglia (ny, nx) con NaN fuori dal poligono (può essere un numpy.memmap)
+        self.E = E
+        self.photometry = photometry
+        self.lamps = np.asarray(lamps if lamps is not None else [], dtype=np.float64).reshape(-1, 2)
+        self.height = height
+        self.maintenance_factor = maintenance_factor
+        # Raggio di esclusione usato nel calcolo, riapplicato ai contributi singoli
+        self.cutoff = cutoff
+        # Parametri della componente indiretta (radiosità) inclusa in E, se calcolata:
+        # dict con 'polygon', 'mounting_height', 'calc_plane_height', 'ceiling_height',
+        # 'reflectances' e 'values' (lux per punto interno)
+        self.indirect = indirect
+        # Stato per gli aggiornamenti incrementali, preparato alla prima modifica
+        self._values = None
+        self._contributions = OrderedDict()
+        if stats is None:
+            self._update_stats()
+        else:
+            self.Em, self.Emin, self.Emax, self.U0 = stats
+
+    def _update_stats(self):
+        values = self.E[self.mask]
+        if values.size == 0:
+            self.Em = self.Emin = self.Emax = self.U0 = 0.0
+            return
+        self.Em = float(values.mean())
+        self.Emin = float(values.min())
+        self.Emax = float(values.max())
+        self.U0 = self.Emin / self.Em if self.Em > 0 else 0.0
+
+    def summary(self):
+        """Statistiche come dict (per report e UI)"""
+        return {
+            'Em': self.Em,
+            'Emin': self.Emin,
+            'Emax': self.Emax,
+            'U0': self.U0,
+            'points': int(self.mask.sum()),
+        }
+
+    # ------------------------------------------------------------------
+    # Aggiornamenti incrementali
+    # ------------------------------------------------------------------
+
+    def _prepare_incremental(self):
+        if self.photometry is None or self.height is None:
+            raise ValueError("Risultato senza fotometria: aggiornamento incrementale non disponibile")
+        if self._values is not None:
+            return
+        self._flat = np.flatnonzero(self.mask)
+        iy, ix = np.unravel_index(self._flat, self.mask.shape)
+        self._points = np.column_stack([self.xs[ix], self.ys[iy]])
+        self._values = self.E.reshape(-1)[self._flat].astype(np.float64)
+        self._sum = float(self._values.sum())
+        self._argmin = int(self._values.argmin()) if self._values.size else 0
+        self._argmax = int(self._values.argmax()) if self._values.size else 0
+
+    def lamp_contribution(self, xy):
+        """Contributo (lux) di una lampada in xy su tutti i punti interni, con cache limitata"""
+        self._prepare_incremental()
+        key = (float(xy[0]), float(xy[1]))
+        cached = self._contributions.get(key)
+        if cached is not None:
+            self._contributions.move_to_end(key)
+            return cached
+        contribution = self.maintenance_factor * direct_illuminance(
+            self.photometry, [key], self._points, self.height, cutoff=self.cutoff)
+        self._contributions[key] = contribution
+        limit = max(1, config.ILLUMINANCE_CONTRIB_CACHE_MB * 1024 * 1024 // max(1, contribution.nbytes))
+        while len(self._contributions) > limit:
+            self._contributions.popitem(last=False)
+        return contribution
+
+    def _apply(self, contribution, sign):
+        """Somma (sign=+1) o sottrae (sign=-1) un contributo e aggiorna le statistiche"""
+        values = self._values
+        if values.size == 0:
+            return
+        touched = np.flatnonzero(contribution)
+        if touched.size == 0:
+            return
+        updated = values[touched] + sign * contribution[touched]
+        # Evita residui negativi dovuti agli arrotondamenti
+        np.maximum(updated, 0.0, out=updated)
+        values[touched] = updated
+        self.E.reshape(-1)[self._flat[touched]] = updated
+        self._sum += sign * float(contribution[touched].sum())
+
+        touched_set = np.zeros(values.size, dtype=bool)
+        touched_set[touched] = True
+        if sign > 0:
+            # I valori crescono: il massimo può solo essere tra i punti toccati,
+            # il minimo cambia solo se il punto di minimo è stato toccato
+            k = int(updated.argmax())
+            if updated[k] >= values[self._argmax]:
+                self._argmax = int(touched[k])
+            if touched_set[self._argmin]:
+                self._argmin = int(values.argmin())
+        else:
+            k = int(updated.argmin())
+            if updated[k] <= values[self._argmin]:
+                self._argmin = int(touched[k])
+            if touched_set[self._argmax]:
+                self._argmax = int(values.argmax())
+
+        self.Em = self._sum / values.size
+        self.Emin = float(values[self._argmin])
+        self.Emax = float(values[self._argmax])
+        self.U0 = self.Emin / self.Em if self.Em > 0 else 0.0
+
+    def _add(self, xy):
+        self._apply(self.lamp_contribution(xy), +1)
+        self.lamps = np.vstack([self.lamps, np.asarray(xy, dtype=np.float64).reshape(1, 2)])
+
+    def _remove(self, index):
+        self._apply(self.lamp_contribution(self.lamps[index]), -1)
+        self.lamps = np.delete(self.lamps, index, axis=0)
+
+    def _refresh_indirect(self):
+        """
+        Ricalcola la componente indiretta dopo una modifica delle lampade.
+        I fattori di forma del locale sono in cache: si risolve solo la radiosità.
+        """
+        if self.indirect is None:
+            return
+        params = self.indirect
+        updated = indirect_illuminance(
+            self.photometry, self.lamps, params['polygon'], self._points, params['mounting_height'],
+            params['calc_plane_height'], params['ceiling_height'], params['reflectances'],
+            self.maintenance_factor)
+        values = self._values
+        values += updated - params['values']
+        params['values'] = updated
+        self.E.reshape(-1)[self._flat] = values
+        if values.size:
+            self._sum = float(values.sum())
+            self._argmin = int(values.argmin())
+            self._argmax = int(values.argmax())
+            self.Em = self._sum / values.size
+            self.Emin = float(values[self._argmin])
+            self.Emax = float(values[self._argmax])
+            self.U0 = self.Emin / self.Em if self.Em > 0 else 0.0
+
+    def add_lamp(self, xy):
+        """Aggiunge una lampada; restituisce il suo indice"""
+        self._add(xy)
+        self._refresh_indirect()
+        return self.lamps.shape[0] - 1
+
+    def remove_lamp(self, index):
+        """Rimuove la lampada con l'indice dato"""
+        self._remove(index)
+        self._refresh_indirect()
+
+    def move_lamp(self, index, xy):
+        """Sposta la lampada con l'indice dato in xy"""
+        self._apply(self.lamp_contribution(self.lamps[index]), -1)
+        self._apply(self.lamp_contribution(xy), +1)
+        self.lamps[index] = xy
+        self._refresh_indirect()
+
+    def sync_lamps(self, lamp_positions, max_changes=None):
+        """
+        Porta il risultato alle nuove posizioni applicando solo le differenze
+
+        Args:
+            lamp_positions: nuova lista di [(x, y), ...]
+            max_changes: oltre questo numero di lampade cambiate conviene ricalcolare
+                (default config.ILLUMINANCE_MAX_INCREMENTAL)
+
+        Returns:
+            True se aggiornato incrementalmente, False se serve un ricalcolo completo
+        """
+        max_changes = max_changes or config.ILLUMINANCE_MAX_INCREMENTAL
+        new = np.asarray(lamp_positions, dtype=np.float64).reshape(-1, 2)
+        old = self.lamps
+        old_keys = {tuple(p) for p in old.tolist()}
+        new_keys = {tuple(p) for p in new.tolist()}
+        removed = [i for i, p in enumerate(old.tolist()) if tuple(p) not in new_keys]
+        added = [p for p in new.tolist() if tuple(p) not in old_keys]
+        if len(removed) + len(added) > max_changes:
+            return False
+        for i in sorted(removed, reverse=True):
+            self._remove(i)
+        for p in added:
+            self._add(p)
+        if removed or added:
+            self._refresh_indirect()
+        return True
+
+
+def _compute_rows(photometry, lamps, xs, ys, mask, E, row_start, row_stop, height,
+                  maintenance_factor, tile_size, memory_budget_mb, cutoff=None):
+    """
+    Calcola le righe [row_start, row_stop) della griglia a blocchi, scrive in E
+    e restituisce la riduzione parziale (somma, numero punti, minimo, massimo).
+    """
+    tile, _ = tile_shape(lamps.shape[0], tile_size, memory_budget_mb)
+    rows_per_tile = max(1, tile // xs.size)
+    total, count = 0.0, 0
+    e_min, e_max = np.inf, -np.inf
+    for r0 in range(row_start, row_stop, rows_per_tile):
+        rows = slice(r0, min(r0 + rows_per_tile, row_stop))
+        block_mask = mask[rows]
+        iy, ix = np.nonzero(block_mask)
+        points = np.column_stack([xs[ix], ys[r0 + iy]])
+        values = maintenance_factor * direct_illuminance(
+            photometry, lamps, points, height, tile_size, memory_budget_mb, cutoff=cutoff)
+        block = np.full(block_mask.shape, np.nan)
+        block[block_mask] = values
+        E[rows] = block
+        if values.size:
+            total += float(values.sum())
+            count += values.size
+            e_min = min(e_min, float(values.min()))
+            e_max = max(e_max, float(values.max()))
+    return total, count, e_min, e_max
+
+
+def _to_shared(array):
+    """Copia un array in un blocco di memoria condivisa; restituisce (blocco, vista)"""
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[...] = array
+    return shm, view
+
+
+def _attach_shared(name, shape, dtype):
+    """Apre nel worker un blocco condiviso creato dal processo principale"""
+    # Il blocco appartiene al processo principale, che lo rimuove a fine calcolo
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _parallel_rows_worker(task):
+    """Worker: calcola un intervallo di righe leggendo e scrivendo in memoria condivisa"""
+    handles = []
+    arrays, E, photometry = {}, None, None
+    try:
+        for key, (name, shape, dtype) in task['shared'].items():
+            shm, view = _attach_shared(name, shape, dtype)
+            handles.append(shm)
+            arrays[key] = view
+        if task['out_path']:
+            E = np.memmap(task['out_path'], dtype=np.float64, mode='r+', shape=task['grid_shape'])
+        else:
+            E = arrays['E']
+        photometry = {
+            'symmetry': task['symmetry'],
+            '_interp_table': (task['c_grid'], task['gamma_grid'], arrays['table']),
+        }
+        result = _compute_rows(photometry, arrays['lamps'], task['xs'], task['ys'], arrays['mask'], E,
+                               task['row_start'], task['row_stop'], task['height'],
+                               task['maintenance_factor'], task['tile_size'], task['memory_budget_mb'],
+                               task['cutoff'])
+        if task['out_path']:
+            E.flush()
+        return result
+    finally:
+        # Le viste sui blocchi vanno rilasciate prima di chiuderli
+        arrays, E, photometry = None, None, None
+        for shm in handles:
+            shm.close()
+
+
+_pool = None
+_pool_workers = 0
+
+
+def _get_pool(workers):
+    """Pool di processi riutilizzato tra i calcoli (evita l'avvio a ogni rerun)"""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def _compute_rows_parallel(photometry, lamps, xs, ys, mask, E, height, maintenance_factor,
+                           tile_size, memory_budget_mb, workers, cutoff=None):
+    """
+    Divide le righe della griglia tra i processi del pool. Matrice intensità,
+    lampade, maschera e griglia risultato stanno in multiprocessing.shared_memory
+    (o nel file del memmap) e non vengono serializzate per ogni task.
+    """
+    c_grid, gamma_grid, table = interpolation_table(photometry)
+    segments = {}
+    shared = {}
+    try:
+        for key, array in (('table', table), ('lamps', lamps), ('mask', mask)):
+            shm, _ = _to_shared(np.ascontiguousarray(array))
+            segments[key] = shm
+            shared[key] = (shm.name, array.shape, array.dtype.str)
+        out_path = E.filename if isinstance(E, np.memmap) else None
+        if out_path is None:
+            shm = shared_memory.SharedMemory(create=True, size=max(1, E.nbytes))
+            segments['E'] = shm
+            shared['E'] = (shm.name, E.shape, E.dtype.str)
+        else:
+            E.flush()
+
+        # Più blocchi che worker per bilanciare righe con pochi punti interni
+        n_chunks = min(ys.size, workers * 4)
+        bounds = np.linspace(0, ys.size, n_chunks + 1).astype(int)
+        base = {
+            'shared': shared, 'out_path': out_path, 'grid_shape': E.shape,
+            'symmetry': photometry.get('symmetry', 0), 'c_grid': c_grid, 'gamma_grid': gamma_grid,
+            'xs': xs, 'ys': ys, 'height': height, 'maintenance_factor': maintenance_factor,
+            'tile_size': tile_size, 'memory_budget_mb': memory_budget_mb, 'cutoff': cutoff,
+        }
+        tasks = [dict(base, row_start=int(a), row_stop=int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+        partials = list(_get_pool(workers).map(_parallel_rows_worker, tasks))
+        if out_path is None:
+            E[...] = np.ndarray(E.shape, dtype=E.dtype, buffer=segments['E'].buf)
+    finally:
+        for shm in segments.values():
+            shm.close()
+            shm.unlink()
+
+    total = sum(p[0] for p in partials)
+    count = sum(p[1] for p in partials)
+    return total, count, min(p[2] for p in partials), max(p[3] for p in partials)
+
+
+def compute_illuminance(photometry, lamp_positions, polygon, mounting_height, calc_plane_height,
+                        spacing=None, maintenance_factor=1.0, tile_size=None, memory_budget_mb=None,
+                        use_memmap=None, workers=None, cull_tolerance=None, indirect=None,
+                        reflectances=None, ceiling_height=None):
+    """
+    Illuminamento diretto su un'area
+
+    La griglia è elaborata a blocchi di righe: per ogni blocco si calcola E,
+    lo si scrive nella griglia di uscita e si aggiornano somma, minimo e
+    massimo, senza mai materializzare l'intera matrice lampade × punti.
+    Per calcoli grandi le righe sono distribuite su più processi.
+
+    Args:
+        photometry: dict fotometria con matrice intensità
+        lamp_positions: lista di [(x, y), ...] in m (es. da generate_lamp_positions)
+        polygon: poligono area in m o AreaShape con fori e zone escluse
+        mounting_height: altezza montaggio (m)
+        calc_plane_height: altezza piano di calcolo (m)
+        spacing: passo griglia di calcolo (default UNI EN 12464-1)
+        maintenance_factor: fattore di manutenzione applicato al risultato
+        tile_size: punti per blocco (default calcolato dal budget di memoria)
+        memory_budget_mb: budget memoria per blocco (default config.ILLUMINANCE_MEMORY_MB)
+        use_memmap: scrive la griglia E in un numpy.memmap su file temporaneo
+            (default: solo oltre config.ILLUMINANCE_MEMMAP_MIN_POINTS punti)
+        workers: processi per il calcolo (default config.ILLUMINANCE_WORKERS);
+            sotto config.ILLUMINANCE_PARALLEL_MIN_PAIRS coppie lampada × punto
+            il calcolo resta seriale
+        cull_tolerance: errore massimo (lux) ammesso per punto escludendo le lampade
+            lontane (default config.ILLUMINANCE_CULL_TOLERANCE_LUX, 0 = calcolo completo)
+        indirect: aggiunge le interriflessioni calcolate con la radiosità
+            (default config.ILLUMINANCE_INDIRECT)
+        reflectances: (soffitto, pareti, pavimento) per la componente indiretta
+            (default config.LUMEN_REFLECTANCES)
+        ceiling_height: altezza soffitto per la componente indiretta (default: altezza montaggio)
+
+    Returns:
+        IlluminanceResult
+    """
+    xs, ys, mask = calculation_grid(polygon, spacing)
+    lamps = np.asarray(lamp_positions, dtype=np.float64).reshape(-1, 2)
+    height = mounting_height - calc_plane_height
+    if use_memmap is None:
+        use_memmap = mask.size > config.ILLUMINANCE_MEMMAP_MIN_POINTS
+    E = create_grid_memmap(mask.shape) if use_memmap else np.empty(mask.shape)
+
+    cutoff = cutoff_radius(photometry, height, cull_tolerance, lamps.shape[0]) if lamps.size else np.inf
+    cutoff = cutoff if np.isfinite(cutoff) else None
+
+    workers = workers or config.ILLUMINANCE_WORKERS or os.cpu_count() or 1
+    pairs = lamps.shape[0] * int(mask.sum())
+    if cutoff is not None:
+        # Stima delle coppie effettivamente valutate dopo l'esclusione
+        area = max(float(np.ptp(xs) * np.ptp(ys)), 1e-9)
+        pairs = int(pairs * min(1.0, 4.0 * cutoff * cutoff / area))
+    if workers > 1 and ys.size > 1 and pairs >= config.ILLUMINANCE_PARALLEL_MIN_PAIRS:
+        total, count, e_min, e_max = _compute_rows_parallel(
+            photometry, lamps, xs, ys, mask, E, height, maintenance_factor,
+            tile_size, memory_budget_mb, workers, cutoff)
+    else:
+        total, count, e_min, e_max = _compute_rows(
+            photometry, lamps, xs, ys, mask, E, 0, ys.size, height,
+            maintenance_factor, tile_size, memory_budget_mb, cutoff)
+
+    if count:
+        em = total / count
+        stats = (em, e_min, e_max, e_min / em if em > 0 else 0.0)
+    else:
+        stats = (0.0, 0.0, 0.0, 0.0)
+
+    indirect_params = None
+    if (config.ILLUMINANCE_INDIRECT if indirect is None else indirect) and count and lamps.size:
+        iy, ix = np.nonzero(mask)
+        points = np.column_stack([xs[ix], ys[iy]])
+        values = indirect_illuminance(photometry, lamps, polygon, points, mounting_height, calc_plane_height,
+                                      ceiling_height, reflectances, maintenance_factor)
+        E[mask] += values
+        indirect_params = {
+            'polygon': polygon, 'mounting_height': mounting_height, 'calc_plane_height': calc_plane_height,
+            'ceiling_height': ceiling_height, 'reflectances': reflectances, 'values': values,
+        }
+        # Le statistiche sono ricalcolate sulla griglia completa (diretta + indiretta)
+        stats = None
+    return IlluminanceResult(xs, ys, mask, E, stats, photometry=photometry, lamps=lamps,
+                             height=height, maintenance_factor=maintenance_factor, cutoff=cutoff,
+                             indirect=indirect_params)
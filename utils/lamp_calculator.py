@@ -4,33 +4,44 @@ import ezdxf
 from ezdxf.entities import LWPolyline
 from datetime import datetime
 
+import config
+from utils.geometry import as_shape, point_in_polygon, points_in_polygon
+from utils.illuminance import compute_illuminance
+from utils.layout_optimizer import optimize_layout
+from utils.lumen_method import lamps_required
+from utils.project_placement import pattern_candidates
+
 class LampPlacementCalculator:
     """Calcola numero lampade, passo e posizionamento in base alle aree"""
     
     def __init__(self, photometry_data=None):
         self.photometry = photometry_data or {}
     
-    def calculate_spacing(self, area_width, area_height, beam_width):
+    def calculate_spacing(self, area_width, area_height, beam_width, beam_width_y=None):
         """
         Calcola il passo ottimale (spacing) tra lampade
         
         Args:
             area_width: larghezza area in m
             area_height: altezza area in m
-            beam_width: larghezza fascio luminoso in m
+            beam_width: larghezza fascio luminoso in m (lungo X)
+            beam_width_y: larghezza fascio lungo Y per fasci allungati (default = beam_width)
         
         Returns:
             dict con numero lampade, spacing x, spacing y
         """
-        # Utilizziamo il 70% della larghezza del fascio per avere sovrapposizione
-        spacing = beam_width * 0.7
+        # Passo ridotto (config.BEAM_OVERLAP_FACTOR) per avere sovrapposizione tra i fasci
+        spacing = beam_width * config.BEAM_OVERLAP_FACTOR
+        spacing_y = (beam_width_y if beam_width_y is not None else beam_width) * config.BEAM_OVERLAP_FACTOR
         
         if spacing <= 0:
             spacing = 1.0
+        if spacing_y <= 0:
+            spacing_y = 1.0
         
         # Calcola numero di lampade lungo X e Y
         n_x = max(1, math.ceil(area_width / spacing))
-        n_y = max(1, math.ceil(area_height / spacing))
+        n_y = max(1, math.ceil(area_height / spacing_y))
         total_lamps = n_x * n_y
         
         # Calcola spacing reale per riempire bene l'area
@@ -44,27 +55,33 @@ class LampPlacementCalculator:
             'spacing_x': actual_spacing_x,
             'spacing_y': actual_spacing_y,
             'coverage_width': n_x * spacing,
-            'coverage_height': n_y * spacing,
+            'coverage_height': n_y * spacing_y,
         }
     
-    def generate_lamp_positions(self, area_polygon, beam_width, start_offset=0.5):
+    def generate_lamp_positions(self, area_polygon, beam_width, start_offset=0.5, beam_width_y=None, edges=None,
+                                pattern='grid'):
         """
         Genera posizioni delle lampade all'interno di un poligono area
         
         Args:
-            area_polygon: lista di punti [(x,y), (x,y), ...] che definiscono l'area
-            beam_width: larghezza del fascio luminoso
+            area_polygon: lista di punti [(x,y), (x,y), ...] che definiscono l'area,
+                o AreaShape (nessuna lampada in fori e zone escluse)
+            beam_width: larghezza del fascio luminoso (lungo X)
             start_offset: offset di partenza dal bordo (m)
+            beam_width_y: larghezza del fascio lungo Y (default = beam_width)
+            edges: tabella lati precalcolata (polygon_edges o AreaShape) per riusarla tra chiamate
+            pattern: schema di posizionamento ('grid', 'staggered', 'hex', 'line')
         
         Returns:
             lista di [(x, y), ...] con coordinate lampade
         """
-        if not area_polygon or len(area_polygon) < 2:
+        outer = getattr(area_polygon, 'outer', area_polygon)
+        if not outer or len(outer) < 2:
             return []
         
         # Calcola bounding box dell'area
-        xs = [p[0] for p in area_polygon]
-        ys = [p[1] for p in area_polygon]
+        xs = [p[0] for p in outer]
+        ys = [p[1] for p in outer]
         min_x, max_x = min(xs), max(xs)
         min_y, max_y = min(ys), max(ys)
         
@@ -72,44 +89,95 @@ class LampPlacementCalculator:
         height = max_y - min_y
         
         # Calcola spacing
-        spacing_config = self.calculate_spacing(width, height, beam_width)
+        spacing_config = self.calculate_spacing(width, height, beam_width, beam_width_y)
         spacing_x = spacing_config['spacing_x']
         spacing_y = spacing_config['spacing_y']
         
-        # Genera griglia di posizioni
-        positions = []
-        x = min_x + start_offset
-        while x < max_x:
-            y = min_y + start_offset
-            while y < max_y:
-                # Controlla se il punto è dentro il poligono
-                if self._point_in_polygon((x, y), area_polygon):
-                    positions.append((x, y))
-                y += spacing_y
-            x += spacing_x
-        
-        return positions
+        # Candidati dello schema (per colonne, come la scansione x → y) e test vettoriale
+        _, candidates = pattern_candidates([[min_x, min_y, max_x, max_y]], spacing_x, spacing_y, pattern, start_offset)
+        if candidates.shape[0] == 0:
+            return []
+        inside = points_in_polygon(candidates, area_polygon, edges)
+        return [(x, y) for x, y in candidates[inside].tolist()]
     
     @staticmethod
     def _point_in_polygon(point, polygon):
         """Ray casting algorithm per verificare se punto è dentro poligono"""
-        x, y = point
-        n = len(polygon)
-        inside = False
-        
-        p1x, p1y = polygon[0]
-        for i in range(1, n + 1):
-            p2x, p2y = polygon[i % n]
-            if y > min(p1y, p2y):
-                if y <= max(p1y, p2y):
-                    if x <= max(p1x, p2x):
-                        if p1y != p2y:
-                            xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
-                        if p1x == p2x or x <= xinters:
-                            inside = not inside
-            p1x, p1y = p2x, p2y
-        
-        return inside
+        return point_in_polygon(point, polygon)
+    
+    def calculate_illuminance(self, area_polygon, lamp_positions, mounting_height, calc_plane_height, grid_spacing=None,
+                              cull_tolerance=None, indirect=None, reflectances=None):
+        """
+        Calcola l'illuminamento diretto sull'area con la fotometria del calcolatore
+        
+        Args:
+            area_polygon: lista di punti [(x,y), ...] in m
+            lamp_positions: lista di [(x, y), ...] in m
+            mounting_height: altezza montaggio (m)
+            calc_plane_height: altezza piano di calcolo (m)
+            grid_spacing: passo griglia di calcolo (default UNI EN 12464-1)
+            cull_tolerance: errore massimo (lux) per punto ammesso escludendo le
+                lampade lontane (default config.ILLUMINANCE_CULL_TOLERANCE_LUX, 0 = calcolo completo)
+            indirect: aggiunge le interriflessioni di pareti, soffitto e pavimento
+                (default config.ILLUMINANCE_INDIRECT)
+            reflectances: (soffitto, pareti, pavimento) (default config.LUMEN_REFLECTANCES)
+        
+        Returns:
+            IlluminanceResult con Em, Emin, Emax, U0
+        """
+        if self.photometry.get('intensities') is None:
+            raise ValueError("Fotometria senza matrice intensità: impossibile calcolare l'illuminamento")
+        return compute_illuminance(self.photometry, lamp_positions, area_polygon,
+                                   mounting_height, calc_plane_height, grid_spacing,
+                                   cull_tolerance=cull_tolerance, indirect=indirect,
+                                   reflectances=reflectances)
+    
+    def calculate_lamps_lumen(self, area_polygon, mounting_height, calc_plane_height, target_lux,
+                              maintenance_factor=None):
+        """
+        Numero lampade con il metodo del flusso sulle dimensioni reali dell'area
+        
+        Args:
+            area_polygon: lista di punti [(x,y), ...] in m
+            mounting_height: altezza montaggio (m)
+            calc_plane_height: altezza piano di calcolo (m)
+            target_lux: illuminamento medio richiesto (lux)
+            maintenance_factor: fattore di manutenzione (default config.LUMEN_MAINTENANCE_FACTOR)
+        
+        Returns:
+            dict con 'lamps', 'room_index', 'uf', 'flux'
+        """
+        if self.photometry.get('intensities') is None:
+            raise ValueError("Fotometria senza matrice intensità: impossibile calcolare il fattore di utilizzazione")
+        shape = as_shape(area_polygon)
+        return lamps_required(self.photometry, target_lux, shape.area,
+                              shape.perimeter, mounting_height - calc_plane_height,
+                              maintenance_factor)
+    
+    def optimize_layout(self, area_polygon, mounting_height, calc_plane_height, target_lux, min_uniformity,
+                        maintenance_factor=None, time_budget_s=None, indirect=None, patterns=None):
+        """
+        Layout con il minor numero di lampade che rispetta Em e U0 richiesti
+        
+        Args:
+            area_polygon: lista di punti [(x,y), ...] in m
+            mounting_height: altezza montaggio (m)
+            calc_plane_height: altezza piano di calcolo (m)
+            target_lux: illuminamento medio richiesto (lux), es. da config.EN12464_TASKS
+            min_uniformity: uniformità minima U0
+            maintenance_factor: fattore di manutenzione (default config.LUMEN_MAINTENANCE_FACTOR)
+            time_budget_s: tempo massimo di ricerca (default config.LAYOUT_TIME_BUDGET_S)
+            indirect: include le interriflessioni (default config.ILLUMINANCE_INDIRECT)
+            patterns: schemi provati (default config.LAYOUT_PATTERNS)
+        
+        Returns:
+            dict con 'positions', 'lamps', 'Em', 'U0', 'pattern', 'compliant', ... (vedi layout_optimizer)
+        """
+        if self.photometry.get('intensities') is None:
+            raise ValueError("Fotometria senza matrice intensità: impossibile ottimizzare il layout")
+        return optimize_layout(self.photometry, area_polygon, mounting_height, calc_plane_height,
+                               target_lux, min_uniformity, maintenance_factor, time_budget_s,
+                               indirect=indirect, patterns=patterns)
     
     def export_to_dwg(self, filepath, areas_data, scale=1.0):
         """
@@ -0,0 +1,266 @@
+import hashlib
+import math
+import time
+from collections import OrderedDict
+import numpy as np
+
+import config
+from utils.geometry import as_shape, points_in_polygon
+from utils.illuminance import compute_illuminance, grid_spacing_for
+from utils.lumen_method import lamps_required
+from utils.photometry import interpolation_table
+
+# Valutazioni già eseguite (layout → statistiche), condivise tra le chiamate
+_memo = OrderedDict()
+
+
+def grid_layout(polygon, nx, ny, rotation_deg=0.0, offset=(0.0, 0.0), edges=None, pattern='grid'):
+    """
+    Griglia regolare nx × ny di apparecchi nel riferimento ruotato dell'area
+
+    Le lampade stanno al centro delle celle dell'ingombro ruotato, spostate di
+    offset (frazioni del passo); restano solo quelle dentro il poligono. Con
+    pattern 'staggered' (o 'hex') le file dispari sono spostate di mezzo passo
+    e hanno una lampada in meno; 'line' è una griglia con una sola fila.
+
+    Args:
+        polygon: lista di [(x, y), ...] in m o AreaShape
+        nx, ny: numero di file lungo i due assi della griglia
+        rotation_deg: rotazione della griglia (gradi, antioraria)
+        offset: spostamento (fx, fy) in frazioni del passo
+        edges: tabella lati precalcolata (polygon_edges o AreaShape)
+        pattern: 'grid', 'staggered', 'hex' o 'line'
+
+    Returns:
+        array (N, 2) di posizioni in m
+    """
+    pts = np.asarray(getattr(polygon, 'outer', polygon), dtype=np.float64)
+    theta = math.radians(rotation_deg)
+    cos_t, sin_t = math.cos(theta), math.sin(theta)
+    # Coordinate dei vertici nel riferimento della griglia
+    u = pts[:, 0] * cos_t + pts[:, 1] * sin_t
+    v = -pts[:, 0] * sin_t + pts[:, 1] * cos_t
+    su = np.ptp(u) / nx
+    sv = np.ptp(v) / ny
+    gu = u.min() + (np.arange(nx) + 0.5 + offset[0]) * su
+    gv = v.min() + (np.arange(ny) + 0.5 + offset[1]) * sv
+    cu, cv = np.meshgrid(gu, gv, indexing='ij')
+    if pattern in ('staggered', 'hex'):
+        # File dispari a metà passo, senza l'ultima lampada che cadrebbe sul bordo
+        odd = (np.arange(ny) % 2) == 1
+        cu = cu + np.where(odd, 0.5 * su, 0.0)[None, :]
+        keep = ~(odd[None, :] & (np.arange(nx) == nx - 1)[:, None])
+        cu, cv = cu[keep], cv[keep]
+    cu, cv = cu.ravel(), cv.ravel()
+    candidates = np.column_stack([cu * cos_t - cv * sin_t, cu * sin_t + cv * cos_t])
+    inside = points_in_polygon(candidates, polygon, edges)
+    return candidates[inside]
+
+
+def _dominant_rotation(polygon):
+    """Angolo (0-90°) del lato più lungo: la griglia allineata ai muri principali"""
+    pts = np.asarray(polygon, dtype=np.float64)
+    edges = np.roll(pts, -1, axis=0) - pts
+    longest = edges[np.argmax(np.hypot(edges[:, 0], edges[:, 1]))]
+    return round(math.degrees(math.atan2(longest[1], longest[0])) % 90.0, 6)
+
+
+def _photometry_key(photometry):
+    """
+    Identificativo del contenuto della fotometria: SHA-256 del file se disponibile,
+    altrimenti SHA-1 della tabella di interpolazione (l'id del dict può essere riusato)
+    """
+    if photometry.get('sha256'):
+        return photometry['sha256']
+    if '_content_key' not in photometry:
+        digest = hashlib.sha1(str(photometry.get('symmetry', 0)).encode())
+        for array in interpolation_table(photometry):
+            digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+        photometry['_content_key'] = digest.hexdigest()
+    return photometry['_content_key']
+
+
+def _evaluate(photometry, positions, polygon, mounting_height, calc_plane_height, spacing,
+              maintenance_factor, indirect):
+    """Statistiche di un layout, memorizzate per posizioni e griglia di calcolo"""
+    key = (_photometry_key(photometry), as_shape(polygon).key, mounting_height,
+           calc_plane_height, round(spacing, 6), maintenance_factor, bool(indirect),
+           np.round(positions, 6).tobytes())
+    cached = _memo.get(key)
+    if cached is not None:
+        _memo.move_to_end(key)
+        return cached
+    summary = compute_illuminance(photometry, positions, polygon, mounting_height, calc_plane_height,
+                                  spacing=spacing, maintenance_factor=maintenance_factor,
+                                  indirect=indirect).summary()
+    _memo[key] = summary
+    while len(_memo) > config.LAYOUT_MEMO_SIZE:
+        _memo.popitem(last=False)
+    return summary
+
+
+def optimize_layout(photometry, polygon, mounting_height, calc_plane_height, target_lux, min_uniformity,
+                    maintenance_factor=None, time_budget_s=None, max_lamps=None, indirect=None, patterns=None):
+    """
+    Layout a griglia con il minor numero di apparecchi che rispetta Em e U0
+
+    Le griglie candidate (schema, numero di file, spostamento, rotazione) sono visitate
+    per numero nominale di apparecchi crescente a partire dalla stima del metodo
+    del flusso; trovata una soluzione conforme la ricerca continua sui livelli che,
+    una volta ritagliati sull'area, possono ancora avere meno apparecchi. Ogni candidato è valutato su una griglia di calcolo rada; quelli
+    che superano la verifica rada sono ricalcolati a piena risoluzione. I
+    candidati che non possono raggiungere Em (stima per apparecchio dai
+    layout già valutati) sono scartati senza calcolo.
+
+    Args:
+        photometry: dict fotometria con matrice intensità
+        polygon: lista di [(x, y), ...] in m o AreaShape con fori e zone escluse
+        mounting_height: altezza montaggio (m)
+        calc_plane_height: altezza piano di calcolo (m)
+        target_lux: illuminamento medio mantenuto richiesto (lux)
+        min_uniformity: uniformità minima U0 = Emin / Em
+        maintenance_factor: fattore di manutenzione (default config.LUMEN_MAINTENANCE_FACTOR)
+        time_budget_s: tempo massimo di ricerca (default config.LAYOUT_TIME_BUDGET_S)
+        max_lamps: numero massimo di apparecchi (default 4 × stima del metodo del flusso)
+        indirect: include le interriflessioni (default config.ILLUMINANCE_INDIRECT)
+        patterns: schemi provati (default config.LAYOUT_PATTERNS)
+
+    Returns:
+        dict con 'positions' (lista di (x, y)), 'lamps', 'Em', 'Emin', 'U0', 'nx', 'ny',
+        'rotation', 'offset', 'pattern', 'compliant', 'evaluated', 'elapsed'
+    """
+    start = time.perf_counter()
+    maintenance_factor = maintenance_factor or config.LUMEN_MAINTENANCE_FACTOR
+    time_budget_s = time_budget_s or config.LAYOUT_TIME_BUDGET_S
+    height = mounting_height - calc_plane_height
+    polygon = edges = as_shape(polygon)
+    pts = np.asarray(polygon.outer, dtype=np.float64)
+
+    estimate = lamps_required(photometry, target_lux, polygon.area, polygon.perimeter,
+                              height, maintenance_factor)['lamps']
+    max_lamps = max_lamps or max(4, 4 * estimate)
+    min_lamps = max(1, int(estimate * config.LAYOUT_MIN_FRACTION))
+
+    rotations = sorted({0.0, _dominant_rotation(polygon.outer), *config.LAYOUT_ROTATIONS})
+    patterns = patterns or config.LAYOUT_PATTERNS
+    offsets = [(fx, fy) for fx in config.LAYOUT_OFFSETS for fy in config.LAYOUT_OFFSETS]
+    full_spacing = grid_spacing_for(polygon)
+    coarse_spacing = full_spacing * config.LAYOUT_COARSE_FACTOR
+    margin = config.LAYOUT_COARSE_MARGIN
+
+    # Coppie (nx, ny) ordinate per numero nominale di apparecchi, con passi non troppo diversi;
+    # le file singole valgono per qualunque rapporto (corridoi)
+    levels = {}
+    for rotation in rotations:
+        theta = math.radians(rotation)
+        u = pts[:, 0] * math.cos(theta) + pts[:, 1] * math.sin(theta)
+        v = -pts[:, 0] * math.sin(theta) + pts[:, 1] * math.cos(theta)
+        width, depth = max(np.ptp(u), 1e-9), max(np.ptp(v), 1e-9)
+        for nx in range(1, max_lamps + 1):
+            if 'line' in patterns and min_lamps <= nx:
+                levels.setdefault(nx, []).append((nx, 1, rotation, 'line'))
+            for ny in range(max(1, min_lamps // nx), max_lamps // nx + 1):
+                ratio = (width / nx) / (depth / ny)
+                if not 1.0 / config.LAYOUT_MAX_SPACING_RATIO <= ratio <= config.LAYOUT_MAX_SPACING_RATIO:
+                    continue
+                for pattern in patterns:
+                    if pattern in ('staggered', 'hex') and nx > 1 and ny > 1:
+                        # Le file dispari hanno una lampada in meno
+                        levels.setdefault(nx * ny - ny // 2, []).append((nx, ny, rotation, pattern))
+                    elif pattern == 'grid':
+                        levels.setdefault(nx * ny, []).append((nx, ny, rotation, pattern))
+
+    best = None
+    evaluated = 0
+    lux_per_lamp = None
+    # Rapporto minimo visto tra apparecchi dentro l'area e numero nominale del livello
+    clip_ratio = 1.0
+    seen = set()
+    for count in sorted(levels):
+        if time.perf_counter() - start > time_budget_s:
+            break
+        # Su aree ritagliate, a L o con fori un livello nominale più alto può avere meno
+        # apparecchi effettivi: si prosegue finché il livello, ritagliato, non scende più
+        # sotto la migliore soluzione conforme
+        if best is not None and best['compliant'] and count * clip_ratio >= best['lamps']:
+            break
+        # Potatura: anche con la miglior resa per apparecchio vista, Em non è raggiungibile
+        if lux_per_lamp is not None and count * lux_per_lamp < target_lux * (1.0 - margin):
+            continue
+        passing = []
+        for nx, ny, rotation, pattern in levels[count]:
+            for offset in offsets:
+                positions = grid_layout(polygon, nx, ny, rotation, offset, edges, pattern)
+                key = np.round(positions, 6).tobytes()
+                if positions.shape[0] == 0 or key in seen:
+                    continue
+                seen.add(key)
+                clip_ratio = min(clip_ratio, positions.shape[0] / count)
+                if best is not None and best['compliant'] and positions.shape[0] >= best['lamps']:
+                    continue
+                if lux_per_lamp is not None and positions.shape[0] * lux_per_lamp < target_lux * (1.0 - margin):
+                    continue
+                coarse = _evaluate(photometry, positions, polygon, mounting_height, calc_plane_height,
+                                   coarse_spacing, maintenance_factor, indirect)
+                evaluated += 1
+                per_lamp = coarse['Em'] / positions.shape[0]
+                lux_per_lamp = per_lamp if lux_per_lamp is None else max(lux_per_lamp, per_lamp)
+                candidate = {
+                    'positions': positions, 'nx': nx, 'ny': ny, 'rotation': rotation, 'offset': offset,
+                    'pattern': pattern, 'coarse': coarse,
+                }
+                if coarse['Em'] >= target_lux * (1.0 - margin) and coarse['U0'] >= min_uniformity * (1.0 - margin):
+                    passing.append(candidate)
+                elif best is None or (not best['compliant'] and _shortfall(coarse, target_lux, min_uniformity)
+                                      < _shortfall(best, target_lux, min_uniformity)):
+                    best = _result(candidate, coarse, False)
+            if time.perf_counter() - start > time_budget_s:
+                break
+
+        # Ricalcolo a piena risoluzione dei migliori candidati del livello, per ogni numero
+        # effettivo di apparecchi (i livelli ritagliati ne mescolano diversi)
+        passing.sort(key=lambda c: (c['positions'].shape[0], -c['coarse']['U0']))
+        refined = {}
+        for candidate in passing:
+            lamps = candidate['positions'].shape[0]
+            if refined.get(lamps, 0) >= config.LAYOUT_REFINE_TOP or \
+                    (best is not None and best['compliant'] and lamps >= best['lamps']):
+                continue
+            refined[lamps] = refined.get(lamps, 0) + 1
+            full = _evaluate(photometry, candidate['positions'], polygon, mounting_height, calc_plane_height,
+                             full_spacing, maintenance_factor, indirect)
+            if full['Em'] >= target_lux and full['U0'] >= min_uniformity:
+                result = _result(candidate, full, True)
+                if best is None or not best['compliant'] or (result['lamps'], -result['U0']) < (best['lamps'], -best['U0']):
+                    best = result
+            elif best is None or (not best['compliant'] and _shortfall(full, target_lux, min_uniformity)
+                                  < _shortfall(best, target_lux, min_uniformity)):
+                best = _result(candidate, full, False)
+
+    if best is None:
+        best = {'positions': [], 'lamps': 0, 'Em': 0.0, 'Emin': 0.0, 'U0': 0.0, 'nx': 0, 'ny': 0,
+                'rotation': 0.0, 'offset': (0.0, 0.0), 'pattern': 'grid', 'compliant': False}
+    best['evaluated'] = evaluated
+    best['elapsed'] = time.perf_counter() - start
+    return best
+
+
+def _shortfall(stats, target_lux, min_uniformity):
+    """Distanza relativa dai requisiti (0 = conforme)"""
+    return max(0.0, 1.0 - stats['Em'] / target_lux) + max(0.0, 1.0 - stats['U0'] / min_uniformity)
+
+
+def _result(candidate, stats, compliant):
+    return {
+        'positions': [tuple(p) for p in candidate['positions'].tolist()],
+        'lamps': int(candidate['positions'].shape[0]),
+        'Em': stats['Em'],
+        'Emin': stats['Emin'],
+        'U0': stats['U0'],
+        'nx': candidate['nx'],
+        'ny': candidate['ny'],
+        'rotation': candidate['rotation'],
+        'offset': candidate['offset'],
+        'pattern': candidate['pattern'],
+        'compliant': compliant,
+    }
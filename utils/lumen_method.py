@@ -0,0 +1,205 @@
+import math
+import numpy as np
+
+import config
+from utils.photometry import intensity_at, luminous_flux
+from utils.photometry_cache import get_default_cache
+
+
+def room_index(area, perimeter, mounting_height):
+    """
+    Indice del locale K = A / (hm · P / 2)
+
+    Per un rettangolo L × W coincide con K = L·W / (hm · (L + W)).
+    Accetta scalari o array (più locali in un'unica operazione).
+
+    Args:
+        area: superficie in m²
+        perimeter: perimetro in m
+        mounting_height: distanza apparecchi - piano di lavoro (m)
+    """
+    area = np.asarray(area, dtype=np.float64)
+    half_perimeter = np.asarray(perimeter, dtype=np.float64) * np.asarray(mounting_height, dtype=np.float64) / 2.0
+    return np.divide(area, half_perimeter, out=np.zeros(np.broadcast(area, half_perimeter).shape),
+                     where=half_perimeter > 0)
+
+
+def _parallel_form_factor(side, distance):
+    """Fattore di forma tra due quadrati paralleli affacciati di lato side a distanza distance"""
+    x = y = side / distance
+    a = math.log(math.sqrt((1 + x * x) * (1 + y * y) / (1 + x * x + y * y)))
+    b = x * math.sqrt(1 + y * y) * math.atan(x / math.sqrt(1 + y * y))
+    c = y * math.sqrt(1 + x * x) * math.atan(y / math.sqrt(1 + x * x))
+    return 2.0 / (math.pi * x * y) * (a + b + c - x * math.atan(x) - y * math.atan(y))
+
+
+def _cumulative_zonal_flux(photometry, c_samples):
+    """
+    Flusso cumulato ∫₀^γ I(C, γ') sin γ' dγ' per ogni piano C campionato (cd · sr / rad C)
+    """
+    gamma = np.asarray(photometry['gamma_angles'], dtype=np.float64)
+    intensity = intensity_at(photometry, c_samples[:, None], gamma[None, :])
+    f = intensity * np.sin(np.radians(gamma))[None, :]
+    steps = 0.5 * (f[:, 1:] + f[:, :-1]) * np.diff(np.radians(gamma))[None, :]
+    return gamma, np.concatenate([np.zeros((c_samples.size, 1)), np.cumsum(steps, axis=1)], axis=1)
+
+
+def _direct_fractions(photometry, room_indices, spacing_ratio, c_step_deg=2.0):
+    """
+    Frazioni dirette del flusso dell'apparecchio su piano di lavoro, pareti e soffitto
+    per locali quadrati con apparecchi in griglia regolare (altezza normalizzata a 1).
+
+    Per ogni piano C il flusso che colpisce il pavimento è il flusso zonale fino
+    al gamma del bordo del locale visto dalla lampada.
+    """
+    c_samples = np.arange(0.0, 360.0, c_step_deg)
+    gamma, cumulative = _cumulative_zonal_flux(photometry, c_samples)
+    dc = math.radians(c_step_deg)
+    total = cumulative[:, -1].sum() * dc
+    down = np.array([np.interp(90.0, gamma, row) for row in cumulative]).sum() * dc
+    if total <= 0:
+        zeros = np.zeros(len(room_indices))
+        return zeros, zeros, zeros, 0.0
+
+    cos_c = np.cos(np.radians(c_samples))
+    sin_c = np.sin(np.radians(c_samples))
+    floor = []
+    for k in room_indices:
+        side = 2.0 * k
+        n = max(1, int(math.ceil(side / spacing_ratio)))
+        centers = (np.arange(n) + 0.5) * side / n
+        lx, ly = (a.ravel() for a in np.meshgrid(centers, centers))
+        # Distanza dal bordo lungo ogni direzione C (lampade × piani C)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tx = np.where(cos_c > 0, (side - lx[:, None]) / cos_c,
+                          np.where(cos_c < 0, -lx[:, None] / cos_c, np.inf))
+            ty = np.where(sin_c > 0, (side - ly[:, None]) / sin_c,
+                          np.where(sin_c < 0, -ly[:, None] / sin_c, np.inf))
+        edge_gamma = np.degrees(np.arctan(np.minimum(tx, ty)))
+        # Interpolazione del flusso cumulato al gamma del bordo, piano per piano
+        idx = np.clip(np.searchsorted(gamma, edge_gamma, side='right') - 1, 0, gamma.size - 2)
+        weight = np.clip((edge_gamma - gamma[idx]) / (gamma[idx + 1] - gamma[idx]), 0.0, 1.0)
+        rows = np.arange(c_samples.size)[None, :]
+        flux = (1.0 - weight) * cumulative[rows, idx] + weight * cumulative[rows, idx + 1]
+        floor.append(flux.sum(axis=1).mean() * dc)
+
+    floor = np.array(floor) / total
+    down_fraction = down / total
+    walls = np.clip(down_fraction - floor, 0.0, None)
+    ceiling = np.full(floor.shape, 1.0 - down_fraction)
+    return floor, walls, ceiling, total
+
+
+def compute_utilization_factors(photometry, room_indices=None, reflectances=None, spacing_ratio=None):
+    """
+    Fattori di utilizzazione per una serie di indici del locale
+
+    Il flusso diretto su piano di lavoro, pareti e soffitto è integrato dalla
+    matrice intensità; le interriflessioni sono risolte con un modello a tre
+    superfici (piano di lavoro, pareti, soffitto) con fattori di forma analitici.
+    L'UF è riferito al flusso emesso dall'apparecchio.
+
+    Args:
+        photometry: dict fotometria con matrice intensità
+        room_indices: indici K della tabella (default config.LUMEN_ROOM_INDICES)
+        reflectances: (soffitto, pareti, piano di lavoro) (default config.LUMEN_REFLECTANCES)
+        spacing_ratio: rapporto interdistanza / altezza utile (default config.LUMEN_SPACING_RATIO)
+
+    Returns:
+        (array indici K, array UF)
+    """
+    if room_indices is None:
+        room_indices = config.LUMEN_ROOM_INDICES
+    room_indices = np.asarray(room_indices, dtype=np.float64)
+    rho_c, rho_w, rho_f = reflectances or config.LUMEN_REFLECTANCES
+    spacing_ratio = spacing_ratio or config.LUMEN_SPACING_RATIO
+
+    floor, walls, ceiling, _ = _direct_fractions(photometry, room_indices, spacing_ratio)
+    factors = []
+    for i, k in enumerate(room_indices):
+        side = 2.0 * k
+        f_par = _parallel_form_factor(side, 1.0)
+        area_plane, area_walls = side * side, 4.0 * side
+        f_pw = 1.0 - f_par
+        f_wp = f_pw * area_plane / area_walls
+        # Righe: superficie emittente (piano, pareti, soffitto); colonne: ricevente
+        form = np.array([
+            [0.0, f_pw, f_par],
+            [f_wp, 1.0 - 2.0 * f_wp, f_wp],
+            [f_par, f_pw, 0.0],
+        ])
+        rho = np.array([rho_f, rho_w, rho_c])
+        direct = np.array([floor[i], walls[i], ceiling[i]])
+        # Flusso incidente totale: Φ = Φ_diretto + (ρ F)ᵀ Φ
+        incident = np.linalg.solve(np.eye(3) - (rho[:, None] * form).T, direct)
+        factors.append(incident[0])
+    return room_indices, np.array(factors)
+
+
+def _reflectance_key(reflectances):
+    return '/'.join(f"{r:.2f}" for r in reflectances)
+
+
+def utilization_table(photometry, reflectances=None):
+    """
+    Tabella UF della fotometria, calcolata una sola volta e conservata nel dict
+
+    La tabella (e il flusso dell'apparecchio) sono salvati in chiavi persistenti
+    della fotometria: se la fotometria proviene dalla cache viene riscritta su
+    disco, così la tabella non va ricalcolata ai caricamenti successivi.
+
+    Returns:
+        (indici K, UF, flusso apparecchio lm) come array NumPy
+    """
+    reflectances = tuple(reflectances or config.LUMEN_REFLECTANCES)
+    key = _reflectance_key(reflectances)
+    tables = photometry.get('uf_tables') or {}
+    if key not in tables or photometry.get('uf_room_indices') is None:
+        indices, factors = compute_utilization_factors(photometry, reflectances=reflectances)
+        if photometry.get('uf_room_indices') is not None and \
+                not np.allclose(photometry['uf_room_indices'], indices):
+            tables = {}
+        tables = dict(tables, **{key: factors.tolist()})
+        photometry['uf_tables'] = tables
+        photometry['uf_room_indices'] = indices.tolist()
+        photometry['uf_flux'] = luminous_flux(photometry)
+        if photometry.get('cache_key'):
+            get_default_cache().put(photometry['cache_key'], photometry)
+    return (np.asarray(photometry['uf_room_indices'], dtype=np.float64),
+            np.asarray(tables[key], dtype=np.float64),
+            float(photometry['uf_flux']))
+
+
+def lamps_required(photometry, target_lux, area, perimeter, mounting_height,
+                   maintenance_factor=None, reflectances=None):
+    """
+    Numero di apparecchi con il metodo del flusso: N = E · A / (Φ · UF · MF)
+
+    Dopo il primo calcolo della tabella UF la stima è un'interpolazione:
+    area, perimetro e altezza possono essere array per dimensionare molti
+    locali in un'unica chiamata.
+
+    Args:
+        photometry: dict fotometria con matrice intensità
+        target_lux: illuminamento medio richiesto (lux)
+        area: superficie del locale (m²)
+        perimeter: perimetro del locale (m)
+        mounting_height: distanza apparecchi - piano di lavoro (m)
+        maintenance_factor: fattore di manutenzione (default config.LUMEN_MAINTENANCE_FACTOR)
+        reflectances: (soffitto, pareti, piano di lavoro) (default config.LUMEN_REFLECTANCES)
+
+    Returns:
+        dict con 'lamps' (intero o array), 'room_index', 'uf', 'flux'
+    """
+    maintenance_factor = maintenance_factor or config.LUMEN_MAINTENANCE_FACTOR
+    indices, factors, flux = utilization_table(photometry, reflectances)
+    k = room_index(area, perimeter, mounting_height)
+    # Fuori tabella si usa il valore estremo (np.interp satura)
+    uf = np.interp(k, indices, factors)
+    denominator = flux * uf * maintenance_factor
+    needed = np.divide(np.asarray(target_lux, dtype=np.float64) * np.asarray(area, dtype=np.float64),
+                       denominator, out=np.zeros(np.broadcast(k, denominator).shape), where=denominator > 0)
+    lamps = np.where(np.asarray(area) > 0, np.maximum(1, np.ceil(needed)), 0).astype(np.int64)
+    if lamps.ndim == 0:
+        return {'lamps': int(lamps), 'room_index': float(k), 'uf': float(uf), 'flux': flux}
+    return {'lamps': lamps, 'room_index': k, 'uf': uf, 'flux': flux}
@@ -0,0 +1,174 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+# Punti tipografici per pollice (unità del MediaBox)
+POINTS_PER_INCH = 72.0
+
+# Pagine già rasterizzate: (SHA-256 del file, pagina, DPI) → PIL Image, LRU limitata in MB
+_rendered = OrderedDict()
+_rendered_bytes = 0
+_lock = threading.Lock()
+
+
+def _image_bytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+def _cached(key):
+    with _lock:
+        image = _rendered.get(key)
+        if image is not None:
+            _rendered.move_to_end(key)
+        return image
+
+
+def _store(key, image):
+    global _rendered_bytes
+    limit = config.PDF_PAGE_CACHE_MB * 1024 * 1024
+    with _lock:
+        if key in _rendered:
+            return
+        _rendered[key] = image
+        _rendered_bytes += _image_bytes(image)
+        # L'ultima pagina resta anche se da sola supera il limite
+        while _rendered_bytes > limit and len(_rendered) > 1:
+            _, evicted = _rendered.popitem(last=False)
+            _rendered_bytes -= _image_bytes(evicted)
+
+
+def clear_page_cache():
+    """Svuota la cache delle pagine rasterizzate"""
+    global _rendered_bytes
+    with _lock:
+        _rendered.clear()
+        _rendered_bytes = 0
+
+
+def _rasterize(path, page, dpi):
+    """Rasterizza una sola pagina (numerata da 1) con pdf2image/poppler"""
+    from pdf2image import convert_from_path
+    images = convert_from_path(path, dpi=dpi, first_page=page, last_page=page)
+    return images[0].convert('RGB') if images else None
+
+
+def _page_boxes(data):
+    """
+    Dimensioni (larghezza, altezza) in punti di ogni pagina, senza rasterizzare
+
+    Legge solo la struttura del PDF con pdfrw; se non è disponibile usa pdfinfo
+    (solo numero di pagine, dimensioni ignote).
+    """
+    try:
+        from pdfrw import PdfReader
+        boxes = []
+        for page in PdfReader(fdata=data).pages:
+            x0, y0, x1, y1 = (float(v) for v in page.inheritable.MediaBox)
+            width, height = abs(x1 - x0), abs(y1 - y0)
+            if int(page.inheritable.Rotate or 0) % 180:
+                width, height = height, width
+            boxes.append((width, height))
+        return boxes
+    except ImportError:
+        from pdf2image import pdfinfo_from_bytes
+        return [None] * int(pdfinfo_from_bytes(data)['Pages'])
+
+
+class PdfPages:
+    """
+    Planimetria PDF multipagina rasterizzata su richiesta
+
+    L'elenco delle pagine si ottiene dalla sola struttura del file; le pagine
+    sono rasterizzate solo quando servono, alla risoluzione scelta, e restano in
+    cache per (SHA-256 del file, pagina, DPI): cambiare pagina o tornare a una
+    già vista non rifà il lavoro.
+    """
+
+    def __init__(self, data):
+        """
+        Args:
+            data: contenuto del file PDF (bytes o file caricato)
+        """
+        if hasattr(data, 'getvalue'):
+            data = data.getvalue()
+        elif hasattr(data, 'read'):
+            data = data.read()
+        self.data = bytes(data)
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+        self.page_sizes = _page_boxes(self.data)
+
+    @property
+    def page_count(self):
+        return len(self.page_sizes)
+
+    def page_label(self, page):
+        """Descrizione della pagina (numerata da 1) con il formato del foglio in mm"""
+        size = self.page_sizes[page - 1]
+        if size is None:
+            return f"Pagina {page}"
+        width, height = (round(v / POINTS_PER_INCH * 25.4) for v in size)
+        return f"Pagina {page} ({width} × {height} mm)"
+
+    def pixel_size(self, page, dpi):
+        """Dimensione (larghezza, altezza) in pixel della pagina al DPI dato, o None se ignota"""
+        size = self.page_sizes[page - 1]
+        if size is None:
+            return None
+        return tuple(int(round(v / POINTS_PER_INCH * dpi)) for v in size)
+
+    def is_cached(self, page, dpi):
+        return _cached((self.sha256, page, dpi)) is not None
+
+    def render(self, page, dpi=None):
+        """Pagina (numerata da 1) come PIL Image RGB al DPI dato (default config.PDF_DPI)"""
+        return self.render_pages([page], dpi)[page]
+
+    def render_pages(self, pages, dpi=None, workers=None):
+        """
+        Rasterizza più pagine in parallelo, solo quelle non già in cache
+
+        Ogni pagina è un processo pdftoppm separato, quindi i thread lavorano
+        davvero in parallelo.
+
+        Args:
+            pages: numeri di pagina (da 1)
+            dpi: risoluzione (default config.PDF_DPI)
+            workers: thread di rasterizzazione (default config.PDF_RENDER_WORKERS)
+
+        Returns:
+            dict pagina → PIL Image (None se la pagina non è stata prodotta)
+        """
+        dpi = int(dpi or config.PDF_DPI)
+        workers = workers or config.PDF_RENDER_WORKERS or os.cpu_count()
+        for page in pages:
+            if not 1 <= page <= self.page_count:
+                raise ValueError(f"Pagina {page} fuori intervallo (1-{self.page_count})")
+
+        result = {page: _cached((self.sha256, page, dpi)) for page in pages}
+        missing = sorted(page for page, image in result.items() if image is None)
+        if not missing:
+            return result
+
+        # Un solo file temporaneo condiviso dai thread (convert_from_bytes ne scriverebbe uno per pagina)
+        handle, path = tempfile.mkstemp(suffix='.pdf')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                f.write(self.data)
+            if len(missing) == 1 or workers == 1:
+                images = [_rasterize(path, page, dpi) for page in missing]
+            else:
+                with ThreadPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+                    images = list(pool.map(lambda page: _rasterize(path, page, dpi), missing))
+        finally:
+            os.remove(path)
+
+        for page, image in zip(missing, images):
+            if image is not None:
+                _store((self.sha256, page, dpi), image)
+            result[page] = image
+        return result
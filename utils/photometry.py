@@ -1,75 +1,511 @@
-import re, math
+import math
+import os
+import numpy as np
+
+# Numero di righe di intestazione fisse EULUMDAT prima dei set di lampade (righe 1-26)
+_LDT_FIXED_HEADER = 26
+# Righe per ogni set di lampade (26a-26f) e numero di direct ratios (riga 27)
+_LDT_LAMP_SET_LINES = 6
+_LDT_DIRECT_RATIOS = 10
+
+
+def _read_source(source):
+    """Legge il contenuto di un file caricato, di un percorso o di bytes già letti"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            raw = f.read()
+    elif isinstance(source, (bytes, bytearray)):
+        raw = bytes(source)
+    else:
+        raw = source.read()
+    # ensure string
+    if isinstance(raw, bytes):
+        return raw.decode('latin1', errors='ignore')
+    return str(raw)
+
+
+def _to_float(value):
+    """Converte un campo numerico EULUMDAT (accetta la virgola decimale e campi vuoti)"""
+    value = value.strip().replace(',', '.')
+    return float(value) if value else 0.0
+
+
+def _measured_planes(symmetry, mc):
+    """
+    Restituisce (indice primo piano, numero piani) memorizzati nel file
+    per l'indicatore di simmetria EULUMDAT Isym.
+    """
+    if symmetry == 0:
+        return 0, mc
+    if symmetry == 1:
+        return 0, 1
+    if symmetry == 2:
+        return 0, mc // 2 + 1
+    if symmetry == 3:
+        # Piani da C90 a C270
+        return mc // 4, mc // 2 + 1
+    if symmetry == 4:
+        return 0, mc // 4 + 1
+    raise ValueError(f"Indicatore di simmetria LDT non valido: {symmetry}")
+
+
+def fold_c_angles(c_deg, symmetry):
+    """
+    Riporta angoli C arbitrari (gradi) nell'intervallo dei piani misurati
+    secondo la simmetria EULUMDAT. Opera su array NumPy di qualsiasi forma.
+    """
+    c = np.mod(np.asarray(c_deg, dtype=np.float64), 360.0)
+    if symmetry == 1:
+        return np.zeros_like(c)
+    if symmetry == 2:
+        # Simmetria rispetto al piano C0-C180
+        return np.where(c > 180.0, 360.0 - c, c)
+    if symmetry == 3:
+        # Simmetria rispetto al piano C90-C270: I(C) = I(180 - C)
+        return np.where((c < 90.0) | (c > 270.0), np.mod(180.0 - c, 360.0), c)
+    if symmetry == 4:
+        # Simmetria rispetto a entrambi i piani C0-C180 e C90-C270
+        c = np.mod(c, 180.0)
+        return np.where(c > 90.0, 180.0 - c, c)
+    return c
+
+
 def parse_ldt(ldt_file):
     """
-    Semplice parser per file Eulumdat (.ldt).
-    Restituisce un dizionario con alcuni campi utili quando reperibili.
-    Nota: parser semplificato per MVP. Non copre ogni possibile variante LDT.
+    Parser strutturato per file Eulumdat (.ldt).
+
+    Legge l'intestazione a posizioni fisse (Mc, Dc, Ng, Dg, simmetria, set di
+    lampade) e converte in blocco la parte numerica finale in array NumPy.
+
+    Args:
+        ldt_file: file caricato (con .read()), percorso o bytes
+
+    Returns:
+        dict con metadati e matrice intensità:
+        - 'c_angles': angoli C dei piani misurati (gradi)
+        - 'gamma_angles': angoli gamma (gradi)
+        - 'intensities': array float64 contiguo (Nc, Ng) in cd/klm
+        - 'multiplier': fattore per ottenere candele (cd = intensities * multiplier)
+        - 'symmetry': indicatore Isym (0-4), espanso su richiesta da full_intensity_matrix()
     """
-    raw = ldt_file.read()
-    # ensure string
-    if isinstance(raw, bytes):
-        text = raw.decode('latin1', errors='ignore')
-    else:
-        text = str(raw)
+    return _parse_ldt_text(_read_source(ldt_file))
+
+
+def _parse_ldt_text(text):
     lines = text.splitlines()
+    if len(lines) < _LDT_FIXED_HEADER:
+        raise ValueError("File LDT incompleto: intestazione troppo corta")
+
+    symmetry = int(_to_float(lines[2]))
+    mc = int(_to_float(lines[3]))
+    dc = _to_float(lines[4])
+    ng = int(_to_float(lines[5]))
+    dg = _to_float(lines[6])
+    n_sets = int(_to_float(lines[25]))
+    if mc < 1 or ng < 1:
+        raise ValueError(f"File LDT non valido: Mc={mc}, Ng={ng}")
 
-    result = {"raw_lines_count": len(lines)}
-
-    # Name usually in first line
-    result['name'] = lines[0].strip() if lines else "unknown"
-
-    # Try to find sequences of numbers: the LDT contains numeric blocks.
-    nums = []
-    for ln in lines:
-        # extract floats/ints from line
-        found = re.findall(r"[-+]?\d*\.\d+|\d+", ln)
-        if found:
-            nums.append([float(x) for x in found])
-
-    # Heuristic: often line ~23 contains total luminous flux; try to find any reasonable lumen number (>100)
-    total_flux = None
-    for arr in nums:
-        for val in arr:
-            if val > 100 and val < 100000:  # plausible lumen range
-                total_flux = val
-                break
-        if total_flux:
+    # Set di lampade (26a-26f ripetute per ogni set)
+    sets_start = _LDT_FIXED_HEADER
+    tail_start = sets_start + n_sets * _LDT_LAMP_SET_LINES
+    if len(lines) < tail_start:
+        raise ValueError("File LDT incompleto: set di lampade mancanti")
+    lamp_sets = []
+    for i in range(n_sets):
+        base = sets_start + i * _LDT_LAMP_SET_LINES
+        lamp_sets.append({
+            'number': int(_to_float(lines[base])),
+            'type': lines[base + 1].strip(),
+            'flux': _to_float(lines[base + 2]),
+            'color': lines[base + 3].strip(),
+            'cri': lines[base + 4].strip(),
+            'wattage': _to_float(lines[base + 5]),
+        })
+
+    # Parte numerica: direct ratios, angoli C, angoli gamma, intensità
+    first_plane, n_planes = _measured_planes(symmetry, mc)
+    expected = _LDT_DIRECT_RATIOS + mc + ng + n_planes * ng
+    values = np.array(' '.join(lines[tail_start:]).replace(',', '.').split()[:expected], dtype=np.float64)
+    if values.size < expected:
+        raise ValueError(f"File LDT incompleto: attesi {expected} valori numerici, trovati {values.size}")
+
+    pos = _LDT_DIRECT_RATIOS
+    c_all = values[pos:pos + mc]
+    pos += mc
+    gamma = values[pos:pos + ng].copy()
+    pos += ng
+    intensities = np.ascontiguousarray(values[pos:pos + n_planes * ng].reshape(n_planes, ng))
+    c_angles = c_all[first_plane:first_plane + n_planes].copy()
+    if symmetry == 1:
+        c_angles = np.zeros(1)
+
+    total_flux = sum(s['flux'] for s in lamp_sets)
+    conversion = _to_float(lines[23]) or 1.0
+    # Intensità in cd/klm: per fotometrie assolute (flusso <= 0) i valori sono già in cd
+    multiplier = conversion * (total_flux / 1000.0 if total_flux > 0 else 1.0)
+
+    result = {
+        'format': 'ldt',
+        'raw_lines_count': len(lines),
+        'manufacturer': lines[0].strip(),
+        'name': lines[8].strip() or lines[0].strip() or "unknown",
+        'luminaire_number': lines[9].strip(),
+        'symmetry': symmetry,
+        'mc': mc,
+        'dc': dc,
+        'ng': ng,
+        'dg': dg,
+        'length_mm': _to_float(lines[12]),
+        'width_mm': _to_float(lines[13]),
+        'height_mm': _to_float(lines[14]),
+        'dff': _to_float(lines[21]),
+        'lor': _to_float(lines[22]),
+        'lamp_sets': lamp_sets,
+        'total_luminous_flux': total_flux if total_flux > 0 else None,
+        'wattage': sum(s['wattage'] for s in lamp_sets),
+        'direct_ratios': values[:_LDT_DIRECT_RATIOS].copy(),
+        'c_angles_all': c_all.copy(),
+        'c_angles': c_angles,
+        'gamma_angles': gamma,
+        'intensities': intensities,
+        'multiplier': multiplier,
+    }
+    _add_derived_fields(result)
+    return result
+
+
+def _add_derived_fields(result):
+    """Campi comuni a LDT e IES calcolati dalla matrice intensità"""
+    intensities = result['intensities']
+    result['Imax'] = float(intensities.max() * result['multiplier'])
+
+    # Semi-angolo: media dei semi-angoli a metà intensità di tutti i piani C
+    if intensities.max() > 0:
+        result['semi_angle_deg_guess'] = float(beam_angles(result)['beam'].mean())
+
+
+def _unfold_c_angles(c_angles, symmetry):
+    """Ricostruisce tutti gli angoli C in [0, 360) a partire dai piani misurati"""
+    c = np.asarray(c_angles, dtype=np.float64)
+    if symmetry == 1:
+        return np.zeros(1)
+    if symmetry == 2:
+        c = np.concatenate([c, 360.0 - c])
+    elif symmetry == 3:
+        c = np.concatenate([c, 180.0 - c])
+    elif symmetry == 4:
+        c = np.concatenate([c, 180.0 - c, 180.0 + c, 360.0 - c])
+    return np.unique(np.round(np.mod(c, 360.0), 6))
+
+
+def parse_ies(ies_file):
+    """
+    Parser per file IES LM-63 (1995/2002/2019), solo fotometria di tipo C.
+
+    La parte numerica dopo la riga TILT= è convertita in blocco in un unico
+    array NumPy. Produce lo stesso dict di parse_ldt(): per i file IES
+    'intensities' è già in candele e 'multiplier' include il ballast factor.
+
+    Args:
+        ies_file: file caricato (con .read()), percorso o bytes
+
+    Returns:
+        dict fotometria (vedi parse_ldt)
+    """
+    return _parse_ies_text(_read_source(ies_file))
+
+
+def _parse_ies_text(text):
+    lines = text.splitlines()
+    keywords = {}
+    tilt_line = None
+    for i, ln in enumerate(lines):
+        stripped = ln.strip()
+        if stripped.upper().startswith('TILT='):
+            tilt_line = i
+            tilt = stripped[5:].strip().upper()
             break
-    result['total_luminous_flux'] = total_flux
-
-    # Try to get intensity distributions: find largest numeric arrays and take as intensities
-    sorted_by_len = sorted(nums, key=lambda x: len(x), reverse=True)
-    if sorted_by_len:
-        intensities = sorted_by_len[0]  # best guess
-        result['intensities_guess'] = intensities[:200]  # limit size
-        # compute Imax and attempt to estimate angle where I <= 0.5*Imax
-        Imax = max(intensities) if intensities else None
-        result['Imax'] = Imax
-        if Imax:
-            half = 0.5 * Imax
-            # assume angles evenly spaced from 0 to 180
-            n = len(intensities)
-            for i, I in enumerate(intensities):
-                if I <= half:
-                    angle_deg = (i / max(1, n-1)) * 180.0
-                    # semi-angle δ is angle where I falls to 0.5 Imax -> take that
-                    result['semi_angle_deg_guess'] = angle_deg
-                    break
+        if stripped.startswith('[') and ']' in stripped:
+            key, _, value = stripped[1:].partition(']')
+            keywords.setdefault(key.strip().upper(), value.strip())
+    if tilt_line is None:
+        raise ValueError("File IES non valido: riga TILT= mancante")
 
+    values = np.array(' '.join(lines[tilt_line + 1:]).replace(',', ' ').split(), dtype=np.float64)
+    pos = 0
+    if tilt == 'INCLUDE':
+        # Geometria lampada, numero coppie angolo/moltiplicatore, angoli, moltiplicatori
+        n_pairs = int(values[1])
+        pos = 2 + 2 * n_pairs
+    if values.size < pos + 13:
+        raise ValueError("File IES incompleto: intestazione numerica troppo corta")
+
+    (n_lamps, lumens_per_lamp, candela_mult, n_vert, n_horiz, photometric_type,
+     units, width, length, height, ballast, _, input_watts) = values[pos:pos + 13]
+    pos += 13
+    n_vert, n_horiz = int(n_vert), int(n_horiz)
+    if int(photometric_type) != 1:
+        raise ValueError("Sono supportate solo fotometrie IES di tipo C")
+    expected = pos + n_vert + n_horiz + n_vert * n_horiz
+    if values.size < expected:
+        raise ValueError(f"File IES incompleto: attesi {expected} valori numerici, trovati {values.size}")
+
+    gamma = values[pos:pos + n_vert].copy()
+    pos += n_vert
+    c_angles = values[pos:pos + n_horiz].copy()
+    pos += n_horiz
+    intensities = values[pos:pos + n_vert * n_horiz].reshape(n_horiz, n_vert)
+
+    # Simmetria dedotta dall'intervallo degli angoli orizzontali
+    c_first, c_last = c_angles[0], c_angles[-1]
+    if n_horiz == 1:
+        symmetry = 1
+    elif c_first == 0 and c_last == 90:
+        symmetry = 4
+    elif c_first == 0 and c_last == 180:
+        symmetry = 2
+    elif c_first == 90 and c_last == 270:
+        symmetry = 3
+    else:
+        symmetry = 0
+        if c_last >= 360.0:
+            # Il piano C360 duplica C0
+            c_angles = c_angles[:-1]
+            intensities = intensities[:-1]
+    intensities = np.ascontiguousarray(intensities)
+
+    to_mm = 304.8 if int(units) == 1 else 1000.0
+    lamp_flux = n_lamps * lumens_per_lamp
+    result = {
+        'format': 'ies',
+        'raw_lines_count': len(lines),
+        'manufacturer': keywords.get('MANUFAC', ''),
+        'name': keywords.get('LUMINAIRE') or keywords.get('LUMCAT') or (lines[0].strip() if lines else "unknown"),
+        'luminaire_number': keywords.get('LUMCAT', ''),
+        'symmetry': symmetry,
+        'length_mm': float(abs(length) * to_mm),
+        'width_mm': float(abs(width) * to_mm),
+        'height_mm': float(abs(height) * to_mm),
+        'total_luminous_flux': float(lamp_flux) if lamp_flux > 0 else None,
+        'wattage': float(input_watts),
+        'c_angles_all': _unfold_c_angles(c_angles, symmetry),
+        'c_angles': c_angles,
+        'gamma_angles': gamma,
+        'intensities': intensities,
+        'multiplier': float(candela_mult * (ballast or 1.0)),
+    }
+    # Fotometria assoluta (lumen per lampada = -1): il flusso è quello integrato
+    flux = luminous_flux(result)
+    if result['total_luminous_flux'] is None:
+        result['total_luminous_flux'] = flux
+    result['lor'] = float(100.0 * flux / result['total_luminous_flux']) if result['total_luminous_flux'] else 0.0
+    _add_derived_fields(result)
     return result
 
 
+def parse_photometry(source):
+    """
+    Riconosce il formato (IES o LDT) dal contenuto e restituisce il dict fotometria
+
+    Args:
+        source: file caricato (con .read()), percorso o bytes
+    """
+    text = _read_source(source)
+    head = text.lstrip()[:4096].upper()
+    if head.startswith('IES') or '\nTILT=' in head or head.startswith('TILT='):
+        return _parse_ies_text(text)
+    return _parse_ldt_text(text)
+
+
+def luminous_flux(photometry):
+    """
+    Flusso luminoso dell'apparecchio (lm) integrando la matrice intensità:
+    Φ = ∫∫ I(C, γ) sin(γ) dγ dC
+    """
+    c_full, full = full_intensity_matrix(photometry)
+    gamma = np.radians(photometry['gamma_angles'])
+    f = full * photometry['multiplier'] * np.sin(gamma)[None, :]
+    # Integrale in gamma (trapezi) per ogni piano C
+    per_plane = 0.5 * ((f[:, 1:] + f[:, :-1]) * np.diff(gamma)[None, :]).sum(axis=1)
+    # Peso di ogni piano C: metà della distanza dai piani adiacenti (con chiusura a 360°)
+    c = np.radians(np.asarray(c_full, dtype=np.float64))
+    if c.size == 1:
+        return float(per_plane[0] * 2.0 * np.pi)
+    widths = (np.roll(c, -1) - np.roll(c, 1)) % (2.0 * np.pi) / 2.0
+    return float((per_plane * widths).sum())
+
+
+def full_intensity_matrix(photometry):
+    """
+    Espande la simmetria e restituisce (angoli C completi, matrice (Mc, Ng)).
+    Il risultato è calcolato alla prima richiesta e memorizzato nel dict.
+    """
+    cached = photometry.get('_full_matrix')
+    if cached is not None:
+        return cached
+
+    symmetry = photometry.get('symmetry', 0)
+    c_meas = photometry['c_angles']
+    intensities = photometry['intensities']
+    c_full = photometry.get('c_angles_all')
+    if c_full is None or len(c_full) == 0:
+        c_full = c_meas
+    if symmetry == 0:
+        full = (np.asarray(c_full, dtype=np.float64), intensities)
+    else:
+        folded = fold_c_angles(c_full, symmetry)
+        # Ogni piano completo corrisponde al piano misurato più vicino dopo il ripiegamento
+        idx = np.abs(folded[:, None] - c_meas[None, :]).argmin(axis=1)
+        full = (np.asarray(c_full, dtype=np.float64), np.ascontiguousarray(intensities[idx]))
+    photometry['_full_matrix'] = full
+    return full
+
+
+def interpolation_table(photometry):
+    """
+    Griglia (angoli C, angoli gamma, matrice in cd) per l'interpolazione.
+    Per Isym=0 i piani sono estesi di un periodo per gestire il passaggio a C=360.
+    """
+    cached = photometry.get('_interp_table')
+    if cached is not None:
+        return cached
+
+    c_grid = np.asarray(photometry['c_angles'], dtype=np.float64)
+    table = np.asarray(photometry['intensities'], dtype=np.float64) * photometry['multiplier']
+    if photometry.get('symmetry', 0) == 0 and c_grid.size > 1:
+        c_grid = np.concatenate([[c_grid[-1] - 360.0], c_grid, [c_grid[0] + 360.0]])
+        table = np.concatenate([table[-1:], table, table[:1]])
+    gamma_grid = np.asarray(photometry['gamma_angles'], dtype=np.float64)
+    cached = (c_grid, gamma_grid, np.ascontiguousarray(table))
+    photometry['_interp_table'] = cached
+    return cached
+
+
+def _bracket(grid, values):
+    """Indice inferiore e peso lineare di ogni valore nella griglia ordinata"""
+    if grid.size == 1:
+        return np.zeros(values.shape, dtype=np.intp), np.zeros(values.shape)
+    idx = np.clip(np.searchsorted(grid, values, side='right') - 1, 0, grid.size - 2)
+    lo = grid[idx]
+    weight = np.clip((values - lo) / (grid[idx + 1] - lo), 0.0, 1.0)
+    return idx, weight
+
+
+def intensity_at(photometry, c_deg, gamma_deg):
+    """
+    Intensità luminosa (cd) in direzioni arbitrarie, interpolata bilinearmente.
+
+    Gli angoli C sono ripiegati secondo la simmetria EULUMDAT (Isym 0-4) e,
+    senza simmetria, interpolati anche attraverso C=360. Fuori
+    dall'intervallo gamma misurato l'intensità è zero.
+
+    Args:
+        photometry: dict fotometria (parse_ldt / parse_ies)
+        c_deg: array di angoli C (gradi), qualsiasi forma
+        gamma_deg: array di angoli gamma (gradi), broadcast con c_deg
+
+    Returns:
+        array di intensità (cd) con la forma del broadcast degli input
+    """
+    c_deg, gamma_deg = np.broadcast_arrays(np.asarray(c_deg, dtype=np.float64),
+                                           np.asarray(gamma_deg, dtype=np.float64))
+    c_grid, gamma_grid, table = interpolation_table(photometry)
+    c = fold_c_angles(c_deg, photometry.get('symmetry', 0))
+
+    ci, cw = _bracket(c_grid, c)
+    gi, gw = _bracket(gamma_grid, gamma_deg)
+    ci1 = np.minimum(ci + 1, c_grid.size - 1)
+    gi1 = np.minimum(gi + 1, gamma_grid.size - 1)
+
+    flat = table.ravel()
+    ng = gamma_grid.size
+    i00 = flat[ci * ng + gi]
+    i01 = flat[ci * ng + gi1]
+    i10 = flat[ci1 * ng + gi]
+    i11 = flat[ci1 * ng + gi1]
+    result = ((1.0 - cw) * ((1.0 - gw) * i00 + gw * i01)
+              + cw * ((1.0 - gw) * i10 + gw * i11))
+    outside = (gamma_deg < gamma_grid[0]) | (gamma_deg > gamma_grid[-1])
+    return np.where(outside, 0.0, result)
+
+
+def _threshold_angles(gamma, matrix, fraction):
+    """
+    Per ogni riga della matrice, angolo gamma (interpolato linearmente) oltre
+    il picco dove l'intensità scende sotto fraction * massimo della riga.
+    """
+    peak = matrix.argmax(axis=1)
+    threshold = fraction * matrix.max(axis=1)
+    cols = np.arange(matrix.shape[1])
+    below = (matrix < threshold[:, None]) & (cols[None, :] > peak[:, None])
+    found = below.any(axis=1)
+    hi = np.where(found, below.argmax(axis=1), matrix.shape[1] - 1)
+    lo = np.maximum(hi - 1, 0)
+    rows = np.arange(matrix.shape[0])
+    i_lo = matrix[rows, lo]
+    i_hi = matrix[rows, hi]
+    span = np.where(i_lo != i_hi, i_lo - i_hi, 1.0)
+    t = np.clip((i_lo - threshold) / span, 0.0, 1.0)
+    angles = gamma[lo] + t * (gamma[hi] - gamma[lo])
+    return np.where(found, angles, gamma[-1])
+
+
+def beam_angles(photometry):
+    """
+    Semi-angoli di fascio (50% Imax) e di campo (10% Imax) per ogni piano C.
+
+    Calcolati in un'unica operazione vettoriale sulla matrice espansa e
+    memorizzati nel dict fotometria.
+
+    Returns:
+        dict con 'c_angles', 'beam' e 'field' (semi-angoli in gradi per piano)
+    """
+    cached = photometry.get('_beam_angles')
+    if cached is not None:
+        return cached
+    c_full, full = full_intensity_matrix(photometry)
+    gamma = np.asarray(photometry['gamma_angles'], dtype=np.float64)
+    cached = {
+        'c_angles': np.asarray(c_full, dtype=np.float64),
+        'beam': _threshold_angles(gamma, full, 0.5),
+        'field': _threshold_angles(gamma, full, 0.1),
+    }
+    photometry['_beam_angles'] = cached
+    return cached
+
+
+def plane_half_angle(photometry, c_deg, kind='beam'):
+    """Semi-angolo di fascio ('beam') o campo ('field') interpolato sul piano C richiesto"""
+    angles = beam_angles(photometry)
+    c = angles['c_angles']
+    if c.size == 1:
+        return float(angles[kind][0])
+    return float(np.interp(c_deg % 360.0, c, angles[kind], period=360.0))
+
+
 def estimate_beam_angle_from_ldt(parsed_ldt):
     """
     Return estimated semi-angle delta in degrees from parsed LDT dict.
     """
     if not parsed_ldt:
         raise ValueError("No parsed LDT provided")
+    if parsed_ldt.get('intensities') is not None:
+        return float(beam_angles(parsed_ldt)['beam'].mean())
     if parsed_ldt.get('semi_angle_deg_guess'):
         return parsed_ldt['semi_angle_deg_guess']
     # fallback: use default
     raise ValueError("Unable to estimate angle from this .LDT file (parser fallback)")
 
+def default_beam_angle(photometry, fallback=15):
+    """
+    Semi-angolo proposto per un'area (gradi interi 1-90): dalla matrice
+    intensità se presente, altrimenti fallback
+    """
+    if photometry and photometry.get('intensities') is not None:
+        return int(min(90, max(1, round(estimate_beam_angle_from_ldt(photometry)))))
+    return fallback
+
+
 def calculate_beam_spread(h, hc, delta_deg):
     """
     Compute beam width (diameter) on calculation plane:
@@ -77,3 +513,19 @@ def calculate_beam_spread(h, hc, delta_deg):
     where delta is semi-angle in degrees.
     """
     return (h - hc) * math.tan(math.radians(delta_deg)) * 2.0
+
+
+def calculate_beam_spread_xy(h, hc, photometry, kind='beam', max_angle_deg=85.0):
+    """
+    Larghezze del fascio sul piano di calcolo lungo X (piani C0/C180) e
+    Y (piani C90/C270), per ottiche asimmetriche o fasci allungati.
+
+    Returns:
+        (larghezza_x, larghezza_y) in metri
+    """
+    dh = h - hc
+
+    def half(c):
+        return math.tan(math.radians(min(plane_half_angle(photometry, c, kind), max_angle_deg)))
+
+    return dh * (half(0.0) + half(180.0)), dh * (half(90.0) + half(270.0))
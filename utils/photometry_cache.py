@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+import numpy as np
+
+import config
+from utils.photometry import parse_photometry
+
+# Chiave dell'array che contiene i metadati non numerici in formato JSON
+_META_KEY = '__meta__'
+
+# Versione del formato delle fotometrie in cache: va incrementata quando cambia
+# l'output dei parser, così le voci scritte prima non vengono più servite
+CACHE_SCHEMA_VERSION = 2
+
+
+def _read_bytes(source):
+    """Restituisce i bytes di un file caricato (Streamlit UploadedFile), percorso o bytes"""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return f.read()
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return source.read()
+
+
+def _json_default(value):
+    """Converte scalari e array NumPy annidati in tipi serializzabili JSON"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Tipo non serializzabile: {type(value)}")
+
+
+class PhotometryCache:
+    """
+    Cache fotometrie indicizzata per contenuto (SHA-256 dei bytes del file,
+    della versione dello schema e del parser usato).
+
+    Le fotometrie elaborate sono salvate su disco come .npz (array binari +
+    metadati JSON) con eviction per dimensione totale, e tenute in una LRU
+    in memoria di dimensione limitata.
+    """
+
+    def __init__(self, cache_dir=None, max_memory_items=None, max_disk_bytes=None):
+        self.cache_dir = cache_dir or config.PHOTOMETRY_CACHE_DIR
+        self.max_memory_items = max_memory_items or config.PHOTOMETRY_CACHE_MEMORY_ITEMS
+        self.max_disk_bytes = max_disk_bytes or config.PHOTOMETRY_CACHE_MAX_MB * 1024 * 1024
+        self._memory = OrderedDict()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key_for(data, parser=parse_photometry):
+        """
+        Chiave di cache: SHA-256 esadecimale di versione dello schema, nome del
+        parser e SHA-256 dei bytes del file
+        """
+        parser_name = f"{parser.__module__}.{parser.__qualname__}"
+        content = hashlib.sha256(data).hexdigest()
+        return hashlib.sha256(f"{CACHE_SCHEMA_VERSION}:{parser_name}:{content}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _remember(self, key, photometry):
+        self._memory[key] = photometry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Restituisce la fotometria in cache (memoria, poi disco) oppure None"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                photometry = json.loads(str(data[_META_KEY]))
+                for name in data.files:
+                    if name != _META_KEY:
+                        photometry[name] = data[name]
+        except Exception:
+            # File corrotto o scritto da una versione diversa: si rielabora
+            os.remove(path)
+            return None
+        # Aggiorna mtime: l'eviction su disco rimuove prima i file meno usati
+        os.utime(path)
+        photometry['cache_key'] = key
+        self._remember(key, photometry)
+        return photometry
+
+    def put(self, key, photometry):
+        """Salva la fotometria in memoria e su disco (.npz compresso)"""
+        arrays = {}
+        meta = {}
+        for name, value in photometry.items():
+            # Le chiavi con '_' sono valori derivati ricalcolabili (es. simmetria espansa)
+            if name.startswith('_'):
+                continue
+            if isinstance(value, np.ndarray):
+                arrays[name] = value
+            else:
+                meta[name] = value
+        arrays[_META_KEY] = np.array(json.dumps(meta, default=_json_default))
+
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+
+        self._remember(key, photometry)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        """Rimuove i file meno recenti finché la cache rientra in max_disk_bytes"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.npz'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.max_disk_bytes:
+            return
+        for _, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_disk_bytes:
+                break
+
+    def load(self, source, parser=parse_photometry):
+        """
+        Restituisce la fotometria del file, elaborandola solo se non è già in cache
+
+        Args:
+            source: file caricato, percorso o bytes
+            parser: funzione di parsing da usare in caso di cache miss
+
+        Returns:
+            dict fotometria con le chiavi 'sha256' del contenuto e 'cache_key'
+            (chiave con cui riscriverla in cache, vedi put)
+        """
+        data = _read_bytes(source)
+        key = self.key_for(data, parser)
+        photometry = self.get(key)
+        if photometry is None:
+            photometry = parser(data)
+            photometry['sha256'] = hashlib.sha256(data).hexdigest()
+            photometry['cache_key'] = key
+            self.put(key, photometry)
+        return photometry
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """Cache condivisa dal processo (tutte le sessioni Streamlit)"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PhotometryCache()
+    return _default_cache
+
+
+def load_photometry(source, parser=parse_photometry):
+    """Carica una fotometria passando dalla cache condivisa"""
+    return get_default_cache().load(source, parser)
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import config
+from utils.photometry import parse_photometry
+from utils.photometry_cache import load_photometry
+
+# Estensioni dei file fotometrici indicizzati
+LIBRARY_EXTENSIONS = ('.ldt', '.ies')
+
+# Colonne dell'indice: un file .npy per colonna, aperto in memory-map.
+# Le colonne di testo ('S') hanno la larghezza del valore più lungo (UTF-8), senza troncare.
+INDEX_COLUMNS = {
+    'path': 'S',
+    'name': 'S',
+    'manufacturer': 'S',
+    'format': 'S',
+    'sha256': 'S',
+    'mtime': 'f8',
+    'size': 'i8',
+    'flux': 'f4',
+    'imax': 'f4',
+    'beam_angle': 'f4',
+    'wattage': 'f4',
+    'length_mm': 'f4',
+    'width_mm': 'f4',
+    'height_mm': 'f4',
+}
+
+_TEXT_COLUMNS = ('path', 'name', 'manufacturer', 'format', 'sha256')
+
+# Manifesto con la cartella della versione corrente dell'indice (sostituito con un solo os.replace)
+MANIFEST_NAME = 'manifest.json'
+
+
+def _encode(value):
+    return (value or '').encode('utf-8')
+
+
+def library_index_exists(index_dir=None):
+    """True se la cartella contiene un indice completo"""
+    return os.path.exists(os.path.join(index_dir or config.PHOTOMETRY_INDEX_DIR, MANIFEST_NAME))
+
+
+def _summarize_file(task):
+    """
+    Worker: calcola hash e campi riassuntivi di un file fotometrico.
+    Se l'hash coincide con quello già indicizzato il file non viene rielaborato.
+    """
+    path, known_sha = task
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        sha = hashlib.sha256(data).hexdigest()
+        if sha == known_sha:
+            return path, sha, None, None
+        parsed = parse_photometry(data)
+    except Exception as e:
+        return path, None, None, str(e)
+
+    semi_angle = parsed.get('semi_angle_deg_guess')
+    summary = {
+        'name': parsed.get('name', ''),
+        'manufacturer': parsed.get('manufacturer', ''),
+        'format': parsed.get('format', ''),
+        'flux': parsed.get('total_luminous_flux') or 0.0,
+        'imax': parsed.get('Imax') or 0.0,
+        'beam_angle': 2.0 * semi_angle if semi_angle else np.nan,
+        'wattage': parsed.get('wattage') or 0.0,
+        'length_mm': parsed.get('length_mm', 0.0),
+        'width_mm': parsed.get('width_mm', 0.0),
+        'height_mm': parsed.get('height_mm', 0.0),
+    }
+    return path, sha, summary, None
+
+
+def _scan_directory(directory):
+    """Elenca i file fotometrici (ricorsivamente) con mtime e dimensione"""
+    found = []
+    for root, _, files in os.walk(directory):
+        for fname in files:
+            if fname.lower().endswith(LIBRARY_EXTENSIONS):
+                path = os.path.join(root, fname)
+                stat = os.stat(path)
+                found.append((path, stat.st_mtime, stat.st_size))
+    found.sort()
+    return found
+
+
+def build_library_index(directory, index_dir=None, workers=None):
+    """
+    Indicizza una cartella di fotometrie in un indice colonnare su disco
+
+    Solo i file nuovi o con mtime/dimensione cambiati sono riletti; se il
+    contenuto (SHA-256) non è cambiato il riepilogo esistente è riutilizzato.
+
+    Args:
+        directory: cartella con file .ldt / .ies
+        index_dir: cartella dell'indice (default config.PHOTOMETRY_INDEX_DIR)
+        workers: processi per il parsing (default config.PHOTOMETRY_INDEX_WORKERS)
+
+    Returns:
+        dict con 'total', 'rescanned' (file riletti perché nuovi o con mtime/dimensione
+        cambiati), 'parsed' (contenuto cambiato), 'reused', 'errors' (lista di (path, messaggio))
+    """
+    index_dir = index_dir or config.PHOTOMETRY_INDEX_DIR
+    workers = workers or config.PHOTOMETRY_INDEX_WORKERS or os.cpu_count()
+
+    previous = {}
+    if library_index_exists(index_dir):
+        old = PhotometryLibrary(index_dir)
+        for i in range(len(old)):
+            previous[old.columns['path'][i].decode('utf-8', errors='ignore')] = i
+    else:
+        old = None
+
+    files = _scan_directory(directory)
+    rows = {}
+    tasks = []
+    for path, mtime, size in files:
+        i = previous.get(path)
+        if i is not None and old.columns['mtime'][i] == mtime and old.columns['size'][i] == size:
+            rows[path] = old.row(i)
+        else:
+            known_sha = old.columns['sha256'][i].decode() if i is not None else None
+            tasks.append((path, known_sha))
+
+    errors = []
+    parsed_count = 0
+    if tasks:
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_summarize_file, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+        else:
+            results = [_summarize_file(t) for t in tasks]
+        for path, sha, summary, error in results:
+            if error:
+                errors.append((path, error))
+                continue
+            if summary is None:
+                # Contenuto invariato: si aggiorna solo mtime/dimensione
+                summary = old.row(previous[path])
+            else:
+                parsed_count += 1
+            summary['sha256'] = sha
+            rows[path] = summary
+
+    stats = {path: (mtime, size) for path, mtime, size in files}
+    paths = [p for p, _, _ in files if p in rows]
+    columns = {}
+    for name, dtype in INDEX_COLUMNS.items():
+        if name == 'path':
+            values = [_encode(p) for p in paths]
+        elif name == 'mtime':
+            values = [stats[p][0] for p in paths]
+        elif name == 'size':
+            values = [stats[p][1] for p in paths]
+        elif name in _TEXT_COLUMNS:
+            values = [_encode(rows[p].get(name)) for p in paths]
+        else:
+            values = [rows[p].get(name, 0.0) for p in paths]
+        columns[name] = np.array(values, dtype=dtype)
+    _write_columns(index_dir, columns)
+
+    return {
+        'total': len(paths),
+        'rescanned': len(tasks),
+        'parsed': parsed_count,
+        'reused': len(paths) - parsed_count,
+        'errors': errors,
+    }
+
+
+def _write_columns(index_dir, columns):
+    """
+    Scrive tutte le colonne in una nuova cartella e la rende corrente sostituendo
+    il manifesto con un solo os.replace: chi apre l'indice durante la scrittura
+    vede sempre colonne della stessa versione.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    version_dir = tempfile.mkdtemp(prefix='index-', dir=index_dir)
+    for name, values in columns.items():
+        np.save(os.path.join(version_dir, f"{name}.npy"), values)
+    manifest = {'directory': os.path.basename(version_dir), 'rows': len(columns['path'])}
+    tmp_path = os.path.join(index_dir, f"{MANIFEST_NAME}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(index_dir, MANIFEST_NAME))
+
+    # Versioni precedenti: su Windows restano finché qualcuno le ha in memory-map
+    for entry in os.listdir(index_dir):
+        if entry.startswith('index-') and entry != manifest['directory']:
+            shutil.rmtree(os.path.join(index_dir, entry), ignore_errors=True)
+
+
+class PhotometryLibrary:
+    """Catalogo fotometrie indicizzato, con colonne aperte in memory-map"""
+
+    def __init__(self, index_dir=None):
+        self.index_dir = index_dir or config.PHOTOMETRY_INDEX_DIR
+        for attempt in range(3):
+            try:
+                self.columns = self._open_version()
+                break
+            except FileNotFoundError:
+                # Versione sostituita e rimossa tra la lettura del manifesto e l'apertura
+                if attempt == 2:
+                    raise
+
+    def _open_version(self):
+        with open(os.path.join(self.index_dir, MANIFEST_NAME)) as f:
+            version_dir = os.path.join(self.index_dir, json.load(f)['directory'])
+        return {
+            name: np.load(os.path.join(version_dir, f"{name}.npy"), mmap_mode='r')
+            for name in INDEX_COLUMNS
+        }
+
+    def __len__(self):
+        return len(self.columns['path'])
+
+    def row(self, i):
+        """Restituisce la riga i dell'indice come dict"""
+        record = {}
+        for name in INDEX_COLUMNS:
+            value = self.columns[name][i]
+            if name in _TEXT_COLUMNS:
+                record[name] = bytes(value).decode('utf-8', errors='ignore')
+            else:
+                record[name] = value.item()
+        return record
+
+    def search(self, text=None, min_flux=None, max_flux=None, min_beam=None, max_beam=None, max_wattage=None):
+        """
+        Filtra il catalogo con operazioni vettoriali sulle colonne
+
+        Args:
+            text: testo cercato (senza distinzione maiuscole) in nome, produttore e percorso
+            min_flux, max_flux: intervallo flusso (lm)
+            min_beam, max_beam: intervallo angolo fascio (gradi)
+            max_wattage: potenza massima (W)
+
+        Returns:
+            array di indici delle righe trovate
+        """
+        cols = self.columns
+        mask = np.ones(len(self), dtype=bool)
+        if min_flux is not None:
+            mask &= cols['flux'] >= min_flux
+        if max_flux is not None:
+            mask &= cols['flux'] <= max_flux
+        if min_beam is not None:
+            mask &= cols['beam_angle'] >= min_beam
+        if max_beam is not None:
+            mask &= cols['beam_angle'] <= max_beam
+        if max_wattage is not None:
+            mask &= cols['wattage'] <= max_wattage
+        if text:
+            # Stessa conversione di np.char.lower sui byte (solo ASCII), valida anche per testo UTF-8
+            needle = text.encode('utf-8').lower()
+            idx = np.nonzero(mask)[0]
+            hit = np.zeros(idx.size, dtype=bool)
+            for name in ('name', 'manufacturer', 'path'):
+                hit |= np.char.find(np.char.lower(cols[name][idx]), needle) >= 0
+            mask[idx] = hit
+        return np.nonzero(mask)[0]
+
+    def load(self, i):
+        """Carica la fotometria completa della riga i (passando dalla cache)"""
+        return load_photometry(self.row(i)['path'])
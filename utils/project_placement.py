@@ -0,0 +1,287 @@
+import math
+import numpy as np
+
+import config
+from utils.geometry import area_shape, points_in_shapes
+from utils.photometry import calculate_beam_spread, calculate_beam_spread_xy, default_beam_angle
+
+
+class ProjectPlacement:
+    """
+    Posizioni delle lampade di tutto il progetto in forma colonnare
+
+    Gli array area, x, y e photometry sono paralleli (una riga per lampada) e
+    ordinati per area: le lampade dell'area i sono le righe offsets[i]:offsets[i + 1].
+    Gli array per area (beam_width, spacing_x, ...) hanno una riga per area.
+    """
+
+    def __init__(self, area, x, y, photometry, photometry_names, n_areas, beam_width, beam_width_y,
+                 spacing_x, spacing_y, patterns=None):
+        self.area = area
+        self.x = x
+        self.y = y
+        self.photometry = photometry
+        self.photometry_names = photometry_names
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(area, minlength=n_areas))])
+        self.beam_width = beam_width
+        self.beam_width_y = beam_width_y
+        self.spacing_x = spacing_x
+        self.spacing_y = spacing_y
+        self.patterns = list(patterns) if patterns is not None else ['grid'] * n_areas
+
+    @property
+    def counts(self):
+        """Numero di lampade per area"""
+        return np.diff(self.offsets)
+
+    def positions(self, area_idx):
+        """Posizioni [(x, y), ...] in m delle lampade di un'area"""
+        start, stop = self.offsets[area_idx], self.offsets[area_idx + 1]
+        return list(zip(self.x[start:stop].tolist(), self.y[start:stop].tolist()))
+
+
+# Schemi di posizionamento
+PATTERNS = ('grid', 'staggered', 'hex', 'line')
+
+# Passi (lungo la fila, tra le file) in unità del passo della griglia, a parità di raggio
+# di copertura (metà diagonale della cella): la griglia copre con raggio √2/2, le file
+# sfalsate possono allontanarsi fino a ρ + √(ρ² - 1/4), il reticolo esagonale ha lato ρ√3.
+_RHO = math.sqrt(2.0) / 2.0
+_PATTERN_PITCH = {
+    'grid': (1.0, 1.0),
+    'staggered': (1.0, _RHO + math.sqrt(_RHO * _RHO - 0.25)),
+    'hex': (_RHO * math.sqrt(3.0), _RHO * math.sqrt(3.0) * math.sqrt(3.0) / 2.0),
+    'line': (1.0, 1.0),
+}
+
+
+def _axis_grid(start, stop, step):
+    """
+    Coordinate start, start+step, ... minori di stop per molte righe insieme
+    (somme successive, stessi arrotondamenti di un ciclo x += step)
+
+    Returns:
+        (matrice coordinate, numero di coordinate valide per riga)
+    """
+    span = np.where(step > 0, (stop - start) / np.where(step > 0, step, 1.0), 0.0)
+    count = np.where((step > 0) & (start < stop), np.ceil(np.maximum(span, 0.0)).astype(np.int64) + 2, 0)
+    width = int(count.max()) + 1 if count.size else 1
+    steps = np.repeat(step[:, None], width, axis=1)
+    steps[:, 0] = start
+    values = np.add.accumulate(steps, axis=1)
+    # I valori crescono lungo la riga: quelli validi sono un prefisso
+    valid = (values < stop[:, None]) & (np.arange(width)[None, :] <= count[:, None])
+    return values, valid.sum(axis=1)
+
+
+def pattern_candidates(bounds, step_x, step_y, patterns='grid', start_offset=0.5):
+    """
+    Posizioni candidate di uno schema nell'ingombro di molte aree insieme
+
+    'grid' è la griglia ortogonale, 'staggered' ha le file alternate spostate di
+    mezzo passo e più distanti, 'hex' è il reticolo esagonale, 'line' una fila
+    singola lungo il lato maggiore (corridoi). Gli schemi hanno lo stesso raggio
+    di copertura della griglia con passi step_x, step_y.
+
+    Args:
+        bounds: array (A, 4) di ingombri (min_x, min_y, max_x, max_y) in m
+        step_x, step_y: passi della griglia per area (m)
+        patterns: schema per tutte le aree o uno per area (vedi PATTERNS)
+        start_offset: offset di partenza dal bordo (m)
+
+    Returns:
+        (area, xy) con indice area (N,) e posizioni (N, 2), ordinate per area, x e y
+    """
+    bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+    n = bounds.shape[0]
+    patterns = [patterns] * n if isinstance(patterns, str) else list(patterns)
+    for pattern in patterns:
+        if pattern not in _PATTERN_PITCH:
+            raise ValueError(f"Schema di posizionamento non valido: {pattern}")
+    step_x = np.asarray(step_x, dtype=np.float64).reshape(n)
+    step_y = np.asarray(step_y, dtype=np.float64).reshape(n)
+    pitch = np.array([_PATTERN_PITCH[p] for p in patterns]).reshape(n, 2)
+    shifted = np.array([p in ('staggered', 'hex') for p in patterns], dtype=bool)
+    line = np.array([p == 'line' for p in patterns], dtype=bool)
+
+    # Schema costruito per file lungo u; le file singole verticali scambiano gli assi
+    min_x, min_y, max_x, max_y = bounds.T
+    vertical = line & (max_y - min_y > max_x - min_x)
+    u0, u1 = np.where(vertical, min_y, min_x), np.where(vertical, max_y, max_x)
+    v0, v1 = np.where(vertical, min_x, min_y), np.where(vertical, max_x, max_y)
+    pitch_u = np.where(vertical, step_y, step_x) * pitch[:, 0]
+    pitch_v = np.where(vertical, step_x, step_y) * pitch[:, 1]
+
+    rows, n_rows = _axis_grid(v0 + start_offset, v1, pitch_v)
+    rows[line, 0] = 0.5 * (v0[line] + v1[line])
+    n_rows = np.where(line, 1, n_rows)
+    even, n_even = _axis_grid(u0 + start_offset, u1, pitch_u)
+    odd, n_odd = _axis_grid(u0 + start_offset + np.where(shifted, 0.5 * pitch_u, 0.0), u1, pitch_u)
+
+    # File di tutte le aree, poi punti di ogni fila
+    row_owner = np.repeat(np.arange(n), n_rows)
+    row_index = np.arange(row_owner.size) - np.repeat(np.cumsum(n_rows) - n_rows, n_rows)
+    row_odd = (row_index % 2) == 1
+    per_row = np.where(row_odd, n_odd[row_owner], n_even[row_owner])
+    owner = np.repeat(row_owner, per_row)
+    index = np.repeat(row_index, per_row)
+    column = np.arange(owner.size) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+    u = np.where(np.repeat(row_odd, per_row), odd[owner, column], even[owner, column])
+    v = rows[owner, index]
+    x = np.where(vertical[owner], v, u)
+    y = np.where(vertical[owner], u, v)
+
+    # Ordine per colonne come la scansione x → y della griglia
+    order = np.lexsort((y, x, owner))
+    return owner[order], np.column_stack([x[order], y[order]])
+
+
+def _grid_steps(shapes, beam_widths, beam_widths_y):
+    """Ingombri e passi reali della griglia per area (stesse formule di calculate_spacing)"""
+    bounds = np.array([[*np.min(s.outer, axis=0), *np.max(s.outer, axis=0)] if len(s.outer) >= 2
+                       else [0.0, 0.0, -1.0, -1.0] for s in shapes], dtype=np.float64).reshape(-1, 4)
+    width = bounds[:, 2] - bounds[:, 0]
+    height = bounds[:, 3] - bounds[:, 1]
+    spacing_x = beam_widths * config.BEAM_OVERLAP_FACTOR
+    spacing_y = beam_widths_y * config.BEAM_OVERLAP_FACTOR
+    spacing_x = np.where(spacing_x <= 0, 1.0, spacing_x)
+    spacing_y = np.where(spacing_y <= 0, 1.0, spacing_y)
+    step_x = width / np.maximum(1, np.ceil(width / spacing_x))
+    step_y = height / np.maximum(1, np.ceil(height / spacing_y))
+    return bounds, step_x, step_y
+
+
+def batch_lamp_positions(shapes, beam_widths, beam_widths_y=None, start_offset=0.5, memory_budget_mb=None,
+                         patterns='grid'):
+    """
+    Posizioni delle lampade per molte aree in un'unica operazione vettoriale
+
+    Passi, candidati e test di contenimento (fori e zone escluse compresi) sono
+    calcolati su array di tutte le aree; il risultato coincide con
+    LampPlacementCalculator.generate_lamp_positions area per area.
+
+    Args:
+        shapes: lista di AreaShape in m
+        beam_widths: larghezze del fascio lungo X (una per area)
+        beam_widths_y: larghezze lungo Y (default = beam_widths)
+        start_offset: offset di partenza dal bordo (m)
+        memory_budget_mb: budget per il test di contenimento
+        patterns: schema per tutte le aree o uno per area (vedi PATTERNS)
+
+    Returns:
+        (area, xy) con indice area (N,) e posizioni (N, 2) in m, ordinate per area
+    """
+    if len(shapes) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 2))
+    beam_widths = np.asarray(beam_widths, dtype=np.float64)
+    beam_widths_y = beam_widths if beam_widths_y is None else np.asarray(beam_widths_y, dtype=np.float64)
+    bounds, step_x, step_y = _grid_steps(shapes, beam_widths, beam_widths_y)
+    owners, candidates = pattern_candidates(bounds, step_x, step_y, patterns, start_offset)
+    inside = points_in_shapes(candidates, owners, shapes, memory_budget_mb)
+    return owners[inside], candidates[inside]
+
+
+def pattern_counts(shapes, beam_widths, beam_widths_y=None, patterns=PATTERNS, start_offset=0.5):
+    """
+    Numero di lampade di ogni schema per ogni area: un passaggio vettoriale per schema
+
+    Returns:
+        dict schema → array (A,) di conteggi
+    """
+    n = len(shapes)
+    return {pattern: np.bincount(batch_lamp_positions(shapes, beam_widths, beam_widths_y, start_offset,
+                                                      patterns=pattern)[0], minlength=n)
+            for pattern in patterns}
+
+
+def fewest_lamps_patterns(shapes, beam_widths, beam_widths_y=None, start_offset=0.5):
+    """
+    Schema con meno lampade per ogni area, a parità di raggio di copertura
+
+    La fila singola è ammessa solo nelle aree strette (corridoi), dove la griglia
+    avrebbe comunque una sola fila lungo il lato minore.
+
+    Returns:
+        lista di nomi di schema, uno per area
+    """
+    n = len(shapes)
+    if n == 0:
+        return []
+    beam_widths = np.asarray(beam_widths, dtype=np.float64)
+    beam_widths_y = beam_widths if beam_widths_y is None else np.asarray(beam_widths_y, dtype=np.float64)
+    bounds, step_x, step_y = _grid_steps(shapes, beam_widths, beam_widths_y)
+    width = bounds[:, 2] - bounds[:, 0]
+    height = bounds[:, 3] - bounds[:, 1]
+    narrow = np.where(height > width, width <= step_x, height <= step_y)
+
+    counts = pattern_counts(shapes, beam_widths, beam_widths_y, PATTERNS, start_offset)
+    table = np.column_stack([counts[p] for p in PATTERNS]).astype(np.float64)
+    table[~narrow, PATTERNS.index('line')] = np.inf
+    # Aree senza lampade in uno schema: quello schema non è una soluzione
+    table[table == 0] = np.inf
+    best = np.argmin(table, axis=1)
+    return [PATTERNS[i] if np.isfinite(table[k, i]) else 'grid' for k, i in enumerate(best)]
+
+
+def place_project(areas, photometries, pixels_per_meter=None, beam_angles=None, plane_widths=None,
+                  start_offset=0.5, patterns=None):
+    """
+    Posizionamento delle lampade di tutte le aree del progetto in un'unica chiamata
+
+    Le larghezze del fascio sono calcolate una volta per gruppo di aree con la
+    stessa fotometria, le stesse altezze e lo stesso angolo; griglie e test di
+    contenimento sono poi un unico calcolo vettoriale su tutte le aree.
+
+    Args:
+        areas: lista di dict area (come in st.session_state.areas)
+        photometries: dict nome → fotometria
+        pixels_per_meter: scala della planimetria
+        beam_angles: semi-angolo per area (None = default_beam_angle della fotometria)
+        plane_widths: per area, True per usare le larghezze X/Y dalla matrice intensità
+            (None = quando la matrice è presente)
+        start_offset: offset di partenza dal bordo (m)
+        patterns: schema per area (vedi PATTERNS; 'auto' = quello con meno lampade, None = 'grid')
+
+    Returns:
+        ProjectPlacement
+    """
+    n = len(areas)
+    patterns = [p or 'grid' for p in patterns] if patterns is not None else ['grid'] * n
+    beam_angles = list(beam_angles) if beam_angles is not None else [None] * n
+    plane_widths = list(plane_widths) if plane_widths is not None else [None] * n
+    names = sorted({area.get('photometry', '') for area in areas})
+    codes = {name: i for i, name in enumerate(names)}
+
+    # Larghezze del fascio per gruppo (fotometria, altezze, angolo, larghezze X/Y)
+    groups = {}
+    for idx, area in enumerate(areas):
+        photom = photometries.get(area.get('photometry'), {})
+        has_matrix = photom.get('intensities') is not None
+        angle = beam_angles[idx] if beam_angles[idx] is not None else default_beam_angle(photom)
+        use_xy = has_matrix and (plane_widths[idx] if plane_widths[idx] is not None else True)
+        key = (area.get('photometry'), area['height_mounting'], area['height_calc_plane'],
+               None if use_xy else angle, use_xy)
+        groups.setdefault(key, []).append(idx)
+
+    beam_width = np.zeros(n)
+    beam_width_y = np.zeros(n)
+    for (name, h, hc, angle, use_xy), members in groups.items():
+        if use_xy:
+            bx, by = calculate_beam_spread_xy(h, hc, photometries[name])
+        else:
+            bx = by = calculate_beam_spread(h, hc, angle)
+        beam_width[members] = bx
+        beam_width_y[members] = by
+
+    shapes = [area_shape(area, pixels_per_meter) for area in areas]
+    auto = [idx for idx, p in enumerate(patterns) if p == 'auto']
+    if auto:
+        chosen = fewest_lamps_patterns([shapes[i] for i in auto], beam_width[auto], beam_width_y[auto], start_offset)
+        for idx, pattern in zip(auto, chosen):
+            patterns[idx] = pattern
+    owners, xy = batch_lamp_positions(shapes, beam_width, beam_width_y, start_offset, patterns=patterns)
+    area_codes = np.array([codes[area.get('photometry', '')] for area in areas], dtype=np.int64)
+    spacing_x = beam_width * config.BEAM_OVERLAP_FACTOR
+    spacing_y = beam_width_y * config.BEAM_OVERLAP_FACTOR
+    return ProjectPlacement(owners, xy[:, 0], xy[:, 1], area_codes[owners] if n else area_codes, names, n,
+                            beam_width, beam_width_y, spacing_x, spacing_y, patterns)
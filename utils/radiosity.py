@@ -0,0 +1,268 @@
+import math
+from collections import OrderedDict
+import numpy as np
+
+import config
+from utils.geometry import as_shape
+from utils.photometry import intensity_at
+
+# Byte stimati per coppia durante il calcolo dei fattori di forma (array temporanei float64)
+_BYTES_PER_PAIR = 120
+
+
+class SparseRows:
+    """
+    Matrice sparsa per righe (formato CSR) con solo prodotto matrice-vettore
+
+    I fattori di forma tra superfici lontane sono trascurabili: si conservano
+    solo i valori sopra soglia (indptr, indici di colonna, valori).
+    """
+
+    def __init__(self, indptr, indices, data, n_cols):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = (indptr.size - 1, n_cols)
+        self._rows = np.repeat(np.arange(self.shape[0]), np.diff(indptr))
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes + self._rows.nbytes
+
+    def dot(self, x):
+        """Prodotto matrice-vettore"""
+        return np.bincount(self._rows, weights=self.data * x[self.indices], minlength=self.shape[0])
+
+
+def _form_factor_rows(sources, source_normals, targets, target_normals, target_areas, exclude_groups=None,
+                      threshold=None, memory_budget_mb=None):
+    """
+    Fattori di forma punto-patch F_ij = cosθi · cosθj · A_j / (π r²) in forma sparsa
+
+    Calcolati a blocchi di righe per restare entro il budget di memoria; ogni
+    riga è normalizzata a 1 se la somma lo supera (approssimazione dei baricentri
+    su patch vicine).
+
+    Args:
+        sources: (N, 3) punti emittenti / riceventi della riga
+        source_normals: (N, 3) normali
+        targets, target_normals: (M, 3) baricentri e normali delle patch
+        target_areas: (M,) aree delle patch
+        exclude_groups: coppia (gruppi righe, gruppi colonne): nessuno scambio nello stesso gruppo
+        threshold: fattori sotto soglia scartati (default config.RADIOSITY_FF_THRESHOLD)
+    """
+    threshold = config.RADIOSITY_FF_THRESHOLD if threshold is None else threshold
+    budget = (memory_budget_mb or config.ILLUMINANCE_MEMORY_MB) * 1024 * 1024
+    block = max(1, int(budget // (max(1, targets.shape[0]) * _BYTES_PER_PAIR)))
+    indptr = [np.zeros(1, dtype=np.int64)]
+    indices, data = [], []
+    offset = 0
+    for start in range(0, sources.shape[0], block):
+        stop = min(start + block, sources.shape[0])
+        v = targets[None, :, :] - sources[start:stop, None, :]
+        r2 = np.einsum('ijk,ijk->ij', v, v)
+        r2 = np.where(r2 > 0, r2, np.inf)
+        cos_i = np.einsum('ijk,ik->ij', v, source_normals[start:stop])
+        cos_j = -np.einsum('ijk,jk->ij', v, target_normals)
+        f = np.clip(cos_i, 0.0, None) * np.clip(cos_j, 0.0, None) / (np.pi * r2 * r2) * target_areas[None, :]
+        if exclude_groups is not None:
+            f[exclude_groups[0][start:stop, None] == exclude_groups[1][None, :]] = 0.0
+        totals = f.sum(axis=1)
+        f /= np.maximum(totals, 1.0)[:, None]
+        rows, cols = np.nonzero(f > threshold)
+        indices.append(cols)
+        data.append(f[rows, cols])
+        counts = np.bincount(rows, minlength=stop - start)
+        indptr.append(offset + np.cumsum(counts))
+        offset += rows.size
+    return SparseRows(np.concatenate(indptr), np.concatenate(indices) if indices else np.zeros(0, np.intp),
+                      np.concatenate(data) if data else np.zeros(0), targets.shape[0])
+
+
+class RoomModel:
+    """
+    Locale a pianta poligonale suddiviso in patch (pavimento, soffitto, pareti)
+
+    Contiene solo la geometria e i fattori di forma, che non dipendono dagli
+    apparecchi: lo stesso modello è riutilizzato quando cambiano le lampade.
+    """
+
+    def __init__(self, polygon, ceiling_height, patch_size=None):
+        self.shape = as_shape(polygon)
+        self.polygon = self.shape.outer
+        self.ceiling_height = float(ceiling_height)
+        # Le pareti seguono il contorno esterno; pavimento e soffitto escludono i fori
+        pts = np.asarray(self.polygon, dtype=np.float64)
+        x, y = pts[:, 0], pts[:, 1]
+        signed_area = 0.5 * (np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+        perimeter = float(np.hypot(*(np.roll(pts, -1, axis=0) - pts).T).sum())
+        surface = 2.0 * abs(signed_area) + perimeter * self.ceiling_height
+        # Patch non più piccole del necessario per restare entro RADIOSITY_MAX_PATCHES
+        self.patch_size = max(patch_size or config.RADIOSITY_PATCH_SIZE,
+                              math.sqrt(surface / config.RADIOSITY_MAX_PATCHES))
+
+        centers, normals, areas, kinds = [], [], [], []
+        # Pavimento e soffitto: celle quadrate con il centro dentro il poligono
+        nx = max(1, int(math.ceil(np.ptp(x) / self.patch_size)))
+        ny = max(1, int(math.ceil(np.ptp(y) / self.patch_size)))
+        xs = x.min() + (np.arange(nx) + 0.5) * np.ptp(x) / nx
+        ys = y.min() + (np.arange(ny) + 0.5) * np.ptp(y) / ny
+        gx, gy = np.meshgrid(xs, ys)
+        mask = self.shape.contains(np.column_stack([gx.ravel(), gy.ravel()])).reshape(ny, nx)
+        iy, ix = np.nonzero(mask)
+        cell = (np.ptp(x) / nx) * (np.ptp(y) / ny)
+        for z, nz in ((0.0, 1.0), (self.ceiling_height, -1.0)):
+            centers.append(np.column_stack([xs[ix], ys[iy], np.full(ix.size, z)]))
+            normals.append(np.tile([0.0, 0.0, nz], (ix.size, 1)))
+            areas.append(np.full(ix.size, cell))
+            kinds.append(np.full(ix.size, 0 if nz > 0 else 1))
+
+        # Pareti: ogni lato diviso in segmenti e fasce orizzontali, normale verso l'interno
+        orientation = 1.0 if signed_area > 0 else -1.0
+        rows = max(1, int(math.ceil(self.ceiling_height / self.patch_size)))
+        zs = (np.arange(rows) + 0.5) * self.ceiling_height / rows
+        for wall, (p1, p2) in enumerate(zip(pts, np.roll(pts, -1, axis=0))):
+            edge = p2 - p1
+            length = float(np.hypot(*edge))
+            if length == 0:
+                continue
+            segments = max(1, int(math.ceil(length / self.patch_size)))
+            t = (np.arange(segments) + 0.5) / segments
+            along = p1[None, :] + t[:, None] * edge[None, :]
+            sx, sz = np.meshgrid(np.arange(segments), np.arange(rows))
+            centers.append(np.column_stack([along[sx.ravel(), 0], along[sx.ravel(), 1], zs[sz.ravel()]]))
+            normal = orientation * np.array([-edge[1], edge[0], 0.0]) / length
+            normals.append(np.tile(normal, (sx.size, 1)))
+            areas.append(np.full(sx.size, length / segments * self.ceiling_height / rows))
+            kinds.append(np.full(sx.size, 2 + wall))
+
+        self.centers = np.concatenate(centers)
+        self.normals = np.concatenate(normals)
+        self.areas = np.concatenate(areas)
+        # 0 = pavimento, 1 = soffitto, 2+ = parete (una per lato)
+        self.kinds = np.concatenate(kinds)
+        self.form_factors = _form_factor_rows(self.centers, self.normals, self.centers, self.normals,
+                                              self.areas, (self.kinds, self.kinds))
+        self._grid_factors = OrderedDict()
+
+    @property
+    def n_patches(self):
+        return self.centers.shape[0]
+
+    def reflectances(self, reflectances=None):
+        """Fattore di riflessione di ogni patch da (soffitto, pareti, pavimento)"""
+        rho_c, rho_w, rho_f = reflectances or config.LUMEN_REFLECTANCES
+        return np.where(self.kinds == 0, rho_f, np.where(self.kinds == 1, rho_c, rho_w))
+
+    def grid_factors(self, points, plane_height):
+        """
+        Fattori di forma dai punti del piano di calcolo (orizzontali, rivolti in alto)
+        alle patch; memorizzati per griglia se rientrano in config.RADIOSITY_CACHE_MB
+        """
+        key = (hash(points.tobytes()), float(plane_height))
+        cached = self._grid_factors.get(key)
+        if cached is not None:
+            return cached
+        sources = np.column_stack([points, np.full(points.shape[0], plane_height)])
+        normals = np.tile([0.0, 0.0, 1.0], (points.shape[0], 1))
+        factors = _form_factor_rows(sources, normals, self.centers, self.normals, self.areas)
+        if factors.nbytes <= config.RADIOSITY_CACHE_MB * 1024 * 1024:
+            self._grid_factors[key] = factors
+            while len(self._grid_factors) > 4:
+                self._grid_factors.popitem(last=False)
+        return factors
+
+    def direct_on_patches(self, photometry, lamps, mounting_height, memory_budget_mb=None):
+        """
+        Illuminamento diretto (lux) sulle patch: E = I(C, γ) · cosθ / d²
+        con gli apparecchi orientati verso il basso alla quota mounting_height
+        """
+        lamps = np.asarray(lamps, dtype=np.float64).reshape(-1, 2)
+        budget = (memory_budget_mb or config.ILLUMINANCE_MEMORY_MB) * 1024 * 1024
+        chunk = max(1, int(budget // (self.n_patches * _BYTES_PER_PAIR)))
+        E = np.zeros(self.n_patches)
+        for l0 in range(0, lamps.shape[0], chunk):
+            block = lamps[l0:l0 + chunk]
+            vx = self.centers[None, :, 0] - block[:, None, 0]
+            vy = self.centers[None, :, 1] - block[:, None, 1]
+            vz = self.centers[None, :, 2] - mounting_height
+            d2 = vx * vx + vy * vy + vz * vz
+            d = np.sqrt(d2)
+            gamma = np.degrees(np.arctan2(np.hypot(vx, vy), -vz))
+            c = np.degrees(np.arctan2(vy, vx))
+            cos_surface = -(vx * self.normals[None, :, 0] + vy * self.normals[None, :, 1]
+                            + vz * self.normals[None, :, 2]) / np.where(d > 0, d, np.inf)
+            intensity = intensity_at(photometry, c, gamma)
+            E += (intensity * np.clip(cos_surface, 0.0, None) / np.where(d2 > 0, d2, np.inf)).sum(axis=0)
+        return E
+
+    def solve(self, direct, reflectances=None, tolerance=None, max_iterations=None):
+        """
+        Radiosità: M = ρ · (E_diretto + F · M), risolta per iterazione (Jacobi)
+
+        Args:
+            direct: illuminamento diretto sulle patch (lux)
+            reflectances: (soffitto, pareti, pavimento) (default config.LUMEN_REFLECTANCES)
+            tolerance: variazione relativa massima per la convergenza (default config.RADIOSITY_TOLERANCE)
+            max_iterations: limite iterazioni (default config.RADIOSITY_MAX_ITERATIONS)
+
+        Returns:
+            (exitanza delle patch in lm/m², iterazioni eseguite)
+        """
+        tolerance = tolerance or config.RADIOSITY_TOLERANCE
+        max_iterations = max_iterations or config.RADIOSITY_MAX_ITERATIONS
+        rho = self.reflectances(reflectances)
+        emitted = rho * direct
+        M = emitted.copy()
+        for iteration in range(1, max_iterations + 1):
+            updated = emitted + rho * self.form_factors.dot(M)
+            change = np.abs(updated - M).max() if M.size else 0.0
+            M = updated
+            if change <= tolerance * max(float(M.max()) if M.size else 0.0, 1e-12):
+                break
+        return M, iteration
+
+
+_models = OrderedDict()
+
+
+def get_room_model(polygon, ceiling_height, patch_size=None):
+    """Modello del locale con fattori di forma, riutilizzato per la stessa geometria"""
+    shape = as_shape(polygon)
+    key = (shape.key, float(ceiling_height), patch_size)
+    model = _models.get(key)
+    if model is None:
+        model = RoomModel(shape, ceiling_height, patch_size)
+        _models[key] = model
+        while len(_models) > config.RADIOSITY_CACHE_ROOMS:
+            _models.popitem(last=False)
+    else:
+        _models.move_to_end(key)
+    return model
+
+
+def indirect_illuminance(photometry, lamp_positions, polygon, points, mounting_height, calc_plane_height,
+                         ceiling_height=None, reflectances=None, maintenance_factor=1.0, tolerance=None):
+    """
+    Componente indiretta (interriflessioni) dell'illuminamento sui punti di calcolo
+
+    Args:
+        photometry: dict fotometria con matrice intensità
+        lamp_positions: lista di [(x, y), ...] in m
+        polygon: poligono area in m o AreaShape
+        points: array (P, 2) punti del piano di calcolo in m
+        mounting_height: altezza montaggio (m)
+        calc_plane_height: altezza piano di calcolo (m)
+        ceiling_height: altezza soffitto (default: altezza montaggio)
+        reflectances: (soffitto, pareti, pavimento) (default config.LUMEN_REFLECTANCES)
+        maintenance_factor: fattore di manutenzione applicato al risultato
+        tolerance: tolleranza di convergenza della radiosità
+
+    Returns:
+        array (P,) di illuminamenti indiretti in lux
+    """
+    model = get_room_model(polygon, ceiling_height or mounting_height)
+    direct = maintenance_factor * model.direct_on_patches(photometry, lamp_positions, mounting_height)
+    exitance, _ = model.solve(direct, reflectances, tolerance)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return model.grid_factors(points, calc_plane_height).dot(exitance)
@@ -25,6 +25,7 @@ class ReportGenerator:
                 'beam_width': 'Larghezza Fascio (m)',
                 'mounting_height': 'Altezza Montaggio (m)',
                 'lamps_required': 'Lampade Necessarie',
+                'lamps_lumen': 'N metodo del flusso',
                 'spacing_x': 'Passo X (m)',
                 'spacing_y': 'Passo Y (m)',
                 'estimated_illuminance': 'Illuminamento Est. (lux)',
@@ -47,6 +48,7 @@ class ReportGenerator:
                 'beam_width': 'Beam Width (m)',
                 'mounting_height': 'Mounting Height (m)',
                 'lamps_required': 'Lamps Required',
+                'lamps_lumen': 'N lumen method',
                 'spacing_x': 'Spacing X (m)',
                 'spacing_y': 'Spacing Y (m)',
                 'estimated_illuminance': 'Est. Illuminance (lux)',
@@ -144,8 +146,11 @@ class ReportGenerator:
                 (self.t['spacing_y'], f"{area.get('spacing_y', 0):.2f} m"),
                 (self.t['mounting_height'], f"{area.get('height', 0):.2f} m"),
                 (self.t['uniformity'], f"{area.get('uniformity', 0):.1f}%"),
+                (self.t['estimated_illuminance'], f"{area['illuminance']:.0f}" if area.get('illuminance') is not None else 'N/A'),
                 (self.t['photometry'], area.get('photometry_name', 'N/A')),
             ]
+            if area.get('lamps_lumen') is not None:
+                details.insert(2, (self.t['lamps_lumen'], str(area['lamps_lumen'])))
             
             for label, value in details:
                 pdf.cell(80, 5, f"{label}:", border=0)
@@ -0,0 +1,323 @@
+import math
+import numpy as np
+
+import config
+
+try:
+    import cv2
+    HAS_CV2 = True
+except Exception:
+    # Catch broad exceptions (ImportError, OSError due to missing libGL, etc.)
+    HAS_CV2 = False
+
+
+def _gray(image):
+    """Luminanza (media dei canali RGB) come float32"""
+    if image.ndim == 2:
+        return image.astype(np.float32)
+    return image[..., :3].mean(axis=-1, dtype=np.float32)
+
+
+def otsu_threshold(gray):
+    """Soglia di Otsu sull'istogramma a 256 livelli (muro: luminanza <= soglia)"""
+    hist = np.bincount(np.clip(gray, 0, 255).astype(np.uint8).ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight = np.cumsum(hist)
+    mean = np.cumsum(hist * levels)
+    total = weight[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = np.nan_to_num((mean[-1] * weight - mean * total) ** 2 / (weight * (total - weight)))
+    # Centro dell'intervallo di massimo (disegni puliti: tutte le soglie tra nero e bianco si equivalgono)
+    best = np.flatnonzero(between >= between.max() * (1 - 1e-9))
+    return float(best[0] + best[-1]) / 2.0
+
+
+def _shift_max(mask, size, axis, fill):
+    """Massimo (o minimo, con fill=True) su una finestra di size pixel centrata, lungo un asse"""
+    half = size // 2
+    pad = [(0, 0), (0, 0)]
+    pad[axis] = (half, half)
+    padded = np.pad(mask, pad, constant_values=fill)
+    out = padded.take(range(0, mask.shape[axis]), axis=axis).copy()
+    for k in range(1, size):
+        window = padded.take(range(k, k + mask.shape[axis]), axis=axis)
+        if fill:
+            out &= window
+        else:
+            out |= window
+    return out
+
+
+def close_gaps(walls, size):
+    """
+    Chiusura morfologica (dilatazione + erosione, elemento quadrato) dei muri
+
+    Chiude le aperture più strette di size pixel (porte) senza ispessire i muri.
+    """
+    size = 2 * (size // 2) + 1
+    if size <= 1:
+        return walls
+    if HAS_CV2:
+        kernel = np.ones((size, size), np.uint8)
+        return cv2.morphologyEx(walls.astype(np.uint8), cv2.MORPH_CLOSE, kernel).astype(bool)
+    dilated = _shift_max(_shift_max(walls, size, 0, False), size, 1, False)
+    return _shift_max(_shift_max(dilated, size, 0, True), size, 1, True)
+
+
+def label_components(mask):
+    """
+    Componenti connesse (4-connessione) di una maschera
+
+    Returns:
+        (etichette int32 con 0 = sfondo, numero di etichette incluso lo sfondo)
+    """
+    if HAS_CV2:
+        count, labels = cv2.connectedComponents(mask.astype(np.uint8), connectivity=4)
+        return labels.astype(np.int32), count
+    # Fallback NumPy: tratti orizzontali uniti tra righe adiacenti con union-find
+    h, w = mask.shape
+    padded = np.zeros((h, w + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    change = np.diff(padded, axis=1)
+    row_s, col_s = np.nonzero(change == 1)
+    row_e, col_e = np.nonzero(change == -1)
+    runs = len(row_s)
+    parent = np.arange(runs)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    row_start = np.searchsorted(row_s, np.arange(h + 1))
+    for y in range(1, h):
+        a0, a1 = row_start[y - 1], row_start[y]
+        b0, b1 = row_start[y], row_start[y + 1]
+        i, j = a0, b0
+        while i < a1 and j < b1:
+            # Tratti [s, e) sovrapposti in colonne tra le due righe
+            if col_s[i] < col_e[j] and col_s[j] < col_e[i]:
+                ri, rj = find(i), find(j)
+                if ri != rj:
+                    parent[max(ri, rj)] = min(ri, rj)
+            if col_e[i] < col_e[j]:
+                i += 1
+            else:
+                j += 1
+    roots = np.array([find(i) for i in range(runs)], dtype=np.int64)
+    _, run_label = np.unique(roots, return_inverse=True)
+    labels = np.zeros((h, w), dtype=np.int32)
+    lengths = col_e - col_s
+    run = np.repeat(np.arange(runs), lengths)
+    cols = col_s[run] + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    labels[row_s[run], cols] = run_label[run] + 1
+    return labels, int(run_label.max()) + 2 if runs else 1
+
+
+def _trace_outline(mask):
+    """
+    Contorno esterno (centri dei pixel di bordo) di una componente con il
+    tracciamento di Moore, in senso orario
+    """
+    padded = np.pad(mask, 1)
+    ys, xs = np.nonzero(padded)
+    start = (ys[0], xs[0])                              # primo pixel in ordine di riga: a ovest c'è sfondo
+    steps = [(0, -1), (-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1)]
+    outline = [start]
+    current, back, first = start, 0, None
+    for _ in range(4 * padded.size):
+        for turn in range(1, 9):
+            k = (back + turn) % 8
+            candidate = (current[0] + steps[k][0], current[1] + steps[k][1])
+            if padded[candidate]:
+                break
+        else:
+            break                                        # pixel isolato
+        # Il vicino esaminato prima (sfondo) è il nuovo punto di ripartenza, visto dal candidato
+        prev = steps[(k - 1) % 8]
+        back = steps.index((prev[0] - steps[k][0], prev[1] - steps[k][1]))
+        current = candidate
+        # Criterio di Jacob: stop quando si ripete il primo passo
+        if first is None:
+            first = (current, back)
+        elif (current, back) == first:
+            outline.pop()
+            break
+        outline.append(current)
+    return np.array([(x - 1, y - 1) for y, x in outline], dtype=np.float64)
+
+
+def simplify_polygon(points, epsilon):
+    """Semplificazione di Douglas-Peucker di un contorno chiuso (tolleranza in pixel)"""
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) < 4:
+        return points
+    if HAS_CV2:
+        approx = cv2.approxPolyDP(points.astype(np.float32).reshape(-1, 1, 2), epsilon, True)
+        return approx.reshape(-1, 2).astype(np.float64)
+    # Chiuso: si divide nel punto più lontano dal primo e si semplificano le due metà
+    far = int(np.argmax(np.hypot(*(points - points[0]).T)))
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, far]] = True
+    closed = np.vstack([points, points[:1]])
+    stack = [(0, far), (far, len(points))]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        a, b = closed[i], closed[j]
+        d = b - a
+        norm = math.hypot(*d)
+        seg = closed[i + 1:j] - a
+        dist = np.abs(d[0] * seg[:, 1] - d[1] * seg[:, 0]) / norm if norm > 0 else np.hypot(*seg.T)
+        k = int(np.argmax(dist))
+        if dist[k] > epsilon:
+            keep[i + 1 + k] = True
+            stack += [(i, i + 1 + k), (i + 1 + k, j)]
+    return points[keep]
+
+
+def _outline(mask, epsilon):
+    """Poligono semplificato del contorno esterno di una componente"""
+    if HAS_CV2:
+        contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+        contour = max(contours, key=len).reshape(-1, 2).astype(np.float64)
+    else:
+        contour = _trace_outline(mask)
+    return simplify_polygon(contour, epsilon)
+
+
+def refine_polygon(polygon, image, threshold, radius, palette=None):
+    """
+    Sposta ogni lato sul filo interno del muro, alla risoluzione piena
+
+    Per ogni lato si campiona una striscia di ±radius pixel lungo la normale
+    nell'immagine originale (solo quei pixel): il lato va sull'ultimo pixel
+    libero prima del muro. I vertici sono le intersezioni dei lati spostati.
+
+    Args:
+        polygon: vertici (N, 2) in pixel dell'originale
+        image: immagine originale (H, W) o (H, W, C)
+        threshold: soglia muro/libero (luminanza)
+        radius: ampiezza della ricerca in pixel
+        palette: tabella colori (256, 3) se image contiene indici di palette
+
+    Returns:
+        vertici (N, 2) rifiniti
+    """
+    polygon = np.asarray(polygon, dtype=np.float64)
+    n = len(polygon)
+    if n < 3:
+        return polygon
+    h, w = image.shape[:2]
+    nxt = np.roll(polygon, -1, axis=0)
+    direction = nxt - polygon
+    length = np.hypot(direction[:, 0], direction[:, 1])
+    direction = direction / np.maximum(length, 1e-9)[:, None]
+    # Normale uscente (verso il muro): dipende dal verso di percorrenza
+    x, y = polygon[:, 0], polygon[:, 1]
+    orientation = 1.0 if np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y) > 0 else -1.0
+    normal = orientation * np.column_stack([direction[:, 1], -direction[:, 0]])
+
+    steps = np.arange(-radius, radius + 1)
+    shift = np.zeros(n)
+    for i in range(n):
+        # Spostamenti allineati ai centri dei pixel lungo la normale
+        along = float(np.dot(polygon[i], normal[i]))
+        offsets = steps - (along - math.floor(along))
+        samples = int(np.clip(length[i] / max(radius, 1), 3, 32))
+        t = np.linspace(0.15, 0.85, samples)
+        base = polygon[i] + t[:, None] * (nxt[i] - polygon[i])
+        pts = base[None, :, :] + offsets[:, None, None] * normal[i]
+        px = np.clip(np.round(pts[..., 0]).astype(np.int64), 0, w - 1)
+        py = np.clip(np.round(pts[..., 1]).astype(np.int64), 0, h - 1)
+        values = image[py, px] if palette is None else palette[image[py, px]]
+        wall = (_gray(values) <= threshold).mean(axis=1) >= 0.5
+        # Passaggio libero → muro procedendo verso l'esterno
+        edges = np.flatnonzero(~wall[:-1] & wall[1:])
+        if len(edges):
+            shift[i] = offsets[edges[np.argmin(np.abs(offsets[edges]))]]
+
+    lines = polygon + normal * shift[:, None]
+    refined = polygon.copy()
+    for i in range(n):
+        j = i - 1
+        cross = direction[j, 0] * direction[i, 1] - direction[j, 1] * direction[i, 0]
+        if abs(cross) > 1e-6:
+            # Intersezione della retta del lato precedente con quella del lato i
+            delta = lines[i] - lines[j]
+            s = (delta[0] * direction[i, 1] - delta[1] * direction[i, 0]) / cross
+            candidate = lines[j] + s * direction[j]
+            if np.hypot(*(candidate - polygon[i])) <= 2 * radius + 1:
+                refined[i] = candidate
+                continue
+        refined[i] = polygon[i] + 0.5 * (normal[j] * shift[j] + normal[i] * shift[i])
+    return refined
+
+
+def detect_rooms(processor, pixels_per_meter=None, door_width_m=None, min_area_m2=None):
+    """
+    Locali rilevati automaticamente su una planimetria raster
+
+    La segmentazione lavora su un livello ridotto della piramide: binarizzazione
+    (Otsu), chiusura delle porte, componenti connesse dello spazio libero e
+    contorni semplificati. I lati sono poi rifiniti sull'originale campionando
+    solo una striscia attorno a ciascuno.
+
+    Args:
+        processor: BlueprintProcessor con la piramide già costruita
+        pixels_per_meter: scala dell'originale (px/m); senza scala si usano
+            frazioni della dimensione dell'immagine
+        door_width_m: apertura massima da chiudere (default config.ROOM_DOOR_WIDTH_M)
+        min_area_m2: superficie minima di un locale (default config.ROOM_MIN_AREA_M2)
+
+    Returns:
+        lista di dict con 'points' (vertici in pixel dell'originale) e 'area_px'
+        ordinata per superficie decrescente
+    """
+    door_width_m = door_width_m or config.ROOM_DOOR_WIDTH_M
+    min_area_m2 = min_area_m2 or config.ROOM_MIN_AREA_M2
+    full_h, full_w = processor.original_image.shape[:2]
+    level = 0
+    while level + 1 < len(processor.levels) and max(processor.levels[level].shape[:2]) > config.ROOM_DETECT_MAX_SIDE:
+        level += 1
+    factor = 2 ** level
+    gray = _gray(processor.level_image(level))
+    threshold = otsu_threshold(gray)
+    walls = gray <= threshold
+
+    if pixels_per_meter:
+        gap = int(math.ceil(door_width_m * pixels_per_meter / factor))
+        min_area = min_area_m2 * pixels_per_meter ** 2
+    else:
+        gap = int(math.ceil(max(gray.shape) * config.ROOM_DOOR_GAP_FRACTION))
+        min_area = full_h * full_w * config.ROOM_MIN_AREA_FRACTION
+    labels, count = label_components(~close_gaps(walls, gap))
+
+    # Superficie di ogni componente; quelle che toccano il bordo sono l'esterno
+    flat = labels.ravel()
+    area = np.bincount(flat, minlength=count) * factor * factor
+    border = np.zeros(count, dtype=bool)
+    border[np.concatenate([labels[0], labels[-1], labels[:, 0], labels[:, -1]])] = True
+    order = np.argsort(flat, kind='stable')
+    first = np.r_[0, np.cumsum(np.bincount(flat, minlength=count))]
+
+    rooms = []
+    for label in range(1, count):
+        if border[label] or area[label] < min_area:
+            continue
+        ys, xs = np.divmod(order[first[label]:first[label + 1]], labels.shape[1])
+        x0, y0 = xs.min(), ys.min()
+        crop = labels[y0:ys.max() + 1, x0:xs.max() + 1] == label
+        polygon = _outline(crop, config.ROOM_SIMPLIFY_PX)
+        if len(polygon) < 3:
+            continue
+        # Centro del pixel del livello nelle coordinate dell'originale, poi rifinitura dei lati
+        polygon = (polygon + [x0, y0]) * factor + (factor - 1) / 2.0
+        polygon = refine_polygon(polygon, processor.original_image, threshold, factor + 1, processor.palette)
+        polygon[:, 0] = polygon[:, 0].clip(0, full_w - 1)
+        polygon[:, 1] = polygon[:, 1].clip(0, full_h - 1)
+        rooms.append({'points': [tuple(p) for p in polygon.tolist()], 'area_px': float(area[label])})
+    rooms.sort(key=lambda r: -r['area_px'])
+    return rooms